@@ -1,24 +1,102 @@
-"""API module initialization"""
-from . import (
-    deployment,
-    qr_generator,
-    data_packages,
-    routes,
-    sdr,
-    file_converter,
-    server_status,
-    poi_tracker,
-    notepad
-)
-
-__all__ = [
-    "deployment",
-    "qr_generator", 
-    "data_packages",
-    "routes",
-    "sdr",
-    "file_converter",
-    "server_status",
-    "poi_tracker",
-    "notepad"
-]
+"""
+API module initialization
+
+Routers are registered by name from ``ROUTERS``. Only the names listed in
+API_FEATURES are mounted, and with LAZY_ROUTERS each one is imported on the
+first request under its prefix instead of at startup.
+"""
+import importlib
+import time
+from typing import Dict, Iterable, Tuple
+
+from fastapi import FastAPI
+from starlette.routing import BaseRoute, Match, NoMatchFound
+from starlette.types import Receive, Scope, Send
+
+# name -> (prefix, OpenAPI tag)
+ROUTERS: Dict[str, Tuple[str, str]] = {
+    "deployment": ("/api/deployment", "Deployment"),
+    "qr_generator": ("/api/qr", "QR Generator"),
+    "data_packages": ("/api/packages", "Data Packages"),
+    "routes": ("/api/routes", "Routes"),
+    "sdr": ("/api/sdr", "SDR"),
+    "file_converter": ("/api/convert", "File Converter"),
+    "server_status": ("/api/status", "Server Status"),
+    "poi_tracker": ("/api/poi", "POI Tracker"),
+    "notepad": ("/api/notes", "Notepad"),
+    "geofence": ("/api/geofence", "Geofence"),
+    "tiles": ("/api/tiles", "Map Tiles"),
+    "certificates": ("/api/certs", "Certificates"),
+}
+
+__all__ = list(ROUTERS)
+
+def include(app: FastAPI, name: str):
+    prefix, tag = ROUTERS[name]
+    module = importlib.import_module(f"{__name__}.{name}")
+    app.include_router(module.router, prefix=prefix, tags=[tag])
+
+class LazyRouter(BaseRoute):
+    """
+    Placeholder claiming a router's prefix. The first request under it imports
+    the router module and swaps the real routes in at the placeholder's place.
+    """
+    def __init__(self, app: FastAPI, name: str):
+        self.app = app
+        self.name = name
+        self.prefix = ROUTERS[name][0]
+        self.loaded = False
+
+    def matches(self, scope: Scope):
+        if scope["type"] in ("http", "websocket"):
+            path = scope["path"]
+            if path == self.prefix or path.startswith(self.prefix + "/"):
+                return Match.FULL, {}
+        return Match.NONE, {}
+
+    def url_path_for(self, name: str, /, **path_params):
+        raise NoMatchFound(name, path_params)
+
+    def load(self):
+        # Synchronous, so concurrent first requests cannot load a router twice
+        if self.loaded:
+            return
+        self.loaded = True
+        started = time.perf_counter()
+        routes = self.app.router.routes
+        count = len(routes)
+        include(self.app, self.name)
+        added = routes[count:]
+        del routes[count:]
+        index = routes.index(self)
+        routes[index:index + 1] = added
+        print(f"Routers: loaded {self.name} in {(time.perf_counter() - started) * 1000:.0f} ms")
+
+    async def handle(self, scope: Scope, receive: Receive, send: Send):
+        self.load()
+        await self.app.router(scope, receive, send)
+
+def include_routers(app: FastAPI, names: Iterable[str], lazy: bool = False):
+    """Mount the named routers, eagerly or behind LazyRouter placeholders"""
+    names = list(names)
+    unknown = sorted(set(names) - set(ROUTERS))
+    if unknown:
+        raise ValueError(f"Unknown API features: {', '.join(unknown)} (available: {', '.join(ROUTERS)})")
+
+    for name in names:
+        if lazy:
+            app.router.routes.append(LazyRouter(app, name))
+        else:
+            include(app, name)
+
+    if lazy:
+        openapi = app.openapi
+
+        def openapi_with_lazy_routers():
+            # The schema must describe every enabled router, loaded or not
+            for route in list(app.router.routes):
+                if isinstance(route, LazyRouter):
+                    route.load()
+            return openapi()
+
+        app.openapi = openapi_with_lazy_routers
@@ -0,0 +1,76 @@
+"""
+Client certificate API endpoints
+"""
+import asyncio
+import re
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import Response
+from pydantic import BaseModel, Field
+from typing import List, Optional
+
+from app.api import ROUTERS
+from app.core.config import settings
+from app.services.cert_service import (
+    EnrollmentLimitError, certificate_authority, claim_enrollment, issue, key_pool, list_issued
+)
+
+router = APIRouter()
+
+class CertificateRequest(BaseModel):
+    common_names: List[str] = Field(..., min_length=1, max_length=1000)
+    validity_days: Optional[int] = Field(None, ge=1, le=3650)
+    include_private_key: bool = False  # Also return the PEM key; prefer the one-time enrollment download
+
+def enrollment_url(request: Request, token: str) -> str:
+    # Built from the prefix rather than url_for so other routers can use it
+    return f"{str(request.base_url).rstrip('/')}{ROUTERS['certificates'][0]}/enroll/{token}"
+
+@router.get("/ca")
+async def get_ca_certificate():
+    """
+    Local CA certificate (PEM), for client and server truststores
+    """
+    pem = await asyncio.to_thread(certificate_authority.pem)
+    return Response(content=pem, media_type="application/x-pem-file",
+                    headers={"Content-Disposition": 'attachment; filename="ca.pem"'})
+
+@router.post("/issue")
+async def issue_certificates(body: CertificateRequest, request: Request):
+    """
+    Issue client certificates from the pre-generated key pool
+    """
+    try:
+        issued = await issue(body.common_names, body.validity_days or settings.CERT_VALIDITY_DAYS,
+                             include_private_key=body.include_private_key)
+    except EnrollmentLimitError as e:
+        raise HTTPException(status_code=429, detail=str(e))
+    for record in issued:
+        record["enrollment_url"] = enrollment_url(request, record["enrollment_token"])
+    return {"count": len(issued), "certificates": issued}
+
+@router.get("/enroll/{token}")
+async def download_enrollment(token: str):
+    """
+    One-time PKCS#12 download (client key, certificate and CA) for an
+    enrollment token
+    """
+    bundle = await asyncio.to_thread(claim_enrollment, token)
+    if bundle is None:
+        raise HTTPException(status_code=404, detail="Unknown or already used enrollment token")
+    filename = re.sub(r"[^A-Za-z0-9._-]", "_", bundle["common_name"])
+    return Response(content=bundle["p12"], media_type="application/x-pkcs12",
+                    headers={"Content-Disposition": f'attachment; filename="{filename}.p12"'})
+
+@router.get("/issued")
+async def list_issued_certificates():
+    """
+    Certificates issued by the local CA
+    """
+    return await asyncio.to_thread(list_issued)
+
+@router.get("/pool")
+async def get_key_pool():
+    """
+    Pre-generated key pool size and refill counters
+    """
+    return key_pool.stats()
@@ -1,40 +1,59 @@
 """
 Data Package Builder API endpoints
 """
-from fastapi import APIRouter, UploadFile, File, HTTPException
-from pydantic import BaseModel
+from fastapi import APIRouter, UploadFile, File, HTTPException, Request, Header, Response
+from pydantic import BaseModel, Field
+from starlette.requests import ClientDisconnect
 from typing import List, Optional
+import asyncio
 import zipfile
 import os
 import json
 import uuid
 from datetime import datetime
+from urllib.parse import quote
+
+from app.api import ROUTERS
+from app.api.tiles import TileArea, resolve_area
+from app.core.downloads import file_download
+from app.core.responses import DefaultJSONResponse
+from app.services.tile_cache_service import tile_cache
+from app.services.upload_service import UploadError, upload_manager
 
 router = APIRouter()
 
+PACKAGES_DIR = "data/packages"
+UPLOADS_DIR = "data/uploads"
+
+def download_url(endpoint: str, relative_path: str) -> str:
+    """URL of a file for the /download (packages) or /uploads endpoint"""
+    return f"{ROUTERS['data_packages'][0]}/{endpoint}/{quote(relative_path)}"
+
 class DataPackageRequest(BaseModel):
     name: str
     description: Optional[str] = ""
     files: List[str]  # List of file paths
     metadata: Optional[dict] = {}
+    tiles: Optional[TileArea] = None  # Bundle cached map tiles covering a route, SDR or bbox
+
+class ResumableUploadRequest(BaseModel):
+    filename: str
+    size: int = Field(..., ge=0)
+    sha256: Optional[str] = Field(None, pattern="^[0-9a-fA-F]{64}$")  # Or given on completion
+    metadata: Optional[dict] = {}
+
+class CompleteUploadRequest(BaseModel):
+    sha256: Optional[str] = Field(None, pattern="^[0-9a-fA-F]{64}$")
 
 class DataPackageResponse(BaseModel):
     id: str
     name: str
     file_path: str
+    download_url: str
     created_at: str
 
-@router.post("/create", response_model=DataPackageResponse)
-async def create_data_package(package: DataPackageRequest):
-    """
-    Create a data package (ZIP file) containing specified files
-    """
-    package_id = f"pkg_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
-    package_dir = f"data/packages/{package_id}"
-    os.makedirs(package_dir, exist_ok=True)
-    
-    zip_path = f"{package_dir}/{package.name}.zip"
-    
+def write_package(zip_path: str, package: DataPackageRequest, tile_selection: Optional[dict]):
+    """Write the package ZIP; blocking file and tile cache I/O, run in a worker thread"""
     with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
         # Add metadata
         metadata = {
@@ -43,17 +62,61 @@ async def create_data_package(package: DataPackageRequest):
             "created_at": datetime.now().isoformat(),
             **package.metadata
         }
+        if tile_selection:
+            metadata["tiles"] = tile_selection
         zipf.writestr("manifest.json", json.dumps(metadata, indent=2))
         
         # Add files (in production, would copy actual files)
         for file_path in package.files:
             # Placeholder: would add actual files here
             zipf.writestr(f"data/{os.path.basename(file_path)}", f"Content of {file_path}")
+        
+        if tile_selection:
+            # Stream tiles from the MBTiles store; they are already compressed images
+            bbox = tile_selection["bbox"]
+            written = 0
+            for z, x, y, data in tile_cache.iter_tiles(
+                bbox, package.tiles.min_zoom, package.tiles.max_zoom
+            ):
+                zipf.writestr(f"tiles/{z}/{x}/{y}.{tile_cache.format}", data, zipfile.ZIP_STORED)
+                written += 1
+            zipf.writestr("tiles/metadata.json", json.dumps({
+                "scheme": "xyz",
+                "bounds": [bbox[1], bbox[0], bbox[3], bbox[2]],
+                "minzoom": package.tiles.min_zoom,
+                "maxzoom": package.tiles.max_zoom,
+                "format": tile_cache.format,
+                "tile_count": written,
+                "missing": tile_selection["requested"] - written
+            }, indent=2))
+
+@router.post("/create", response_model=DataPackageResponse)
+async def create_data_package(package: DataPackageRequest):
+    """
+    Create a data package (ZIP file) containing specified files
+    """
+    package_id = f"pkg_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+    package_dir = f"data/packages/{package_id}"
+    zip_path = f"{package_dir}/{package.name}.zip"
+    tile_selection = None
+    if package.tiles:
+        bbox, requested = await asyncio.to_thread(resolve_area, package.tiles)
+        tile_selection = {
+            "bbox": list(bbox),
+            "min_zoom": package.tiles.min_zoom,
+            "max_zoom": package.tiles.max_zoom,
+            "format": tile_cache.format,
+            "requested": requested
+        }
+    
+    os.makedirs(package_dir, exist_ok=True)
+    await asyncio.to_thread(write_package, zip_path, package, tile_selection)
     
     return DataPackageResponse(
         id=package_id,
         name=package.name,
         file_path=zip_path,
+        download_url=download_url("download", f"{package_id}/{package.name}.zip"),
         created_at=datetime.now().isoformat()
     )
 
@@ -76,6 +139,7 @@ async def upload_package_file(file: UploadFile = File(...)):
     return {
         "filename": file.filename,
         "path": file_path,
+        "download_url": download_url("uploads", safe_name),
         "size": len(content)
     }
 
@@ -96,7 +160,110 @@ async def list_data_packages():
                         packages.append({
                             "id": pkg_id,
                             "name": file,
-                            "path": os.path.join(pkg_path, file)
+                            "path": os.path.join(pkg_path, file),
+                            "size": os.path.getsize(os.path.join(pkg_path, file)),
+                            "download_url": download_url("download", f"{pkg_id}/{file}")
                         })
     
     return packages
+
+@router.get("/download/{file_path:path}")
+@router.head("/download/{file_path:path}")
+async def download_package(file_path: str, request: Request):
+    """
+    Download a data package (or any file under data/packages). Supports
+    Range / If-Range, so interrupted downloads resume where they stopped.
+    """
+    return await file_download(request, PACKAGES_DIR, file_path)
+
+@router.get("/uploads/{file_path:path}")
+@router.head("/uploads/{file_path:path}")
+async def download_upload(file_path: str, request: Request):
+    """
+    Download an uploaded file, with Range / If-Range support
+    """
+    return await file_download(request, UPLOADS_DIR, file_path)
+
+def upload_headers(upload) -> dict:
+    return {"Upload-Offset": str(upload.offset), "Upload-Length": str(upload.size), "Cache-Control": "no-store"}
+
+@router.post("/resumable", status_code=201)
+async def create_resumable_upload(body: ResumableUploadRequest, response: Response):
+    """
+    Start a resumable upload; send its bytes with PATCH to the returned URL
+    """
+    try:
+        upload = upload_manager.create(body.filename, body.size, body.sha256, body.metadata)
+    except UploadError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+    upload_url = f"{ROUTERS['data_packages'][0]}/resumable/{upload.id}"
+    response.headers.update({"Location": upload_url, **upload_headers(upload)})
+    return {**upload.to_dict(), "upload_url": upload_url}
+
+@router.get("/resumable")
+async def list_resumable_uploads():
+    """
+    Unfinished resumable uploads
+    """
+    return upload_manager.list()
+
+@router.get("/resumable/{upload_id}")
+@router.head("/resumable/{upload_id}")
+async def get_resumable_upload(upload_id: str, request: Request):
+    """
+    Current offset of an upload (Upload-Offset header; HEAD for headers only)
+    """
+    try:
+        upload = upload_manager.get(upload_id)
+    except UploadError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+    if request.method == "HEAD":
+        return Response(headers=upload_headers(upload))
+    return DefaultJSONResponse(upload.to_dict(), headers=upload_headers(upload))
+
+@router.patch("/resumable/{upload_id}", status_code=204)
+async def patch_resumable_upload(
+    upload_id: str,
+    request: Request,
+    upload_offset: int = Header(..., ge=0),
+    upload_checksum: Optional[str] = Header(None),
+    content_type: Optional[str] = Header(None)
+):
+    """
+    Append the request body (application/offset+octet-stream) at
+    Upload-Offset, which must equal the current offset. An optional
+    Upload-Checksum: sha256 <base64> verifies this chunk.
+    """
+    if content_type != "application/offset+octet-stream":
+        raise HTTPException(status_code=415, detail="Content-Type must be application/offset+octet-stream")
+    try:
+        offset = await upload_manager.append(upload_id, upload_offset, request.stream(), upload_checksum)
+    except UploadError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+    except ClientDisconnect:
+        # Bytes received so far are kept; the client resumes from HEAD
+        return Response(status_code=400)
+    return Response(status_code=204, headers={"Upload-Offset": str(offset), "Cache-Control": "no-store"})
+
+@router.post("/resumable/{upload_id}/complete")
+async def complete_resumable_upload(upload_id: str, body: Optional[CompleteUploadRequest] = None):
+    """
+    Verify the SHA-256 of a fully received upload and move it into
+    data/uploads, where it can be added to data packages
+    """
+    try:
+        result = await upload_manager.complete(upload_id, body.sha256 if body else None)
+    except UploadError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+    return {**result, "download_url": download_url("uploads", os.path.basename(result["path"]))}
+
+@router.delete("/resumable/{upload_id}", status_code=204)
+async def delete_resumable_upload(upload_id: str):
+    """
+    Abandon an upload and remove its partial file
+    """
+    try:
+        upload_manager.delete(upload_id)
+    except UploadError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+    return Response(status_code=204)
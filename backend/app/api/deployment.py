@@ -2,15 +2,18 @@
 Deployment API endpoints
 """
 from fastapi import APIRouter, HTTPException, BackgroundTasks, Depends
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from typing import Optional, List
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
+import asyncio
 import json
 
+from app.core.config import settings
 from app.core.database import get_db
 from app.models.models import Deployment
-from app.services.deployment_service import DeploymentService
+from app.services.deployment_service import DeploymentService, deployment_timings, fleet_progress
+from app.services.deployment_steps import StepCache
 
 router = APIRouter()
 
@@ -24,6 +27,14 @@ class DeploymentConfig(BaseModel):
     enable_zerotier: bool = False
     enable_traefik: bool = True
     enable_mediamtx: bool = False
+    force: bool = False  # Re-run every step even if its config is unchanged
+
+class FleetDeploymentConfig(DeploymentConfig):
+    hosts: List[str]  # Inventory hostnames to deploy to
+    max_concurrency: int = Field(5, ge=1, le=settings.DEPLOYMENT_MAX_CONCURRENCY)  # Hosts deployed at the same time
+    ansible_forks: int = Field(5, ge=1, le=settings.ANSIBLE_MAX_FORKS)  # Passed to ansible-playbook --forks
+    any_errors_fatal: bool = False  # Abort remaining hosts on the first failure
+    max_fail_percentage: Optional[int] = Field(None, ge=0, le=100)  # Abort once this share of hosts has failed
 
 class DeploymentResponse(BaseModel):
     id: int
@@ -65,6 +76,68 @@ async def create_deployment(
         progress=deployment.progress
     )
 
+@router.post("/plan")
+async def plan_deployment(config: DeploymentConfig, target_host: Optional[str] = None):
+    """Dry run: show which steps a deployment would run or skip"""
+    step_config = config.dict()
+    if target_host:
+        step_config["target_host"] = target_host
+    cache = await asyncio.to_thread(StepCache, step_config)
+    plan = cache.plan(step_config, force=config.force)
+
+    return {
+        "name": config.name,
+        "deployment_type": config.deployment_type,
+        "target_host": target_host,
+        "steps": plan,
+        "steps_to_run": sum(1 for entry in plan if entry["action"] == "run")
+    }
+
+@router.post("/fleet/create", response_model=DeploymentResponse)
+async def create_fleet_deployment(
+    config: FleetDeploymentConfig,
+    background_tasks: BackgroundTasks,
+    db: AsyncSession = Depends(get_db)
+):
+    """Create a deployment that fans out to multiple hosts in parallel"""
+    if not config.hosts:
+        raise HTTPException(status_code=400, detail="At least one host is required")
+    if len(set(config.hosts)) != len(config.hosts):
+        raise HTTPException(status_code=400, detail="Duplicate hosts in fleet")
+
+    deployment = Deployment(
+        name=config.name,
+        deployment_type=config.deployment_type,
+        config=config.dict(),
+        status="pending",
+        progress=0
+    )
+    db.add(deployment)
+    await db.commit()
+    await db.refresh(deployment)
+
+    background_tasks.add_task(
+        DeploymentService.execute_fleet_deployment,
+        deployment.id,
+        config.dict()
+    )
+
+    return DeploymentResponse(
+        id=deployment.id,
+        name=deployment.name,
+        deployment_type=deployment.deployment_type,
+        status=deployment.status,
+        progress=deployment.progress
+    )
+
+@router.get("/fleet/{deployment_id}")
+async def get_fleet_deployment_status(deployment_id: int):
+    """Get aggregated and per-host progress for a fleet deployment"""
+    tracker = fleet_progress.get(deployment_id)
+    if not tracker:
+        raise HTTPException(status_code=404, detail="Fleet deployment not found")
+    return tracker.to_dict()
+
 @router.get("/status/{deployment_id}", response_model=DeploymentResponse)
 async def get_deployment_status(
     deployment_id: int,
@@ -87,6 +160,14 @@ async def get_deployment_status(
         progress=deployment.progress
     )
 
+@router.get("/timing/{deployment_id}")
+async def get_deployment_timing(deployment_id: int):
+    """Get per-step timings and the critical path of a deployment"""
+    timings = deployment_timings.get(deployment_id)
+    if not timings:
+        raise HTTPException(status_code=404, detail="No timings recorded for deployment")
+    return timings
+
 @router.get("/list")
 async def list_deployments(db: AsyncSession = Depends(get_db)):
     """List all deployments"""
@@ -1,13 +1,14 @@
 """
 File Converter API endpoints (KML/KMZ conversion)
 """
-from fastapi import APIRouter, UploadFile, File, HTTPException
-from fastapi.responses import FileResponse
+from fastapi import APIRouter, UploadFile, File, HTTPException, Request
 import zipfile
 import os
 import uuid
 from datetime import datetime
 
+from app.core.downloads import file_download
+
 router = APIRouter()
 
 @router.post("/kml-to-kmz")
@@ -96,17 +97,9 @@ async def convert_kmz_to_kml(file: UploadFile = File(...)):
     }
 
 @router.get("/download/{file_path}")
-async def download_converted_file(file_path: str):
+@router.head("/download/{file_path}")
+async def download_converted_file(file_path: str, request: Request):
     """
-    Download converted file
+    Download converted file (supports Range / If-Range for resuming)
     """
-    full_path = f"data/uploads/{file_path}"
-    
-    if not os.path.exists(full_path):
-        raise HTTPException(status_code=404, detail="File not found")
-    
-    return FileResponse(
-        full_path,
-        media_type='application/octet-stream',
-        filename=file_path
-    )
+    return await file_download(request, "data/uploads", file_path, media_type='application/octet-stream')
@@ -0,0 +1,61 @@
+"""
+Geofence API endpoints
+"""
+from fastapi import APIRouter
+from pydantic import BaseModel, Field
+from typing import List, Optional
+
+from app.core.config import settings
+from app.services.geofence_service import geofence_engine, publish
+
+router = APIRouter()
+
+class PositionUpdate(BaseModel):
+    poi_id: int
+    latitude: float = Field(..., ge=-90, le=90)
+    longitude: float = Field(..., ge=-180, le=180)
+    timestamp: Optional[float] = None  # Unix seconds, defaults to now
+
+class PositionBatch(BaseModel):
+    positions: List[PositionUpdate] = Field(..., max_length=settings.GEOFENCE_BATCH_MAX_POSITIONS)
+
+@router.get("/fences")
+async def list_fences(sdr_id: Optional[str] = None):
+    """
+    List indexed fences, optionally for a single SDR
+    """
+    fences = geofence_engine.fences.values()
+    if sdr_id:
+        fences = [fence for fence in fences if fence.sdr_id == sdr_id]
+    return [fence.to_dict() for fence in fences]
+
+@router.post("/positions")
+async def evaluate_positions(batch: PositionBatch):
+    """
+    Evaluate a batch of POI position fixes against the fences.
+    Enter/exit/dwell events are returned and pushed to /ws clients.
+    """
+    events = []
+    for position in batch.positions:
+        events.extend(geofence_engine.evaluate(
+            position.poi_id, position.latitude, position.longitude, position.timestamp
+        ))
+    await publish(events)
+    return {"evaluated": len(batch.positions), "events": events}
+
+@router.get("/occupancy/{poi_id}")
+async def get_occupancy(poi_id: int):
+    """
+    Fences a POI is currently inside
+    """
+    return [
+        {"fence_id": fence_id, "entered_at": state[0], "dwell_reported": state[1]}
+        for fence_id, state in geofence_engine.occupancy.get(poi_id, {}).items()
+    ]
+
+@router.get("/stats")
+async def get_stats():
+    """
+    Index size and evaluation latency
+    """
+    return geofence_engine.stats()
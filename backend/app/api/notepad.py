@@ -1,13 +1,25 @@
 """
 Notepad Widget API endpoints
 """
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Request, WebSocket, WebSocketDisconnect
 from pydantic import BaseModel
 from typing import Optional, List
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
+from app.core.cache import response_cache
 from app.core.database import get_db
 from app.models.models import Note
+from app.services.collab_service import OperationError, collab_manager
+from app.services.revision_service import (
+    delete_revisions, list_revisions, load_note_for_update, note_lock, reconstruct, record_revision
+)
+from app.services.sync_service import (
+    changes_since,
+    conditional_response,
+    latest_change,
+    record_change,
+    sync_headers
+)
 
 router = APIRouter()
 
@@ -39,8 +51,12 @@ async def create_note(note: NoteRequest, db: AsyncSession = Depends(get_db)):
     )
     
     db.add(new_note)
+    await db.flush()
+    await record_revision(db, new_note.id, None, note.content, note.author)
+    await record_change(db, "note", new_note.id, "upsert")
     await db.commit()
     await db.refresh(new_note)
+    response_cache.invalidate_prefix("notes:list:")
     
     return NoteResponse(
         id=new_note.id,
@@ -54,12 +70,19 @@ async def create_note(note: NoteRequest, db: AsyncSession = Depends(get_db)):
 
 @router.get("/list")
 async def list_notes(
+    request: Request,
     shared_only: bool = True,
     db: AsyncSession = Depends(get_db)
 ):
     """
-    List notes (shared or all)
+    List notes (shared or all).
+    Supports If-None-Match / If-Modified-Since conditional requests.
     """
+    cached, epoch = response_cache.lookup(f"notes:list:{shared_only}")
+    if cached is not None:
+        return conditional_response(request, cached)
+
+    cursor, changed_at = await latest_change(db, "note")
     query = select(Note)
     if shared_only:
         query = query.where(Note.shared == True)
@@ -67,7 +90,7 @@ async def list_notes(
     result = await db.execute(query.order_by(Note.created_at.desc()))
     notes = result.scalars().all()
     
-    return [
+    response = response_cache.store(f"notes:list:{shared_only}", [
         NoteResponse(
             id=n.id,
             title=n.title,
@@ -78,20 +101,70 @@ async def list_notes(
             updated_at=n.updated_at.isoformat() if n.updated_at else None
         )
         for n in notes
-    ]
+    ], epoch, headers=sync_headers("note", cursor, changed_at, "shared" if shared_only else "all"))
+    return conditional_response(request, response)
+
+@router.get("/sync")
+async def sync_notes(
+    since: int = 0,
+    shared_only: bool = True,
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Delta sync: notes changed and ids deleted since the cursor from a previous
+    sync. since=0 returns every note. Pass the returned cursor on the next call.
+    """
+    if since > 0:
+        upserted, deleted, cursor = await changes_since(db, "note", since)
+        query = select(Note).where(Note.id.in_(upserted)) if upserted else None
+    else:
+        cursor, _ = await latest_change(db, "note")
+        deleted = []
+        query = select(Note)
+
+    notes = []
+    if query is not None:
+        notes = (await db.execute(query.order_by(Note.created_at.desc()))).scalars().all()
+    changed = []
+    for n in notes:
+        if shared_only and not n.shared:
+            # Unshared since the last sync: gone from this client's view
+            if since > 0:
+                deleted.append(n.id)
+            continue
+        changed.append(NoteResponse(
+            id=n.id,
+            title=n.title,
+            content=n.content,
+            author=n.author or "anonymous",
+            shared=n.shared,
+            created_at=n.created_at.isoformat(),
+            updated_at=n.updated_at.isoformat() if n.updated_at else None
+        ))
+
+    return {
+        "cursor": cursor,
+        "full": since <= 0,
+        "changed": changed,
+        "deleted": sorted(deleted)
+    }
 
 @router.get("/{note_id}", response_model=NoteResponse)
 async def get_note(note_id: int, db: AsyncSession = Depends(get_db)):
     """
     Get note details
     """
+    cached, epoch = response_cache.lookup(f"notes:get:{note_id}")
+    if cached is not None:
+        return cached
+
     result = await db.execute(select(Note).where(Note.id == note_id))
     note = result.scalar_one_or_none()
     
     if not note:
         raise HTTPException(status_code=404, detail="Note not found")
     
-    return NoteResponse(
+    return response_cache.store(f"notes:get:{note_id}", NoteResponse(
         id=note.id,
         title=note.title,
         content=note.content,
@@ -99,7 +172,27 @@ async def get_note(note_id: int, db: AsyncSession = Depends(get_db)):
         shared=note.shared,
         created_at=note.created_at.isoformat(),
         updated_at=note.updated_at.isoformat() if note.updated_at else None
-    )
+    ), epoch)
+
+@router.get("/{note_id}/revisions")
+async def get_note_revisions(note_id: int, db: AsyncSession = Depends(get_db)):
+    """
+    List stored revisions of a note
+    """
+    revisions = await list_revisions(db, note_id)
+    if not revisions:
+        raise HTTPException(status_code=404, detail="No revisions found")
+    return revisions
+
+@router.get("/{note_id}/revisions/{revision}")
+async def get_note_revision(note_id: int, revision: int, db: AsyncSession = Depends(get_db)):
+    """
+    Reconstruct the content of a note at a given revision
+    """
+    content = await reconstruct(db, note_id, revision)
+    if content is None:
+        raise HTTPException(status_code=404, detail="Revision not found")
+    return {"note_id": note_id, "revision": revision, "content": content}
 
 @router.put("/{note_id}", response_model=NoteResponse)
 async def update_note(
@@ -110,19 +203,27 @@ async def update_note(
     """
     Update note
     """
-    result = await db.execute(select(Note).where(Note.id == note_id))
-    note = result.scalar_one_or_none()
-    
-    if not note:
-        raise HTTPException(status_code=404, detail="Note not found")
-    
-    note.title = note_update.title
-    note.content = note_update.content
-    note.author = note_update.author
-    note.shared = note_update.shared
-    
-    await db.commit()
-    await db.refresh(note)
+    async with note_lock(note_id):
+        note = await load_note_for_update(db, note_id)
+
+        if not note:
+            raise HTTPException(status_code=404, detail="Note not found")
+
+        if note_update.content != note.content:
+            await record_revision(db, note_id, note.content, note_update.content, note_update.author)
+        note.title = note_update.title
+        note.content = note_update.content
+        note.author = note_update.author
+        note.shared = note_update.shared
+        await record_change(db, "note", note_id, "upsert")
+
+        await db.commit()
+        await db.refresh(note)
+        response_cache.invalidate(f"notes:get:{note_id}")
+        response_cache.invalidate_prefix("notes:list:")
+        # Still under the note lock, so a compaction cannot write back the
+        # editors' older content
+        await collab_manager.replace_content(note_id, note.content or "")
     
     return NoteResponse(
         id=note.id,
@@ -139,13 +240,48 @@ async def delete_note(note_id: int, db: AsyncSession = Depends(get_db)):
     """
     Delete note
     """
-    result = await db.execute(select(Note).where(Note.id == note_id))
-    note = result.scalar_one_or_none()
-    
-    if not note:
-        raise HTTPException(status_code=404, detail="Note not found")
-    
-    await db.delete(note)
-    await db.commit()
+    # Under the note lock, so a compaction cannot write to the deleted note
+    async with note_lock(note_id):
+        note = await load_note_for_update(db, note_id)
+
+        if not note:
+            raise HTTPException(status_code=404, detail="Note not found")
+
+        await db.delete(note)
+        await delete_revisions(db, note_id)
+        await record_change(db, "note", note_id, "delete")
+        await db.commit()
+        response_cache.invalidate(f"notes:get:{note_id}")
+        response_cache.invalidate_prefix("notes:list:")
+        await collab_manager.close(note_id)
     
     return {"message": "Note deleted successfully"}
+
+@router.websocket("/ws/{note_id}")
+async def collaborate_on_note(websocket: WebSocket, note_id: int):
+    """
+    Real-time collaborative editing. The server sends
+    {"type": "init", "revision", "content"}; clients send
+    {"type": "op", "revision", "ops"} and receive an "ack" for their own
+    operations and "op" messages for everyone else's.
+    """
+    await websocket.accept()
+    session = await collab_manager.join(note_id, websocket)
+    if session is None:
+        await websocket.close(code=4404)
+        return
+
+    try:
+        while True:
+            message = await websocket.receive_json()
+            if message.get("type") != "op":
+                await websocket.send_json({"type": "error", "detail": "Unsupported message type"})
+                continue
+            try:
+                await collab_manager.submit(note_id, websocket, int(message["revision"]), message["ops"])
+            except (OperationError, KeyError, TypeError, ValueError) as e:
+                await websocket.send_json({"type": "error", "detail": str(e)})
+    except WebSocketDisconnect:
+        pass
+    finally:
+        await collab_manager.leave(note_id, websocket)
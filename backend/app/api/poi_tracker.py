@@ -1,13 +1,29 @@
 """
 POI (Person of Interest) Tracker API endpoints
 """
-from fastapi import APIRouter, HTTPException, Depends
-from pydantic import BaseModel
+from fastapi import APIRouter, HTTPException, Depends, Request, Query
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field
 from typing import Optional, List
+from datetime import datetime, timezone
+import asyncio
+import time
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
+from app.core.cache import response_cache
+from app.core.config import settings
 from app.core.database import get_db
 from app.models.models import POI
+from app.services.cot_service import MEDIA_TYPES, iter_encoded, poi_events
+from app.services.geofence_service import geofence_engine, parse_position, publish
+from app.services.track_service import from_fix, simplify, thin, to_fix, track_store
+from app.services.sync_service import (
+    changes_since,
+    conditional_response,
+    latest_change,
+    record_change,
+    sync_headers
+)
 
 router = APIRouter()
 
@@ -30,6 +46,33 @@ class POIResponse(BaseModel):
     created_at: str
     updated_at: Optional[str] = None
 
+class TrackFix(BaseModel):
+    timestamp: datetime  # ISO 8601 or unix seconds; naive times are UTC
+    latitude: float = Field(..., ge=-90, le=90)
+    longitude: float = Field(..., ge=-180, le=180)
+
+class TrackAppendRequest(BaseModel):
+    fixes: List[TrackFix] = Field(..., min_length=1, max_length=100000)
+
+def to_unix_ms(value: datetime) -> int:
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return round(value.timestamp() * 1000)
+
+async def record_position(db: AsyncSession, poi: POI):
+    """Append the POI's current position to its track"""
+    position = parse_position(poi.latitude, poi.longitude)
+    if position:
+        await track_store.append(db, poi.id, [to_fix(round(time.time() * 1000), *position)])
+
+async def evaluate_geofences(poi: POI):
+    """Test the POI's position against the geofences and push any events"""
+    position = parse_position(poi.latitude, poi.longitude)
+    if position:
+        await publish(geofence_engine.evaluate(poi.id, *position))
+    else:
+        await publish(geofence_engine.forget(poi.id))
+
 @router.post("/create", response_model=POIResponse)
 async def create_poi(poi: POIRequest, db: AsyncSession = Depends(get_db)):
     """
@@ -45,8 +88,13 @@ async def create_poi(poi: POIRequest, db: AsyncSession = Depends(get_db)):
     )
     
     db.add(new_poi)
+    await db.flush()
+    await record_change(db, "poi", new_poi.id, "upsert")
     await db.commit()
     await db.refresh(new_poi)
+    response_cache.invalidate("poi:list:", f"poi:list:{new_poi.category or ''}")
+    await evaluate_geofences(new_poi)
+    await record_position(db, new_poi)
     
     return POIResponse(
         id=new_poi.id,
@@ -62,12 +110,19 @@ async def create_poi(poi: POIRequest, db: AsyncSession = Depends(get_db)):
 
 @router.get("/list")
 async def list_pois(
+    request: Request,
     category: Optional[str] = None,
     db: AsyncSession = Depends(get_db)
 ):
     """
-    List all POIs, optionally filtered by category
+    List all POIs, optionally filtered by category.
+    Supports If-None-Match / If-Modified-Since conditional requests.
     """
+    cached, epoch = response_cache.lookup(f"poi:list:{category or ''}")
+    if cached is not None:
+        return conditional_response(request, cached)
+
+    cursor, changed_at = await latest_change(db, "poi")
     query = select(POI)
     if category:
         query = query.where(POI.category == category)
@@ -75,7 +130,7 @@ async def list_pois(
     result = await db.execute(query)
     pois = result.scalars().all()
     
-    return [
+    response = response_cache.store(f"poi:list:{category or ''}", [
         POIResponse(
             id=p.id,
             name=p.name,
@@ -88,20 +143,87 @@ async def list_pois(
             updated_at=p.updated_at.isoformat() if p.updated_at else None
         )
         for p in pois
-    ]
+    ], epoch, headers=sync_headers("poi", cursor, changed_at, category or ""))
+    return conditional_response(request, response)
+
+@router.get("/sync")
+async def sync_pois(
+    since: int = 0,
+    category: Optional[str] = None,
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Delta sync: POIs changed and ids deleted since the cursor from a previous
+    sync. since=0 returns every POI. Pass the returned cursor on the next call.
+    """
+    if since > 0:
+        upserted, deleted, cursor = await changes_since(db, "poi", since)
+        query = select(POI).where(POI.id.in_(upserted)) if upserted else None
+    else:
+        cursor, _ = await latest_change(db, "poi")
+        deleted = []
+        query = select(POI)
+
+    pois = (await db.execute(query)).scalars().all() if query is not None else []
+    changed = []
+    for p in pois:
+        if category and p.category != category:
+            # Moved out of the requested category: gone from this client's view
+            if since > 0:
+                deleted.append(p.id)
+            continue
+        changed.append(POIResponse(
+            id=p.id,
+            name=p.name,
+            description=p.description or "",
+            category=p.category or "general",
+            latitude=p.latitude or "",
+            longitude=p.longitude or "",
+            metadata=p.poi_metadata or {},
+            created_at=p.created_at.isoformat(),
+            updated_at=p.updated_at.isoformat() if p.updated_at else None
+        ))
+
+    return {
+        "cursor": cursor,
+        "full": since <= 0,
+        "changed": changed,
+        "deleted": sorted(deleted)
+    }
+
+@router.get("/cot")
+async def export_pois_cot(
+    format: str = Query("xml", pattern="^(xml|protobuf)$"),
+    category: Optional[str] = None,
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Stream POIs as Cursor-on-Target events (CoT XML or TAK protobuf)
+    """
+    query = select(POI)
+    if category:
+        query = query.where(POI.category == category)
+    result = await db.execute(query)
+    pois = result.scalars().all()
+
+    return StreamingResponse(iter_encoded(poi_events(pois), format), media_type=MEDIA_TYPES[format])
 
 @router.get("/{poi_id}", response_model=POIResponse)
 async def get_poi(poi_id: int, db: AsyncSession = Depends(get_db)):
     """
     Get POI details
     """
+    cached, epoch = response_cache.lookup(f"poi:get:{poi_id}")
+    if cached is not None:
+        return cached
+
     result = await db.execute(select(POI).where(POI.id == poi_id))
     poi = result.scalar_one_or_none()
     
     if not poi:
         raise HTTPException(status_code=404, detail="POI not found")
     
-    return POIResponse(
+    return response_cache.store(f"poi:get:{poi_id}", POIResponse(
         id=poi.id,
         name=poi.name,
         description=poi.description or "",
@@ -111,7 +233,7 @@ async def get_poi(poi_id: int, db: AsyncSession = Depends(get_db)):
         metadata=poi.poi_metadata or {},
         created_at=poi.created_at.isoformat(),
         updated_at=poi.updated_at.isoformat() if poi.updated_at else None
-    )
+    ), epoch)
 
 @router.put("/{poi_id}", response_model=POIResponse)
 async def update_poi(
@@ -128,15 +250,27 @@ async def update_poi(
     if not poi:
         raise HTTPException(status_code=404, detail="POI not found")
     
+    old_category = poi.category
+    moved = (poi.latitude, poi.longitude) != (poi_update.latitude, poi_update.longitude)
     poi.name = poi_update.name
     poi.description = poi_update.description
     poi.category = poi_update.category
     poi.latitude = poi_update.latitude
     poi.longitude = poi_update.longitude
     poi.poi_metadata = poi_update.metadata
+    await record_change(db, "poi", poi_id, "upsert")
     
     await db.commit()
     await db.refresh(poi)
+    response_cache.invalidate(
+        f"poi:get:{poi_id}",
+        "poi:list:",
+        f"poi:list:{old_category or ''}",
+        f"poi:list:{poi.category or ''}"
+    )
+    await evaluate_geofences(poi)
+    if moved:
+        await record_position(db, poi)
     
     return POIResponse(
         id=poi.id,
@@ -162,6 +296,78 @@ async def delete_poi(poi_id: int, db: AsyncSession = Depends(get_db)):
         raise HTTPException(status_code=404, detail="POI not found")
     
     await db.delete(poi)
+    await track_store.delete(db, poi_id)
+    await record_change(db, "poi", poi_id, "delete")
     await db.commit()
+    response_cache.invalidate(f"poi:get:{poi_id}", "poi:list:", f"poi:list:{poi.category or ''}")
+    await publish(geofence_engine.forget(poi_id))
     
     return {"message": "POI deleted successfully"}
+
+async def get_poi_or_404(db: AsyncSession, poi_id: int) -> POI:
+    result = await db.execute(select(POI).where(POI.id == poi_id))
+    poi = result.scalar_one_or_none()
+    if not poi:
+        raise HTTPException(status_code=404, detail="POI not found")
+    return poi
+
+@router.post("/{poi_id}/track")
+async def append_track(poi_id: int, request: TrackAppendRequest, db: AsyncSession = Depends(get_db)):
+    """
+    Append position fixes to a POI's track history
+    """
+    await get_poi_or_404(db, poi_id)
+    fixes = [to_fix(to_unix_ms(f.timestamp), f.latitude, f.longitude) for f in request.fixes]
+    return await track_store.append(db, poi_id, fixes)
+
+@router.get("/{poi_id}/track")
+async def get_track(
+    poi_id: int,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    tolerance_m: float = Query(0.0, ge=0),
+    max_points: Optional[int] = Query(None, ge=1),
+    format: str = Query("json", pattern="^(json|geojson)$"),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    POI track between start and end, optionally simplified: fixes closer than
+    tolerance_m to the simplified line are dropped, then the track is thinned
+    to max_points (capped by TRACK_MAX_POINTS)
+    """
+    poi = await get_poi_or_404(db, poi_id)
+    fixes = await track_store.query(db, poi_id, to_unix_ms(start) if start else None,
+                                    to_unix_ms(end) if end else None)
+    total = len(fixes)
+    if tolerance_m:
+        fixes = await asyncio.to_thread(simplify, fixes, tolerance_m)
+    fixes = thin(fixes, min(max_points or settings.TRACK_MAX_POINTS, settings.TRACK_MAX_POINTS))
+    points = [from_fix(fix) for fix in fixes]
+
+    if format == "geojson":
+        return {
+            "type": "Feature",
+            "geometry": {"type": "LineString", "coordinates": [[lon, lat] for _, lat, lon in points]},
+            "properties": {
+                "poi_id": poi_id,
+                "name": poi.name,
+                "timestamps": [t for t, _, _ in points],
+                "fixes": total
+            }
+        }
+    return {
+        "poi_id": poi_id,
+        "start": start.isoformat() if start else None,
+        "end": end.isoformat() if end else None,
+        "fixes": total,
+        "returned": len(points),
+        "points": points  # [unix seconds, latitude, longitude]
+    }
+
+@router.get("/{poi_id}/track/stats")
+async def get_track_stats(poi_id: int, db: AsyncSession = Depends(get_db)):
+    """
+    Stored size of a POI's track
+    """
+    await get_poi_or_404(db, poi_id)
+    return {"poi_id": poi_id, **await track_store.stats(db, poi_id)}
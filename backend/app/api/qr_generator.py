@@ -1,31 +1,58 @@
 """
 QR Code Generator API endpoints
 """
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Request
 from pydantic import BaseModel
-import qrcode
+from typing import List, Optional
 from io import BytesIO
 import base64
 import json
 
+from app.core.config import settings
+
 router = APIRouter()
 
 class QRCodeRequest(BaseModel):
     server_url: str
     server_port: int = 8089
-    certificate_data: str
+    # Omit to issue a client certificate from the local CA; the QR code then
+    # carries a one-time enrollment URL for the PKCS#12 bundle
+    certificate_data: Optional[str] = None
     username: str
     password: str
 
 class QRCodeResponse(BaseModel):
     qr_code_base64: str
     config_json: str
+    certificate_serial: Optional[str] = None
 
-@router.post("/generate", response_model=QRCodeResponse)
-async def generate_qr_code(request: QRCodeRequest):
+async def issue_certificates(requests: List[QRCodeRequest], http_request: Request) -> List[Optional[dict]]:
     """
-    Generate QR code for ATAK/iTAK client onboarding
+    Client certificates for the requests without certificate_data, issued in
+    one batch from the key pool (None where the caller supplied one)
     """
+    pending = [req for req in requests if req.certificate_data is None]
+    if not pending:
+        return [None] * len(requests)
+    if "certificates" not in settings.API_FEATURES:
+        raise HTTPException(status_code=400, detail="certificate_data is required when certificate issuance is disabled")
+
+    from app.api.certificates import enrollment_url
+    from app.services.cert_service import EnrollmentLimitError, issue
+
+    try:
+        issued = iter(await issue([req.username for req in pending]))
+    except EnrollmentLimitError as e:
+        raise HTTPException(status_code=429, detail=str(e))
+    results = []
+    for req in requests:
+        record = next(issued) if req.certificate_data is None else None
+        if record is not None:
+            record["enrollment_url"] = enrollment_url(http_request, record["enrollment_token"])
+        results.append(record)
+    return results
+
+def build_qr_code(request: QRCodeRequest, certificate: Optional[dict] = None) -> QRCodeResponse:
     # Create configuration data
     config_data = {
         "type": "TAK_SERVER",
@@ -38,11 +65,13 @@ async def generate_qr_code(request: QRCodeRequest):
             "username": request.username,
             "password": request.password
         },
-        "certificate": request.certificate_data
+        "certificate": certificate["enrollment_url"] if certificate else request.certificate_data
     }
-    
+
     config_json = json.dumps(config_data)
-    
+
+    import qrcode  # Pulls in PIL; deferred to keep startup light
+
     # Generate QR code
     qr = qrcode.QRCode(
         version=1,
@@ -52,29 +81,40 @@ async def generate_qr_code(request: QRCodeRequest):
     )
     qr.add_data(config_json)
     qr.make(fit=True)
-    
+
     img = qr.make_image(fill_color="black", back_color="white")
-    
+
     # Convert to base64
     buffered = BytesIO()
     img.save(buffered, format="PNG")
     img_str = base64.b64encode(buffered.getvalue()).decode()
-    
+
     return QRCodeResponse(
         qr_code_base64=img_str,
-        config_json=config_json
+        config_json=config_json,
+        certificate_serial=certificate["serial"] if certificate else None
     )
 
+@router.post("/generate", response_model=QRCodeResponse)
+async def generate_qr_code(request: QRCodeRequest, http_request: Request):
+    """
+    Generate QR code for ATAK/iTAK client onboarding
+    """
+    certificate, = await issue_certificates([request], http_request)
+    return build_qr_code(request, certificate)
+
 @router.post("/batch-generate")
-async def batch_generate_qr_codes(requests: list[QRCodeRequest]):
+async def batch_generate_qr_codes(requests: list[QRCodeRequest], http_request: Request):
     """
     Generate multiple QR codes for batch client onboarding
     """
+    certificates = await issue_certificates(requests, http_request)
     results = []
-    for req in requests:
-        result = await generate_qr_code(req)
+    for req, certificate in zip(requests, certificates):
+        result = build_qr_code(req, certificate)
         results.append({
             "username": req.username,
-            "qr_code": result.qr_code_base64
+            "qr_code": result.qr_code_base64,
+            "certificate_serial": result.certificate_serial
         })
     return results
@@ -1,13 +1,16 @@
 """
 Route Package Builder API endpoints
 """
-from fastapi import APIRouter
+from fastapi import APIRouter, Query
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from typing import List, Optional
 from datetime import datetime
 import json
 import xml.etree.ElementTree as ET
 
+from app.services.cot_service import MEDIA_TYPES, iter_encoded, waypoint_events
+
 router = APIRouter()
 
 class Waypoint(BaseModel):
@@ -90,6 +93,19 @@ async def create_route_package(route: RouteRequest):
         format="kml"
     )
 
+@router.post("/cot")
+async def export_route_cot(
+    route: RouteRequest,
+    format: str = Query("xml", pattern="^(xml|protobuf)$")
+):
+    """
+    Stream route waypoints as Cursor-on-Target events (CoT XML or TAK protobuf)
+    """
+    return StreamingResponse(
+        iter_encoded(waypoint_events(route.name, route.waypoints), format),
+        media_type=MEDIA_TYPES[format]
+    )
+
 @router.get("/list")
 async def list_routes():
     """
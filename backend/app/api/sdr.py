@@ -1,12 +1,19 @@
 """
 SDR (Surveillance Detection Route) Builder API endpoints
 """
-from fastapi import APIRouter
-from pydantic import BaseModel
+from fastapi import APIRouter, Query
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field, model_validator
 from typing import List, Optional
 from datetime import datetime
+import asyncio
 import json
 
+from app.core.cache import response_cache
+from app.core.config import settings
+from app.services.cot_service import MEDIA_TYPES, checkpoint_events, iter_encoded
+from app.services.geofence_service import InvalidAreaError, fences_for_sdr, geofence_engine
+
 router = APIRouter()
 
 class SDRCheckpoint(BaseModel):
@@ -20,9 +27,40 @@ class SDRCheckpoint(BaseModel):
 class SDRRequest(BaseModel):
     name: str
     description: Optional[str] = ""
-    checkpoints: List[SDRCheckpoint]
+    checkpoints: List[SDRCheckpoint] = Field(max_length=settings.SDR_MAX_CHECKPOINTS)
     area_of_interest: Optional[dict] = {}
 
+class SDRCandidate(BaseModel):
+    name: str
+    checkpoints: List[SDRCheckpoint] = Field(max_length=settings.SDR_MAX_CHECKPOINTS)
+
+class SDRBatchScoreRequest(BaseModel):
+    candidates: List[SDRCandidate] = Field(max_length=settings.SDR_BATCH_MAX_CANDIDATES)
+    threat_weight: float = 1.0  # Meters of cost per meter of threat exposure
+    speed_kmh: Optional[float] = Field(None, gt=0)
+    dwell_minutes: Optional[float] = Field(None, ge=0)
+    loop: bool = False
+
+    @model_validator(mode="after")
+    def limit_total_checkpoints(self):
+        total = sum(len(candidate.checkpoints) for candidate in self.candidates)
+        if total > settings.SDR_BATCH_MAX_CHECKPOINTS:
+            raise ValueError(f"Batch has {total} checkpoints (limit {settings.SDR_BATCH_MAX_CHECKPOINTS})")
+        return self
+
+class SDROptimizeRequest(BaseModel):
+    sdr_id: Optional[str] = Field(None, pattern=r"^sdr_[0-9_]+$")  # Optimize a saved SDR...
+    checkpoints: Optional[List[SDRCheckpoint]] = Field(
+        None, max_length=settings.SDR_OPTIMIZER_MAX_CHECKPOINTS
+    )  # ...or an unsaved checkpoint list
+    loop: bool = False  # Return to the first checkpoint
+    fix_start: bool = True
+    threat_weight: float = Field(1.0, ge=0)
+    time_budget_ms: Optional[float] = Field(None, gt=0, le=settings.SDR_OPTIMIZER_MAX_TIME_BUDGET_MS)
+    max_length_m: Optional[float] = Field(None, gt=0)  # Steer the search toward these limits
+    max_exposure_m: Optional[float] = Field(None, ge=0)
+    apply: bool = False  # Save the new order to the SDR
+
 class SDRResponse(BaseModel):
     id: str
     name: str
@@ -38,6 +76,7 @@ async def create_sdr(sdr: SDRRequest):
     sdr_path = f"data/packages/sdr/{sdr_id}.json"
     
     import os
+    from app.services.sdr_analytics_service import analyze
     os.makedirs("data/packages/sdr", exist_ok=True)
     
     # Create SDR data structure
@@ -53,12 +92,21 @@ async def create_sdr(sdr: SDRRequest):
             "high_threat": sum(1 for cp in sdr.checkpoints if cp.threat_level == "high"),
             "medium_threat": sum(1 for cp in sdr.checkpoints if cp.threat_level == "medium"),
             "low_threat": sum(1 for cp in sdr.checkpoints if cp.threat_level == "low")
-        }
+        },
+        # Separation compares every checkpoint pair; keep it off the event loop
+        "analytics": await asyncio.to_thread(analyze, [cp.dict() for cp in sdr.checkpoints])
     }
+    try:
+        fences = fences_for_sdr(sdr_data)
+    except InvalidAreaError as e:
+        from fastapi import HTTPException
+        raise HTTPException(status_code=422, detail=str(e))
     
     # Save to file
     with open(sdr_path, 'w') as f:
         json.dump(sdr_data, f, indent=2)
+    response_cache.invalidate(f"sdr:get:{sdr_id}", "sdr:list")
+    geofence_engine.load_sdr(sdr_data, fences)
     
     return SDRResponse(
         id=sdr_id,
@@ -67,11 +115,98 @@ async def create_sdr(sdr: SDRRequest):
         checkpoint_count=len(sdr.checkpoints)
     )
 
+@router.post("/analyze/batch")
+async def score_sdrs(request: SDRBatchScoreRequest):
+    """
+    Score candidate SDRs without saving them, best (lowest cost) first
+    """
+    from app.services.sdr_analytics_service import score
+
+    def score_all():
+        results = []
+        for index, candidate in enumerate(request.candidates):
+            metrics = score(
+                [cp.dict() for cp in candidate.checkpoints],
+                threat_weight=request.threat_weight,
+                speed_kmh=request.speed_kmh,
+                dwell_minutes=request.dwell_minutes,
+                loop=request.loop
+            )
+            results.append({"index": index, "name": candidate.name, **metrics})
+        results.sort(key=lambda result: result["cost"])
+        return results
+
+    results = await asyncio.to_thread(score_all)
+    return {"count": len(results), "results": results}
+
+@router.post("/optimize")
+async def optimize_sdr(request: SDROptimizeRequest):
+    """
+    Reorder checkpoints (or propose a loop) to minimize route length plus
+    weighted threat exposure, within a time budget
+    """
+    import os
+    from fastapi import HTTPException
+    from app.services.sdr_analytics_service import analyze, score
+    from app.services.sdr_optimizer_service import goals_met, optimize_with_goals, reorder
+    sdr_path = f"data/packages/sdr/{request.sdr_id}.json"
+    sdr_data = None
+    
+    if request.sdr_id:
+        if not os.path.exists(sdr_path):
+            raise HTTPException(status_code=404, detail="SDR not found")
+        with open(sdr_path, 'r') as f:
+            sdr_data = json.load(f)
+        checkpoints = sdr_data["checkpoints"]
+        if len(checkpoints) > settings.SDR_OPTIMIZER_MAX_CHECKPOINTS:
+            raise HTTPException(status_code=422, detail="SDR has too many checkpoints to optimize")
+    elif request.checkpoints:
+        checkpoints = [cp.dict() for cp in request.checkpoints]
+    else:
+        raise HTTPException(status_code=400, detail="Provide sdr_id or checkpoints")
+    
+    # CPU-bound search; keep the event loop serving other requests
+    result = await asyncio.to_thread(
+        optimize_with_goals,
+        checkpoints,
+        loop=request.loop,
+        threat_weight=request.threat_weight,
+        fix_start=request.fix_start,
+        time_budget_ms=request.time_budget_ms,
+        max_length_m=request.max_length_m,
+        max_exposure_m=request.max_exposure_m
+    )
+    ordered = reorder(checkpoints, result["order"])
+    before = await asyncio.to_thread(score, checkpoints, threat_weight=request.threat_weight, loop=request.loop)
+    after = await asyncio.to_thread(score, ordered, threat_weight=request.threat_weight, loop=request.loop)
+    
+    if request.apply and sdr_data is not None:
+        sdr_data["checkpoints"] = ordered
+        sdr_data["analytics"] = await asyncio.to_thread(analyze, ordered)
+        with open(sdr_path, 'w') as f:
+            json.dump(sdr_data, f, indent=2)
+        response_cache.invalidate(f"sdr:get:{request.sdr_id}")
+        geofence_engine.load_sdr(sdr_data)
+    
+    return {
+        **result,
+        "applied": request.apply and sdr_data is not None,
+        "checkpoints": ordered,
+        "before": before,
+        "after": after,
+        "improvement_percent": round((1 - after["cost"] / before["cost"]) * 100, 1) if before["cost"] else 0.0,
+        "goals": goals_met(after, request.max_length_m, request.max_exposure_m)
+    }
+
 @router.get("/list")
 async def list_sdrs():
     """
     List all SDRs
     """
+    cached, epoch = response_cache.lookup("sdr:list")
+    if cached is not None:
+        return cached
+
     sdrs = []
     sdr_dir = "data/packages/sdr"
     
@@ -88,13 +223,38 @@ async def list_sdrs():
                         "checkpoint_count": sdr_data["statistics"]["total_checkpoints"]
                     })
     
-    return sdrs
+    return response_cache.store("sdr:list", sdrs, epoch)
 
 @router.get("/{sdr_id}")
 async def get_sdr(sdr_id: str):
     """
     Get SDR details
     """
+    cached, epoch = response_cache.lookup(f"sdr:get:{sdr_id}")
+    if cached is not None:
+        return cached
+
+    import os
+    sdr_path = f"data/packages/sdr/{sdr_id}.json"
+    
+    if not os.path.exists(sdr_path):
+        from fastapi import HTTPException
+        raise HTTPException(status_code=404, detail="SDR not found")
+    
+    with open(sdr_path, 'r') as f:
+        return response_cache.store(f"sdr:get:{sdr_id}", json.load(f), epoch)
+
+@router.get("/{sdr_id}/analytics")
+async def get_sdr_analytics(
+    sdr_id: str,
+    speed_kmh: Optional[float] = Query(None, gt=0),
+    dwell_minutes: Optional[float] = Query(None, ge=0),
+    loop: bool = False
+):
+    """
+    Route length, legs and bearings, transit estimate, checkpoint separation
+    and coverage. Results for the default parameters are cached in the SDR file.
+    """
     import os
     sdr_path = f"data/packages/sdr/{sdr_id}.json"
     
@@ -103,4 +263,41 @@ async def get_sdr(sdr_id: str):
         raise HTTPException(status_code=404, detail="SDR not found")
     
     with open(sdr_path, 'r') as f:
-        return json.load(f)
+        sdr_data = json.load(f)
+    
+    defaults = speed_kmh is None and dwell_minutes is None and not loop
+    if defaults and sdr_data.get("analytics"):
+        return sdr_data["analytics"]
+    
+    from app.services.sdr_analytics_service import analyze
+    analytics = await asyncio.to_thread(analyze, sdr_data["checkpoints"], speed_kmh, dwell_minutes, loop)
+    if defaults:
+        # SDRs saved before analytics existed get theirs computed once
+        sdr_data["analytics"] = analytics
+        with open(sdr_path, 'w') as f:
+            json.dump(sdr_data, f, indent=2)
+        response_cache.invalidate(f"sdr:get:{sdr_id}")
+    return analytics
+
+@router.get("/{sdr_id}/cot")
+async def export_sdr_cot(
+    sdr_id: str,
+    format: str = Query("xml", pattern="^(xml|protobuf)$")
+):
+    """
+    Stream SDR checkpoints as Cursor-on-Target events (CoT XML or TAK protobuf)
+    """
+    import os
+    sdr_path = f"data/packages/sdr/{sdr_id}.json"
+    
+    if not os.path.exists(sdr_path):
+        from fastapi import HTTPException
+        raise HTTPException(status_code=404, detail="SDR not found")
+    
+    with open(sdr_path, 'r') as f:
+        sdr_data = json.load(f)
+    
+    return StreamingResponse(
+        iter_encoded(checkpoint_events(sdr_id, sdr_data["checkpoints"]), format),
+        media_type=MEDIA_TYPES[format]
+    )
@@ -1,13 +1,18 @@
 """
 Server Status API endpoints
 """
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import FileResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
+from app.core.cache import response_cache
 from app.core.database import get_db
+from app.core.profiling import profile_ring
 from app.models.models import ServerMetrics
-import psutil
+from app.services.health_service import health_prober
+from app.services.stream_monitor_service import stream_monitor
 from datetime import datetime, timedelta
+from typing import Optional
 
 router = APIRouter()
 
@@ -16,6 +21,8 @@ async def get_current_status():
     """
     Get current server status
     """
+    import psutil
+
     cpu_percent = psutil.cpu_percent(interval=1)
     memory = psutil.virtual_memory()
     disk = psutil.disk_usage('/')
@@ -99,30 +106,58 @@ async def record_metrics(db: AsyncSession = Depends(get_db)):
     return {"message": "Metrics recorded successfully"}
 
 @router.get("/services")
-async def get_services_status():
+async def get_services_status(refresh: bool = False):
     """
-    Get status of key services
+    Get status of key services (probed concurrently, cached briefly)
     """
-    return {
-        "tak_server": {
-            "status": "running",  # Would check actual status
-            "port": 8089,
-            "active_connections": 0
-        },
-        "traefik": {
-            "status": "running",
-            "https_enabled": True
-        },
-        "mediamtx": {
-            "status": "stopped",
-            "streams": 0
-        },
-        "tailscale": {
-            "status": "connected",
-            "network": "example-network"
-        },
-        "zerotier": {
-            "status": "disconnected",
-            "network": ""
-        }
-    }
+    return await health_prober.check(force=refresh)
+
+@router.get("/services/transitions")
+async def get_service_transitions(service: Optional[str] = None):
+    """
+    Recent service status changes, newest first
+    """
+    return health_prober.history(service)
+
+@router.get("/streams")
+async def get_streams():
+    """
+    MediaMTX stream inventory: readers, bytes and bitrates per path, with
+    stalled and saturated feeds flagged
+    """
+    return stream_monitor.summary()
+
+@router.get("/streams/{name:path}")
+async def get_stream(name: str):
+    """
+    One stream with its recent bitrate history
+    """
+    state = stream_monitor.streams.get(name)
+    if state is None:
+        raise HTTPException(status_code=404, detail="Stream not found")
+    return state.to_dict(history=True)
+
+@router.get("/cache")
+async def get_cache_stats():
+    """
+    Get response cache hit/miss counters
+    """
+    return response_cache.stats()
+
+@router.get("/profiles")
+async def list_profiles():
+    """
+    List captured request profiles, newest first
+    """
+    return profile_ring.list()
+
+@router.get("/profiles/{profile_id}")
+async def get_profile(profile_id: str):
+    """
+    Download a request profile as folded stacks, ready for flamegraph.pl or
+    speedscope
+    """
+    path = profile_ring.path(profile_id)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return FileResponse(path, media_type="text/plain", filename=f"{profile_id}.folded")
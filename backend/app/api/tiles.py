@@ -0,0 +1,168 @@
+"""
+Offline map tile cache API endpoints
+"""
+import asyncio
+from fastapi import APIRouter, HTTPException, Request, Response
+from pydantic import BaseModel, Field
+from typing import List, Optional
+
+from app.core.config import settings
+from app.core.metrics import track_job
+from app.services.tile_cache_service import (
+    MAX_ZOOM,
+    pad_bbox,
+    route_points,
+    sdr_points,
+    tile_cache,
+    tile_count,
+    upstream_url
+)
+
+router = APIRouter()
+
+class TileArea(BaseModel):
+    route_id: Optional[str] = None
+    sdr_id: Optional[str] = None
+    bbox: Optional[List[float]] = Field(None, min_length=4, max_length=4)  # min_lat, min_lon, max_lat, max_lon
+    min_zoom: int = Field(10, ge=0, le=MAX_ZOOM)
+    max_zoom: int = Field(16, ge=0, le=MAX_ZOOM)
+    margin_m: float = Field(500.0, ge=0)
+
+def check_tile(z: int, x: int, y: int):
+    if not 0 <= z <= MAX_ZOOM or not (0 <= x < 1 << z and 0 <= y < 1 << z):
+        raise HTTPException(status_code=400, detail="Tile coordinates out of range")
+
+def resolve_area(area: TileArea):
+    """
+    Bounding box for a tile selection from a route, an SDR or an explicit bbox.
+    Raises HTTPException for missing sources or oversized selections. Reads
+    and parses route/SDR files; call it with asyncio.to_thread.
+    """
+    if area.min_zoom > area.max_zoom:
+        raise HTTPException(status_code=400, detail="min_zoom must not exceed max_zoom")
+    try:
+        if area.route_id:
+            bbox = pad_bbox(route_points(area.route_id), area.margin_m)
+        elif area.sdr_id:
+            bbox = pad_bbox(sdr_points(area.sdr_id), area.margin_m)
+        elif area.bbox:
+            min_lat, min_lon, max_lat, max_lon = area.bbox
+            if not (-90 <= min_lat < max_lat <= 90 and -180 <= min_lon < max_lon <= 180):
+                raise HTTPException(
+                    status_code=400,
+                    detail="bbox must be [min_lat, min_lon, max_lat, max_lon] with min < max, "
+                           "latitudes within ±90 and longitudes within ±180"
+                )
+            bbox = tuple(area.bbox)
+        else:
+            raise HTTPException(status_code=400, detail="Provide route_id, sdr_id or bbox")
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    count = tile_count(bbox, area.min_zoom, area.max_zoom)
+    if count > settings.TILE_PACKAGE_MAX_TILES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Selection covers {count} tiles (limit {settings.TILE_PACKAGE_MAX_TILES}); "
+                   f"lower max_zoom or shrink the area"
+        )
+    return bbox, count
+
+@router.get("/stats")
+async def get_tile_stats():
+    """
+    Tile cache size, hit/miss and eviction counters
+    """
+    return await asyncio.to_thread(tile_cache.stats)
+
+@router.post("/prefetch")
+async def prefetch_tiles(area: TileArea):
+    """
+    Download tiles covering an area from the upstream tile server into the
+    cache, ahead of going offline
+    """
+    if not settings.TILE_UPSTREAM_URL:
+        raise HTTPException(status_code=400, detail="No upstream tile server configured")
+    bbox, count = await asyncio.to_thread(resolve_area, area)
+
+    missing = await asyncio.to_thread(tile_cache.missing, bbox, area.min_zoom, area.max_zoom)
+    import httpx
+
+    semaphore = asyncio.Semaphore(settings.TILE_PREFETCH_CONCURRENCY)
+    failed = 0
+
+    async def fetch(client: "httpx.AsyncClient", z: int, x: int, y: int):
+        nonlocal failed
+        async with semaphore:
+            try:
+                response = await client.get(upstream_url(z, x, y))
+                response.raise_for_status()
+                await asyncio.to_thread(tile_cache.put, z, x, y, response.content)
+            except httpx.HTTPError:
+                failed += 1
+
+    async with track_job("tile_prefetch"), \
+            httpx.AsyncClient(timeout=10.0, headers={"User-Agent": "OTG-TAK tile prefetch"}) as client:
+        await asyncio.gather(*(fetch(client, *tile) for tile in missing))
+
+    return {
+        "bbox": list(bbox),
+        "tiles": count,
+        "already_cached": count - len(missing),
+        "downloaded": len(missing) - failed,
+        "failed": failed
+    }
+
+@router.get("/{z}/{x}/{y}")
+async def get_tile(z: int, x: int, y: int):
+    """
+    Serve a tile from the cache, fetching it from the upstream server on a miss
+    """
+    check_tile(z, x, y)
+    data = await asyncio.to_thread(tile_cache.get, z, x, y)
+    if data is None and settings.TILE_UPSTREAM_URL:
+        import httpx
+
+        try:
+            async with httpx.AsyncClient(timeout=10.0) as client:
+                response = await client.get(upstream_url(z, x, y))
+                response.raise_for_status()
+        except httpx.HTTPError:
+            raise HTTPException(status_code=502, detail="Upstream tile server unavailable")
+        data = response.content
+        await asyncio.to_thread(tile_cache.put, z, x, y, data)
+    if data is None:
+        raise HTTPException(status_code=404, detail="Tile not cached")
+    return Response(content=data, media_type=tile_cache.media_type,
+                    headers={"Cache-Control": "public, max-age=86400"})
+
+@router.put("/{z}/{x}/{y}")
+async def put_tile(z: int, x: int, y: int, request: Request):
+    """
+    Seed a tile into the cache (raw tile bytes as the request body)
+    """
+    check_tile(z, x, y)
+    too_large = HTTPException(status_code=413, detail=f"Tile exceeds {settings.TILE_MAX_BYTES} bytes")
+    declared = request.headers.get("content-length", "")
+    if declared.isdigit() and int(declared) > settings.TILE_MAX_BYTES:
+        raise too_large
+    data = bytearray()
+    async for chunk in request.stream():
+        data += chunk
+        if len(data) > settings.TILE_MAX_BYTES:
+            raise too_large
+    data = bytes(data)
+    if not data:
+        raise HTTPException(status_code=400, detail="Empty tile")
+    await asyncio.to_thread(tile_cache.put, z, x, y, data)
+    return {"z": z, "x": x, "y": y, "size": len(data)}
+
+@router.delete("/cache")
+async def clear_tile_cache():
+    """
+    Remove every cached tile
+    """
+    await asyncio.to_thread(tile_cache.clear)
+    return {"message": "Tile cache cleared"}
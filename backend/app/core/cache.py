@@ -0,0 +1,100 @@
+"""
+In-process response cache with TTL + LRU eviction
+
+Handlers cache fully encoded JSON bodies per route and query, so a hit skips
+both the database (or disk) and JSON encoding. Write handlers invalidate the
+exact keys they affect.
+"""
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import Response
+
+from app.core.config import settings
+from app.core.responses import render_json
+
+class ResponseCache:
+    def __init__(self, max_entries: int, ttl_seconds: float, enabled: bool = True):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.enabled = enabled
+        self._entries: "OrderedDict[str, Tuple[float, bytes, Optional[Dict[str, str]]]]" = OrderedDict()
+        # Bumped on every invalidation so a read that raced a write isn't cached
+        self.epoch = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def lookup(self, key: str) -> Tuple[Optional[Response], int]:
+        """
+        Return the cached response for key (or None) and the epoch to pass
+        back to store() on a miss
+        """
+        if not self.enabled:
+            return None, self.epoch
+        entry = self._entries.get(key)
+        if entry is not None:
+            expires_at, body, headers = entry
+            if expires_at > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return Response(content=body, media_type="application/json", headers=headers), self.epoch
+            del self._entries[key]
+        self.misses += 1
+        return None, self.epoch
+
+    def store(self, key: str, content: Any, epoch: int, headers: Optional[Dict[str, str]] = None) -> Response:
+        """
+        Encode content once, cache the body (and headers such as ETag) unless
+        the cache was invalidated since the lookup that produced epoch, and
+        return the response
+        """
+        body = render_json(jsonable_encoder(content))
+        if self.enabled and epoch == self.epoch:
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, body, headers)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return Response(content=body, media_type="application/json", headers=headers)
+
+    def invalidate(self, *keys: str):
+        """Drop exact keys"""
+        self.epoch += 1
+        for key in keys:
+            if self._entries.pop(key, None) is not None:
+                self.invalidations += 1
+
+    def invalidate_prefix(self, prefix: str):
+        """Drop every key starting with prefix"""
+        self.epoch += 1
+        for key in [k for k in self._entries if k.startswith(prefix)]:
+            del self._entries[key]
+            self.invalidations += 1
+
+    def clear(self):
+        self.epoch += 1
+        self._entries.clear()
+
+    def stats(self) -> Dict:
+        lookups = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+        }
+
+response_cache = ResponseCache(
+    max_entries=settings.RESPONSE_CACHE_MAX_ENTRIES,
+    ttl_seconds=settings.RESPONSE_CACHE_TTL_SECONDS,
+    enabled=settings.RESPONSE_CACHE_ENABLED,
+)
@@ -1,14 +1,87 @@
 """
 Database configuration and models
 """
-from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
+from sqlalchemy import event
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine, AsyncSession
 from sqlalchemy.orm import sessionmaker, declarative_base
 from app.core.config import settings
+from app.core.metrics import instrument_engine
 
-# Convert sqlite URL to async
-database_url = settings.DATABASE_URL.replace("sqlite://", "sqlite+aiosqlite://")
+def async_database_url(database_url: str) -> str:
+    """Rewrite a sync database URL to its async driver (aiosqlite / asyncpg)"""
+    for prefix, async_prefix in (
+        ("sqlite://", "sqlite+aiosqlite://"),
+        ("postgresql://", "postgresql+asyncpg://"),
+        ("postgres://", "postgresql+asyncpg://"),
+    ):
+        if database_url.startswith(prefix):
+            return async_prefix + database_url[len(prefix):]
+    return database_url
 
-engine = create_async_engine(database_url, echo=True)
+def make_engine(database_url: str, profile: str = settings.DB_ENGINE_PROFILE) -> AsyncEngine:
+    """
+    Create the async engine for a SQLite or PostgreSQL database URL.
+
+    The "production" profile switches SQLite to WAL journaling, relaxes fsync to
+    synchronous=NORMAL, waits on locks instead of failing (busy_timeout), maps
+    the file into memory and sizes the connection pool and statement caches
+    from Settings. PostgreSQL gets the same pool sizing plus connection health
+    checks. The "default" profile keeps driver/SQLAlchemy defaults.
+    """
+    database_url = async_database_url(database_url)
+    is_sqlite = database_url.startswith("sqlite")
+    is_postgres = database_url.startswith("postgresql")
+    is_memory = ":memory:" in database_url or database_url.rstrip("/").endswith("sqlite+aiosqlite:")
+
+    if profile != "production":
+        return create_async_engine(database_url, echo=settings.DATABASE_ECHO)
+
+    engine_kwargs = {
+        "echo": settings.DATABASE_ECHO,
+        "query_cache_size": settings.DB_STATEMENT_CACHE_SIZE,
+    }
+    if not is_memory:
+        # aiosqlite defaults to NullPool, opening a new connection per checkout
+        engine_kwargs.update(
+            poolclass=AsyncAdaptedQueuePool,
+            pool_size=settings.DB_POOL_SIZE,
+            max_overflow=settings.DB_MAX_OVERFLOW,
+            pool_timeout=settings.DB_POOL_TIMEOUT,
+        )
+    if is_postgres:
+        engine_kwargs.update(
+            pool_pre_ping=True,
+            pool_recycle=settings.DB_POOL_RECYCLE,
+            connect_args={"statement_cache_size": settings.DB_STATEMENT_CACHE_SIZE},
+        )
+    if is_sqlite:
+        engine_kwargs["connect_args"] = {
+            "timeout": settings.SQLITE_BUSY_TIMEOUT_MS / 1000,
+            # Per-connection prepared statement cache in the sqlite3 driver
+            "cached_statements": settings.SQLITE_CACHED_STATEMENTS,
+        }
+
+    engine = create_async_engine(database_url, **engine_kwargs)
+
+    if is_sqlite:
+        @event.listens_for(engine.sync_engine, "connect")
+        def _set_sqlite_pragmas(dbapi_connection, connection_record):
+            cursor = dbapi_connection.cursor()
+            if not is_memory:
+                cursor.execute(f"PRAGMA journal_mode={settings.SQLITE_JOURNAL_MODE}")
+                cursor.execute(f"PRAGMA mmap_size={int(settings.SQLITE_MMAP_SIZE)}")
+            cursor.execute(f"PRAGMA synchronous={settings.SQLITE_SYNCHRONOUS}")
+            cursor.execute(f"PRAGMA busy_timeout={int(settings.SQLITE_BUSY_TIMEOUT_MS)}")
+            cursor.execute(f"PRAGMA cache_size={int(settings.SQLITE_CACHE_SIZE)}")
+            cursor.execute("PRAGMA temp_store=MEMORY")
+            cursor.close()
+
+    return engine
+
+engine = make_engine(settings.DATABASE_URL)
+if settings.METRICS_ENABLED:
+    instrument_engine(engine)
 AsyncSessionLocal = sessionmaker(
     engine, class_=AsyncSession, expire_on_commit=False
 )
@@ -16,9 +89,13 @@ AsyncSessionLocal = sessionmaker(
 Base = declarative_base()
 
 async def init_db():
-    """Initialize database tables"""
+    """Initialize database tables and apply pending schema migrations"""
+    from app.core.migrations import run_migrations
+    import app.models.models  # noqa: F401 - registers every table on Base.metadata
+
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
+        await run_migrations(conn)
 
 async def get_db():
     """Dependency for getting database session"""
@@ -0,0 +1,220 @@
+"""
+Resumable file downloads (HTTP Range / If-Range, strong ETags, zero-copy)
+
+``file_download`` serves a file under one of the data directories with:
+
+- a strong ETag built from the file's inode, size and modification time, so it
+  changes whenever the bytes can have changed
+- single ``Range: bytes=...`` requests answered with 206 (multi-range requests
+  get the whole file, which RFC 9110 allows), 416 when unsatisfiable
+- ``If-Range``: the range is only honoured while the client's copy is current,
+  so a resumed download never splices together two versions of a file
+- ``If-None-Match`` / ``If-Modified-Since`` revalidation (304)
+
+The body is handed to the server without passing through Python when it
+offers the ASGI ``http.response.pathsend`` or ``http.response.zerocopysend``
+extensions (sendfile); otherwise it is read in DOWNLOAD_CHUNK_SIZE blocks with
+``os.pread`` off the event loop.
+"""
+import asyncio
+import mimetypes
+import os
+import re
+from email.utils import formatdate, parsedate_to_datetime
+from typing import Optional, Tuple
+from urllib.parse import quote
+
+from fastapi import HTTPException, Request
+from starlette.responses import Response
+from starlette.types import Receive, Scope, Send
+
+from app.core.config import settings
+from app.core.metrics import DOWNLOAD_BYTES, DOWNLOADS
+
+RANGE_PATTERN = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+def resolve_path(root: str, relative_path: str) -> str:
+    """
+    Absolute path of a regular file under root; 404 for anything else,
+    including hidden files and directories (e.g. unfinished uploads)
+    """
+    root = os.path.realpath(root)
+    path = os.path.realpath(os.path.join(root, relative_path))
+    hidden = any(part.startswith(".") for part in os.path.relpath(path, root).split(os.sep))
+    if os.path.commonpath([root, path]) != root or hidden or not os.path.isfile(path):
+        raise HTTPException(status_code=404, detail="File not found")
+    return path
+
+def make_etag(stat_result: os.stat_result) -> str:
+    return f'"{stat_result.st_ino:x}-{stat_result.st_size:x}-{stat_result.st_mtime_ns:x}"'
+
+def parse_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """
+    (first, last) byte positions, inclusive, of a single byte range. None
+    means the header is ignored and the whole file sent.
+    """
+    match = RANGE_PATTERN.match(header.replace(" ", ""))
+    if match is None:
+        return None  # Malformed, another unit or several ranges
+    first, last = match.groups()
+    if not first:
+        if not last:
+            return None
+        suffix = int(last)
+        if suffix == 0 or size == 0:
+            raise RangeNotSatisfiable()
+        return max(size - suffix, 0), size - 1
+    first = int(first)
+    if last and int(last) < first:
+        return None  # Invalid rather than unsatisfiable
+    if first >= size:
+        raise RangeNotSatisfiable()
+    last = min(int(last), size - 1) if last else size - 1
+    return first, last
+
+def _etag_matches(header: str, etag: str, weak: bool) -> bool:
+    for candidate in header.split(","):
+        candidate = candidate.strip()
+        if candidate == "*":
+            return True
+        if weak:
+            candidate = candidate[2:] if candidate.startswith("W/") else candidate
+        if candidate == etag:
+            return True
+    return False
+
+def _not_modified(request: Request, etag: str, mtime: float) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        return _etag_matches(if_none_match, etag, weak=True)
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since:
+        try:
+            return int(mtime) <= parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+    return False
+
+def _range_allowed(request: Request, etag: str, last_modified: str) -> bool:
+    """If-Range: a strong ETag match or the exact Last-Modified date"""
+    if_range = request.headers.get("if-range")
+    if if_range is None:
+        return True
+    if_range = if_range.strip()
+    if if_range.startswith(('"', 'W/')):
+        return if_range == etag
+    return if_range == last_modified
+
+def content_disposition(filename: str) -> str:
+    quoted = quote(filename)
+    if quoted == filename:
+        return f'attachment; filename="{filename}"'
+    return f"attachment; filename*=utf-8''{quoted}"
+
+class FileDownload(Response):
+    """
+    Response for an already opened file; owns and closes the file object
+    """
+    def __init__(self, request: Request, file, path: str, filename: Optional[str] = None,
+                 media_type: Optional[str] = None):
+        self.file = file
+        self.path = path
+        self.background = None
+        stat_result = os.fstat(file.fileno())
+        size = stat_result.st_size
+        etag = self.etag = make_etag(stat_result)
+        last_modified = formatdate(stat_result.st_mtime, usegmt=True)
+        filename = filename or os.path.basename(path)
+        self.media_type = media_type or mimetypes.guess_type(filename)[0] or "application/octet-stream"
+
+        headers = {
+            "accept-ranges": "bytes",
+            "etag": etag,
+            "last-modified": last_modified,
+            "content-disposition": content_disposition(filename),
+        }
+        self.offset, self.count = 0, size
+        self.status_code = 200
+        if _not_modified(request, etag, stat_result.st_mtime):
+            self.status_code, self.count = 304, 0
+            kind = "not_modified"
+        else:
+            kind = "full"
+            byte_range = None
+            if "range" in request.headers and _range_allowed(request, etag, last_modified):
+                try:
+                    byte_range = parse_range(request.headers["range"], size)
+                except RangeNotSatisfiable:
+                    self.status_code, self.count = 416, 0
+                    headers["content-range"] = f"bytes */{size}"
+                    kind = "unsatisfiable"
+            if byte_range is not None:
+                first, last = byte_range
+                self.status_code, self.offset, self.count = 206, first, last - first + 1
+                headers["content-range"] = f"bytes {first}-{last}/{size}"
+                kind = "partial"
+            if self.status_code != 304:
+                headers["content-length"] = str(self.count)
+        self.full_file = self.status_code == 200
+        self.init_headers(headers)
+        DOWNLOADS.inc(kind)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        try:
+            await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+            if scope["method"] == "HEAD" or not self.count:
+                await send({"type": "http.response.body", "body": b""})
+                return
+
+            extensions = scope.get("extensions") or {}
+            if "http.response.zerocopysend" in extensions:
+                await send({"type": "http.response.zerocopysend", "file": self.file,
+                            "offset": self.offset, "count": self.count})
+                DOWNLOAD_BYTES.inc("zerocopysend", amount=self.count)
+            elif self.full_file and "http.response.pathsend" in extensions and self._unchanged():
+                # Sent by path, so only while it still names the file the
+                # headers describe
+                await send({"type": "http.response.pathsend", "path": self.path})
+                DOWNLOAD_BYTES.inc("pathsend", amount=self.count)
+            else:
+                await self._send_chunks(receive, send)
+        finally:
+            self.file.close()
+
+    def _unchanged(self) -> bool:
+        try:
+            return make_etag(os.stat(self.path)) == self.etag
+        except OSError:
+            return False
+
+    async def _send_chunks(self, receive: Receive, send: Send):
+        async def wait_for_disconnect():
+            while (await receive())["type"] != "http.disconnect":
+                pass
+
+        disconnected = asyncio.ensure_future(wait_for_disconnect())
+        fd, offset, remaining = self.file.fileno(), self.offset, self.count
+        try:
+            while remaining and not disconnected.done():
+                chunk = await asyncio.to_thread(os.pread, fd, min(settings.DOWNLOAD_CHUNK_SIZE, remaining), offset)
+                if not chunk:
+                    break  # Truncated since it was opened
+                offset += len(chunk)
+                remaining -= len(chunk)
+                await send({"type": "http.response.body", "body": chunk, "more_body": bool(remaining)})
+                DOWNLOAD_BYTES.inc("read", amount=len(chunk))
+        finally:
+            disconnected.cancel()
+
+async def file_download(request: Request, root: str, relative_path: str, filename: Optional[str] = None,
+                        media_type: Optional[str] = None) -> FileDownload:
+    """Range-capable download of ``relative_path`` under ``root``"""
+    path = resolve_path(root, relative_path)
+    try:
+        file = await asyncio.to_thread(open, path, "rb")
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="File not found")
+    return FileDownload(request, file, path, filename, media_type)
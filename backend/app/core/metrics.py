@@ -0,0 +1,318 @@
+"""
+Prometheus-style metrics: a small in-process registry, request/WebSocket
+instrumentation middleware, SQLAlchemy engine hooks and background job timing
+
+Exposed in the Prometheus text format (0.0.4) at /metrics.
+"""
+import asyncio
+import contextvars
+import math
+import time
+from contextlib import asynccontextmanager
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+CONTENT_TYPE = "text/plain; version=0.0.4"
+
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+JOB_BUCKETS = (0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0, 1800.0)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+
+LabelValues = Tuple[str, ...]
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+class Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.values: Dict[LabelValues, float] = {}
+
+    def inc(self, *labels: str, amount: float = 1.0):
+        self.values[labels] = self.values.get(labels, 0.0) + amount
+
+    def collect(self) -> List[str]:
+        return self.header() + [
+            f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}"
+            for labels, value in sorted(self.values.items())
+        ]
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, *labels: str, amount: float = 1.0):
+        self.inc(*labels, amount=-amount)
+
+    def set(self, *labels: str, value: float):
+        self.values[labels] = value
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # labels -> [per-bucket counts..., sum, count]
+        self.values: Dict[LabelValues, List[float]] = {}
+
+    def observe(self, value: float, *labels: str):
+        state = self.values.get(labels)
+        if state is None:
+            state = self.values[labels] = [0] * len(self.buckets) + [0.0, 0]
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                state[i] += 1
+                break
+        state[-2] += value
+        state[-1] += 1
+
+    def collect(self) -> List[str]:
+        lines = self.header()
+        for labels, state in sorted(self.values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, state):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {cumulative}")
+            inf = 'le="+Inf"'
+            lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, labels, inf)} {state[-1]}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, labels)} {_format_value(state[-2])}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, labels)} {state[-1]}")
+        return lines
+
+class Registry:
+    def __init__(self):
+        self.metrics: List[Metric] = []
+
+    def register(self, metric: Metric) -> Metric:
+        self.metrics.append(metric)
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.collect())
+        return "\n".join(lines) + "\n"
+
+registry = Registry()
+
+HTTP_REQUESTS = registry.counter(
+    "otg_http_requests_total", "HTTP requests by route template and status", ("method", "route", "status"))
+HTTP_DURATION = registry.histogram(
+    "otg_http_request_duration_seconds", "HTTP request latency", ("method", "route"))
+HTTP_IN_PROGRESS = registry.gauge(
+    "otg_http_requests_in_progress", "HTTP requests currently being served", ("method",))
+HTTP_DB_SECONDS = registry.histogram(
+    "otg_http_request_db_seconds", "Database time spent per HTTP request", ("method", "route"))
+HTTP_DB_QUERIES = registry.histogram(
+    "otg_http_request_db_queries", "Database statements executed per HTTP request", ("method", "route"),
+    buckets=COUNT_BUCKETS)
+DB_QUERIES = registry.counter(
+    "otg_db_queries_total", "Database statements executed", ("operation",))
+DB_DURATION = registry.histogram(
+    "otg_db_query_duration_seconds", "Database statement latency", ("operation",))
+DB_POOL_CHECKED_OUT = registry.gauge(
+    "otg_db_pool_connections_checked_out", "Pooled database connections in use")
+WS_CONNECTIONS = registry.gauge(
+    "otg_websocket_connections", "Open WebSocket connections", ("route",))
+WS_CONNECTIONS_TOTAL = registry.counter(
+    "otg_websocket_connections_total", "WebSocket connections accepted", ("route",))
+WS_MESSAGES = registry.counter(
+    "otg_websocket_messages_total", "WebSocket messages by direction", ("route", "direction"))
+WS_BROADCASTS = registry.counter(
+    "otg_websocket_broadcasts_total", "Messages broadcast to WebSocket clients", ("channel",))
+WS_BROADCAST_RECIPIENTS = registry.counter(
+    "otg_websocket_broadcast_recipients_total", "Broadcast deliveries to WebSocket clients", ("channel",))
+JOB_DURATION = registry.histogram(
+    "otg_job_duration_seconds", "Background job duration", ("job",), buckets=JOB_BUCKETS)
+JOB_RUNS = registry.counter(
+    "otg_job_runs_total", "Background job runs by outcome", ("job", "status"))
+JOBS_IN_PROGRESS = registry.gauge(
+    "otg_jobs_in_progress", "Background jobs currently running", ("job",))
+CERT_POOL_KEYS = registry.gauge(
+    "otg_cert_pool_keys", "Pre-generated client keys ready to issue")
+CERT_POOL_GENERATING = registry.gauge(
+    "otg_cert_pool_generating", "Client keys being generated for the pool")
+CERT_POOL_MISSES = registry.counter(
+    "otg_cert_pool_misses_total", "Client keys generated on demand because the pool was empty")
+CERT_ISSUED = registry.counter(
+    "otg_cert_issued_total", "Client certificates issued")
+CERT_KEYGEN_SECONDS = registry.histogram(
+    "otg_cert_keygen_duration_seconds", "Client key generation time, including queueing for a worker",
+    buckets=JOB_BUCKETS)
+DOWNLOADS = registry.counter(
+    "otg_downloads_total", "File downloads by outcome (full, partial, not_modified, unsatisfiable)", ("kind",))
+DOWNLOAD_BYTES = registry.counter(
+    "otg_download_bytes_total", "File download bytes by send path (pathsend, zerocopysend, read)", ("mode",))
+UPLOADS = registry.counter(
+    "otg_resumable_uploads_total", "Resumable uploads by event (created, completed, checksum_mismatch, expired)",
+    ("event",))
+UPLOAD_BYTES = registry.counter(
+    "otg_resumable_upload_bytes_total", "Bytes written to resumable uploads")
+
+# Per-request [db seconds, statement count], set by the middleware
+_request_db: contextvars.ContextVar[Optional[List[float]]] = contextvars.ContextVar("request_db", default=None)
+
+def _route_label(scope: Scope) -> str:
+    route = scope.get("route")
+    return getattr(route, "path", None) or "unmatched"
+
+class MetricsMiddleware:
+    """
+    Times HTTP requests per route template (path parameters are not labels),
+    attributes database time to the request, and tracks WebSocket sessions
+    """
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] == "websocket":
+            await self._websocket(scope, receive, send)
+            return
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        status = 500
+        db = [0.0, 0]
+        token = _request_db.set(db)
+        HTTP_IN_PROGRESS.inc(method)
+        started = time.perf_counter()
+
+        async def send_with_status(message: Message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - started
+            _request_db.reset(token)
+            HTTP_IN_PROGRESS.dec(method)
+            route = _route_label(scope)
+            HTTP_REQUESTS.inc(method, route, str(status))
+            HTTP_DURATION.observe(elapsed, method, route)
+            HTTP_DB_SECONDS.observe(db[0], method, route)
+            HTTP_DB_QUERIES.observe(db[1], method, route)
+
+    async def _websocket(self, scope: Scope, receive: Receive, send: Send):
+        accepted = False
+
+        async def counting_receive() -> Message:
+            message = await receive()
+            if message["type"] == "websocket.receive":
+                WS_MESSAGES.inc(_route_label(scope), "in")
+            return message
+
+        async def counting_send(message: Message):
+            nonlocal accepted
+            route = _route_label(scope)
+            if message["type"] == "websocket.accept" and not accepted:
+                accepted = True
+                WS_CONNECTIONS.inc(route)
+                WS_CONNECTIONS_TOTAL.inc(route)
+            elif message["type"] == "websocket.send":
+                WS_MESSAGES.inc(route, "out")
+            await send(message)
+
+        try:
+            await self.app(scope, counting_receive, counting_send)
+        finally:
+            if accepted:
+                WS_CONNECTIONS.dec(_route_label(scope))
+
+def instrument_engine(engine: AsyncEngine):
+    """Time every statement and count pool checkouts on an async engine"""
+    sync_engine = engine.sync_engine
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def _before_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def _after_execute(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info["query_started"].pop()
+        elapsed = time.perf_counter() - started
+        operation = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else "OTHER"
+        DB_QUERIES.inc(operation)
+        DB_DURATION.observe(elapsed, operation)
+        db = _request_db.get()
+        if db is not None:
+            db[0] += elapsed
+            db[1] += 1
+
+    @event.listens_for(sync_engine, "handle_error")
+    def _on_error(exception_context):
+        connection = exception_context.connection
+        if connection is not None and connection.info.get("query_started"):
+            connection.info["query_started"].pop()
+
+    @event.listens_for(sync_engine.pool, "checkout")
+    def _on_checkout(dbapi_connection, connection_record, connection_proxy):
+        DB_POOL_CHECKED_OUT.inc()
+
+    @event.listens_for(sync_engine.pool, "checkin")
+    def _on_checkin(dbapi_connection, connection_record):
+        DB_POOL_CHECKED_OUT.dec()
+
+def record_broadcast(channel: str, recipients: int):
+    WS_BROADCASTS.inc(channel)
+    WS_BROADCAST_RECIPIENTS.inc(channel, amount=recipients)
+
+@asynccontextmanager
+async def track_job(job: str):
+    """Time a background job and count its outcome"""
+    JOBS_IN_PROGRESS.inc(job)
+    started = time.perf_counter()
+    status = "failed"
+    try:
+        yield
+        status = "completed"
+    except asyncio.CancelledError:
+        status = "cancelled"
+        raise
+    finally:
+        JOBS_IN_PROGRESS.dec(job)
+        JOB_DURATION.observe(time.perf_counter() - started, job)
+        JOB_RUNS.inc(job, status)
@@ -0,0 +1,49 @@
+"""
+Versioned schema migrations
+
+New tables are created by ``Base.metadata.create_all``; migrations bring
+existing databases up to date with changes to tables that already exist.
+Each migration runs once and is recorded in the ``schema_migrations`` table.
+"""
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+# Arbitrary key so concurrently starting nodes don't migrate the same database twice
+MIGRATION_LOCK_ID = 7_423_001
+
+MIGRATIONS = [
+    (
+        1,
+        "Add indexes for POI category, shared note listing and metrics history",
+        [
+            "CREATE INDEX IF NOT EXISTS ix_pois_category ON pois (category)",
+            "CREATE INDEX IF NOT EXISTS ix_notes_shared_created_at ON notes (shared, created_at)",
+            "CREATE INDEX IF NOT EXISTS ix_server_metrics_timestamp ON server_metrics (timestamp)",
+        ],
+    ),
+]
+
+async def run_migrations(conn: AsyncConnection):
+    """Apply pending migrations inside the caller's transaction"""
+    if conn.dialect.name == "postgresql":
+        await conn.execute(text(f"SELECT pg_advisory_xact_lock({MIGRATION_LOCK_ID})"))
+
+    await conn.execute(text(
+        "CREATE TABLE IF NOT EXISTS schema_migrations ("
+        "version INTEGER PRIMARY KEY, "
+        "description VARCHAR NOT NULL, "
+        "applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)"
+    ))
+    result = await conn.execute(text("SELECT version FROM schema_migrations"))
+    applied = {row[0] for row in result}
+
+    for version, description, statements in MIGRATIONS:
+        if version in applied:
+            continue
+        for statement in statements:
+            await conn.execute(text(statement))
+        await conn.execute(
+            text("INSERT INTO schema_migrations (version, description) VALUES (:version, :description)"),
+            {"version": version, "description": description}
+        )
+        print(f"Applied schema migration {version}: {description}")
@@ -0,0 +1,239 @@
+"""
+On-demand request profiling and slow-request capture
+
+A single background thread samples the stack of each profiled request's
+asyncio task every PROFILING_INTERVAL_MS: the live Python stack while the task
+is running, or its coroutine await chain (marked ``[awaiting]``) while it is
+suspended on I/O. Samples are aggregated as folded stacks, the input format of
+flamegraph.pl and speedscope.
+
+A request is profiled when it carries the admin header with
+PROFILING_ADMIN_TOKEN, is picked at PROFILING_SAMPLE_RATE, or - when
+PROFILING_SLOW_REQUEST_MS is set - always, keeping the profile only if the
+request turns out slow. Kept profiles go to a bounded on-disk ring in
+PROFILING_DIR. With PROFILING_ENABLED off the middleware is not installed.
+"""
+import asyncio
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from starlette.datastructures import Headers
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.core.config import settings
+
+PROFILE_HEADER = "x-otg-profile"
+MAX_STACK_DEPTH = 128
+
+class RequestProfile:
+    def __init__(self, task: asyncio.Task, loop: asyncio.AbstractEventLoop, thread_id: int, reason: str):
+        self.id = uuid.uuid4().hex[:12]
+        self.task = task
+        self.loop = loop
+        self.thread_id = thread_id
+        self.reason = reason
+        self.stacks: Counter = Counter()
+        self.samples = 0
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    module = frame.f_globals.get("__name__", os.path.basename(code.co_filename))
+    return f"{module}:{code.co_name}:{frame.f_lineno}"
+
+def _running_stack(frame) -> List[str]:
+    """Thread stack, root first, trimmed to the frames above the event loop"""
+    frames = []
+    while frame is not None and len(frames) < MAX_STACK_DEPTH:
+        if frame.f_code.co_name == "_run" and frame.f_code.co_filename.endswith(os.path.join("asyncio", "events.py")):
+            break
+        frames.append(_frame_label(frame))
+        frame = frame.f_back
+    return frames[::-1]
+
+def _awaiting_stack(task: asyncio.Task) -> List[str]:
+    """Coroutine await chain of a suspended task, root first"""
+    frames = []
+    awaitable = task.get_coro()
+    while awaitable is not None and len(frames) < MAX_STACK_DEPTH:
+        frame = getattr(awaitable, "cr_frame", None) or getattr(awaitable, "gi_frame", None)
+        if frame is None:
+            break
+        frames.append(_frame_label(frame))
+        awaitable = getattr(awaitable, "cr_await", None) or getattr(awaitable, "gi_yieldfrom", None)
+    return frames + ["[awaiting]"]
+
+class StackSampler:
+    """
+    Background sampler for the requests currently being profiled. The thread
+    sleeps on an event while nothing is being profiled.
+    """
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.active: Dict[str, RequestProfile] = {}
+        self._wake = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def add(self, profile: RequestProfile):
+        with self._lock:
+            self.active[profile.id] = profile
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="request-profiler", daemon=True)
+                self._thread.start()
+        self._wake.set()
+
+    def remove(self, profile: RequestProfile) -> Counter:
+        """Stop sampling a profile and return a snapshot of its stacks"""
+        with self._lock:
+            self.active.pop(profile.id, None)
+            if not self.active:
+                self._wake.clear()
+            return profile.stacks.copy()
+
+    def _run(self):
+        while True:
+            self._wake.wait()
+            time.sleep(self.interval)
+            with self._lock:
+                profiles = list(self.active.values())
+            if not profiles:
+                continue
+            frames = sys._current_frames()
+            samples = []
+            for profile in profiles:
+                try:
+                    running = asyncio.current_task(profile.loop) is profile.task
+                    if running and profile.thread_id in frames:
+                        stack = _running_stack(frames[profile.thread_id])
+                    else:
+                        stack = _awaiting_stack(profile.task)
+                except Exception:
+                    # The task may finish or switch while we look at it
+                    continue
+                if stack:
+                    samples.append((profile, ";".join(stack)))
+            with self._lock:
+                # Profiles removed meanwhile are being saved; leave them alone
+                for profile, stack in samples:
+                    if profile.id in self.active:
+                        profile.stacks[stack] += 1
+                        profile.samples += 1
+
+class ProfileRing:
+    """
+    Folded-stack profiles on disk, oldest removed beyond ``size``. Each profile
+    is ``<id>.folded`` plus ``<id>.json`` metadata.
+    """
+    def __init__(self, directory: str, size: int):
+        self.directory = directory
+        self.size = size
+
+    def save(self, profile_id: str, stacks: Counter, meta: Dict) -> str:
+        os.makedirs(self.directory, exist_ok=True)
+        name = f"{datetime.now().strftime('%Y%m%d%H%M%S%f')}_{profile_id}"
+        with open(os.path.join(self.directory, f"{name}.folded"), 'w') as f:
+            for stack, count in stacks.most_common():
+                f.write(f"{stack} {count}\n")
+        with open(os.path.join(self.directory, f"{name}.json"), 'w') as f:
+            json.dump({"id": name, **meta}, f, indent=2)
+        self._trim()
+        return name
+
+    def _trim(self):
+        names = sorted(f[:-len(".json")] for f in os.listdir(self.directory) if f.endswith(".json"))
+        for name in names[:max(0, len(names) - self.size)]:
+            for suffix in (".json", ".folded"):
+                try:
+                    os.remove(os.path.join(self.directory, name + suffix))
+                except FileNotFoundError:
+                    pass
+
+    def list(self) -> List[Dict]:
+        if not os.path.exists(self.directory):
+            return []
+        profiles = []
+        for file in sorted(os.listdir(self.directory), reverse=True):
+            if file.endswith(".json"):
+                with open(os.path.join(self.directory, file), 'r') as f:
+                    profiles.append(json.load(f))
+        return profiles
+
+    def path(self, name: str) -> Optional[str]:
+        if not re.fullmatch(r"[0-9]+_[0-9a-f]+", name):
+            return None
+        path = os.path.join(self.directory, f"{name}.folded")
+        return path if os.path.exists(path) else None
+
+sampler = StackSampler(settings.PROFILING_INTERVAL_MS / 1000)
+profile_ring = ProfileRing(settings.PROFILING_DIR, settings.PROFILING_RING_SIZE)
+
+class ProfilingMiddleware:
+    """
+    Decides per request whether to profile it and stores kept profiles
+    """
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    def _reason(self, scope: Scope) -> Optional[str]:
+        token = settings.PROFILING_ADMIN_TOKEN
+        if token and Headers(scope=scope).get(PROFILE_HEADER) == token:
+            return "requested"
+        if settings.PROFILING_SAMPLE_RATE and random.random() < settings.PROFILING_SAMPLE_RATE:
+            return "sampled"
+        if settings.PROFILING_SLOW_REQUEST_MS > 0:
+            return "slow"  # Tentative: kept only if the request is slow
+        return None
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        reason = self._reason(scope) if scope["type"] == "http" else None
+        if reason is None:
+            await self.app(scope, receive, send)
+            return
+
+        loop = asyncio.get_running_loop()
+        profile = RequestProfile(asyncio.current_task(), loop, threading.get_ident(), reason)
+        status = 500
+
+        async def send_with_profile_id(message: Message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if reason != "slow":
+                    message.setdefault("headers", []).append((b"x-otg-profile-id", profile.id.encode()))
+            await send(message)
+
+        started = time.perf_counter()
+        sampler.add(profile)
+        try:
+            await self.app(scope, receive, send_with_profile_id)
+        finally:
+            stacks = sampler.remove(profile)
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            if reason != "slow" or elapsed_ms >= settings.PROFILING_SLOW_REQUEST_MS:
+                route = scope.get("route")
+                meta = {
+                    "request_id": profile.id,
+                    "reason": reason,
+                    "method": scope["method"],
+                    "path": scope["path"],
+                    "route": getattr(route, "path", None),
+                    "status": status,
+                    "duration_ms": round(elapsed_ms, 1),
+                    "samples": sum(stacks.values()),
+                    "interval_ms": settings.PROFILING_INTERVAL_MS,
+                    "captured_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                }
+                try:
+                    await loop.run_in_executor(None, profile_ring.save, profile.id, stacks, meta)
+                except Exception as e:
+                    # Never fail the request over its profile
+                    print(f"Profiling: could not save profile - {e}")
@@ -0,0 +1,20 @@
+"""
+JSON response class selection
+
+orjson is used when installed (several times faster than the stdlib encoder,
+and it emits compact bytes directly); otherwise the standard JSONResponse.
+"""
+from typing import Any
+
+from fastapi.responses import JSONResponse, ORJSONResponse
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional dependency
+    orjson = None
+
+DefaultJSONResponse = ORJSONResponse if orjson is not None else JSONResponse
+
+def render_json(content: Any) -> bytes:
+    """Encode already jsonable content with the default response encoder"""
+    return DefaultJSONResponse(content=content).body
@@ -0,0 +1,84 @@
+"""
+Startup import profiler
+
+Times the execution of every module imported after ``enable()`` and prints the
+slowest ones, with total startup time and peak RSS, once the app has started.
+Enabled with the STARTUP_PROFILE environment variable; it is read directly
+rather than through Settings because it has to be installed before anything
+else is imported. Standard library only, for the same reason.
+"""
+import importlib.abc
+import os
+import resource
+import sys
+import time
+from typing import Dict, List, Optional, Tuple
+
+REPORT_TOP = 25
+
+_started: Optional[float] = None
+# module -> [inclusive seconds, self seconds]
+_timings: Dict[str, List[float]] = {}
+_stack: List[List[float]] = []  # [started, child seconds] per module being executed
+
+def requested() -> bool:
+    return os.getenv("STARTUP_PROFILE", "").lower() in ("1", "true", "yes", "on")
+
+def enabled() -> bool:
+    return _started is not None
+
+def _timed_exec(name: str, exec_module):
+    def exec_timed(module):
+        frame = [time.perf_counter(), 0.0]
+        _stack.append(frame)
+        try:
+            exec_module(module)
+        finally:
+            _stack.pop()
+            inclusive = time.perf_counter() - frame[0]
+            _timings[name] = [inclusive, inclusive - frame[1]]
+            if _stack:
+                _stack[-1][1] += inclusive
+    return exec_timed
+
+class _TimingFinder(importlib.abc.MetaPathFinder):
+    """Finds modules through the remaining finders and times their loaders"""
+    def find_spec(self, fullname, path, target=None):
+        for finder in sys.meta_path:
+            if finder is self or not hasattr(finder, "find_spec"):
+                continue
+            spec = finder.find_spec(fullname, path, target)
+            if spec is None:
+                continue
+            loader = spec.loader
+            # Built-in and frozen importers are classes shared by every module
+            if loader is not None and not isinstance(loader, type) and hasattr(loader, "exec_module"):
+                loader.exec_module = _timed_exec(fullname, loader.exec_module)
+            return spec
+        return None
+
+def enable():
+    global _started
+    if _started is None:
+        _started = time.perf_counter()
+        sys.meta_path.insert(0, _TimingFinder())
+
+def disable():
+    sys.meta_path[:] = [finder for finder in sys.meta_path if not isinstance(finder, _TimingFinder)]
+
+def slowest(top: int = REPORT_TOP) -> List[Tuple[str, float, float]]:
+    """(module, self ms, inclusive ms), slowest self time first"""
+    ranked = sorted(_timings.items(), key=lambda item: item[1][1], reverse=True)[:top]
+    return [(name, self_s * 1000, inclusive * 1000) for name, (inclusive, self_s) in ranked]
+
+def report(top: int = REPORT_TOP):
+    """Print startup time, peak RSS and the slowest module imports"""
+    if _started is None:
+        return
+    disable()
+    elapsed_ms = (time.perf_counter() - _started) * 1000
+    peak_rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(f"Startup: {elapsed_ms:.0f} ms, {len(_timings)} modules imported, peak RSS {peak_rss_mb:.1f} MiB")
+    print(f"{'self ms':>9} {'total ms':>9}  module")
+    for name, self_ms, inclusive_ms in slowest(top):
+        print(f"{self_ms:9.1f} {inclusive_ms:9.1f}  {name}")
@@ -0,0 +1,29 @@
+"""
+WebSocket connection manager for real-time updates
+"""
+from fastapi import WebSocket
+
+from app.core.metrics import record_broadcast
+
+class ConnectionManager:
+    def __init__(self):
+        self.active_connections: list[WebSocket] = []
+
+    async def connect(self, websocket: WebSocket):
+        await websocket.accept()
+        self.active_connections.append(websocket)
+
+    def disconnect(self, websocket: WebSocket):
+        if websocket in self.active_connections:
+            self.active_connections.remove(websocket)
+
+    async def broadcast(self, message: dict):
+        record_broadcast("events", len(self.active_connections))
+        for connection in list(self.active_connections):
+            try:
+                await connection.send_json(message)
+            except Exception:
+                # Drop clients that went away without a clean disconnect
+                self.disconnect(connection)
+
+manager = ConnectionManager()
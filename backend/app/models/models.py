@@ -1,7 +1,7 @@
 """
 Database models
 """
-from sqlalchemy import Column, Integer, String, DateTime, Boolean, Text, JSON
+from sqlalchemy import Column, Integer, BigInteger, String, DateTime, Boolean, Text, JSON, Index, UniqueConstraint, LargeBinary
 from sqlalchemy.sql import func
 from app.core.database import Base
 
@@ -23,15 +23,33 @@ class POI(Base):
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String, nullable=False)
     description = Column(Text)
-    category = Column(String)
+    category = Column(String, index=True)
     latitude = Column(String)
     longitude = Column(String)
     poi_metadata = Column(JSON)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
 
+class POITrackChunk(Base):
+    """A window of POI position fixes, delta-encoded; zlib-compressed once sealed"""
+    __tablename__ = "poi_track_chunks"
+    __table_args__ = (
+        Index("ix_poi_track_chunks_poi_start", "poi_id", "start_ms"),
+    )
+    
+    id = Column(Integer, primary_key=True, index=True)
+    poi_id = Column(Integer, nullable=False)
+    start_ms = Column(BigInteger, nullable=False)  # Unix milliseconds of the first fix
+    end_ms = Column(BigInteger, nullable=False)  # Unix milliseconds of the last fix
+    fix_count = Column(Integer, nullable=False)
+    sealed = Column(Boolean, default=False)
+    data = Column(LargeBinary, nullable=False)
+
 class Note(Base):
     __tablename__ = "notes"
+    __table_args__ = (
+        Index("ix_notes_shared_created_at", "shared", "created_at"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     title = Column(String, nullable=False)
@@ -41,6 +59,22 @@ class Note(Base):
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
 
+class NoteRevision(Base):
+    """A note version stored as a compressed delta from the previous one, or a full keyframe"""
+    __tablename__ = "note_revisions"
+    __table_args__ = (
+        UniqueConstraint("note_id", "revision", name="uq_note_revisions_note_revision"),
+    )
+    
+    id = Column(Integer, primary_key=True, index=True)
+    note_id = Column(Integer, nullable=False, index=True)
+    revision = Column(Integer, nullable=False)
+    is_keyframe = Column(Boolean, default=False)
+    data = Column(LargeBinary, nullable=False)  # zlib: full text (keyframe) or JSON delta ops
+    content_length = Column(Integer)
+    author = Column(String)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
 class ServerMetrics(Base):
     __tablename__ = "server_metrics"
     
@@ -51,4 +85,20 @@ class ServerMetrics(Base):
     network_in = Column(Integer)
     network_out = Column(Integer)
     active_connections = Column(Integer)
-    timestamp = Column(DateTime(timezone=True), server_default=func.now())
+    timestamp = Column(DateTime(timezone=True), server_default=func.now(), index=True)
+
+class SyncChange(Base):
+    """Latest change per record; the id is the delta-sync cursor and deletes are tombstones"""
+    __tablename__ = "sync_changes"
+    __table_args__ = (
+        UniqueConstraint("entity", "entity_id", name="uq_sync_changes_entity"),
+        Index("ix_sync_changes_entity_id", "entity", "id"),
+        # Never reuse ids of replaced rows, or cursors could go backwards
+        {"sqlite_autoincrement": True},
+    )
+    
+    id = Column(Integer, primary_key=True)
+    entity = Column(String, nullable=False)  # 'poi' or 'note'
+    entity_id = Column(Integer, nullable=False)
+    operation = Column(String, nullable=False)  # 'upsert' or 'delete'
+    changed_at = Column(DateTime(timezone=True), server_default=func.now())
@@ -0,0 +1,382 @@
+"""
+Certificate Service - Local CA and a warm pool of client key pairs
+
+Client onboarding is bound by private key generation (an RSA-2048 key takes
+tens of milliseconds, far longer on field hardware), not by signing. A process
+pool keeps CERT_POOL_SIZE keys generated ahead of time; once the pool drops to
+CERT_POOL_LOW_WATERMARK it is topped back up in the background. Issuing a
+certificate then only takes a pooled key and signs it with the local CA.
+
+Issued credentials wait under CERT_DIR/pending until they are downloaded once
+as a PKCS#12 bundle through their enrollment token, which is what QR codes
+carry (a key and certificate bundle is too large for a QR code). Tokens not
+claimed within CERT_ENROLLMENT_TTL_HOURS are removed with their key, and no
+more are issued while CERT_MAX_PENDING_ENROLLMENTS are waiting.
+"""
+import asyncio
+import datetime
+import multiprocessing
+import os
+import secrets
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, List, Optional
+
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import ec, rsa
+from cryptography.hazmat.primitives.serialization import pkcs12
+from cryptography.x509.oid import ExtendedKeyUsageOID, NameOID
+
+from app.core.config import settings
+from app.core.metrics import CERT_ISSUED, CERT_KEYGEN_SECONDS, CERT_POOL_GENERATING, CERT_POOL_KEYS, CERT_POOL_MISSES
+
+def generate_key_der(key_type: str, key_size: int) -> bytes:
+    """New private key as unencrypted PKCS#8 DER (runs in pool workers)"""
+    if key_type == "ec":
+        key = ec.generate_private_key(ec.SECP256R1())
+    else:
+        key = rsa.generate_private_key(public_exponent=65537, key_size=key_size)
+    return key.private_bytes(serialization.Encoding.DER, serialization.PrivateFormat.PKCS8,
+                             serialization.NoEncryption())
+
+def load_key_der(data: bytes):
+    # Keys come from generate_key_der; OpenSSL's RSA consistency check costs
+    # more than signing, so it is skipped
+    return serialization.load_der_private_key(data, None, unsafe_skip_rsa_key_validation=True)
+
+def _process_context():
+    # Forking a process that runs threads and an event loop can copy their held
+    # locks into the child; start workers from a clean interpreter instead
+    methods = multiprocessing.get_all_start_methods()
+    return multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+
+def _write_private(path: str, data: bytes):
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, 'wb') as f:
+        f.write(data)
+
+class CertificateAuthority:
+    """
+    Self-signed CA kept as ca.key / ca.crt in CERT_DIR, created on first use
+    """
+    def __init__(self, directory: str = settings.CERT_DIR):
+        self.key_path = os.path.join(directory, "ca.key")
+        self.cert_path = os.path.join(directory, "ca.crt")
+        self.key = None
+        self.certificate: Optional[x509.Certificate] = None
+        self._lock = threading.Lock()
+
+    def load(self):
+        with self._lock:
+            if self.certificate is not None:
+                return
+            if os.path.exists(self.key_path) and os.path.exists(self.cert_path):
+                with open(self.key_path, 'rb') as f:
+                    self.key = serialization.load_pem_private_key(f.read(), None)
+                with open(self.cert_path, 'rb') as f:
+                    self.certificate = x509.load_pem_x509_certificate(f.read())
+                return
+            os.makedirs(os.path.dirname(self.key_path), exist_ok=True)
+            self.key = load_key_der(generate_key_der(settings.CERT_KEY_TYPE, settings.CERT_KEY_SIZE))
+            name = x509.Name([
+                x509.NameAttribute(NameOID.ORGANIZATION_NAME, settings.CERT_ORGANIZATION),
+                x509.NameAttribute(NameOID.COMMON_NAME, f"{settings.CERT_ORGANIZATION} Root CA"),
+            ])
+            now = datetime.datetime.now(datetime.timezone.utc)
+            self.certificate = (
+                x509.CertificateBuilder()
+                .subject_name(name)
+                .issuer_name(name)
+                .public_key(self.key.public_key())
+                .serial_number(x509.random_serial_number())
+                .not_valid_before(now - datetime.timedelta(minutes=5))
+                .not_valid_after(now + datetime.timedelta(days=settings.CERT_CA_VALIDITY_DAYS))
+                .add_extension(x509.BasicConstraints(ca=True, path_length=0), critical=True)
+                .add_extension(x509.KeyUsage(
+                    digital_signature=True, key_cert_sign=True, crl_sign=True, content_commitment=False,
+                    key_encipherment=False, data_encipherment=False, key_agreement=False,
+                    encipher_only=False, decipher_only=False), critical=True)
+                .add_extension(x509.SubjectKeyIdentifier.from_public_key(self.key.public_key()), critical=False)
+                .sign(self.key, hashes.SHA256())
+            )
+            _write_private(self.key_path, self.key.private_bytes(
+                serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()))
+            with open(self.cert_path, 'wb') as f:
+                f.write(self.certificate.public_bytes(serialization.Encoding.PEM))
+            print(f"Certificates: created local CA in {os.path.dirname(self.key_path)}")
+
+    def sign(self, key, common_name: str, days: int) -> x509.Certificate:
+        """Client certificate for ``key``"""
+        now = datetime.datetime.now(datetime.timezone.utc)
+        return (
+            x509.CertificateBuilder()
+            .subject_name(x509.Name([
+                x509.NameAttribute(NameOID.ORGANIZATION_NAME, settings.CERT_ORGANIZATION),
+                x509.NameAttribute(NameOID.COMMON_NAME, common_name),
+            ]))
+            .issuer_name(self.certificate.subject)
+            .public_key(key.public_key())
+            .serial_number(x509.random_serial_number())
+            .not_valid_before(now - datetime.timedelta(minutes=5))
+            .not_valid_after(now + datetime.timedelta(days=days))
+            .add_extension(x509.BasicConstraints(ca=False, path_length=None), critical=True)
+            .add_extension(x509.KeyUsage(
+                digital_signature=True, key_encipherment=isinstance(key, rsa.RSAPrivateKey),
+                key_agreement=isinstance(key, ec.EllipticCurvePrivateKey), content_commitment=False,
+                data_encipherment=False, key_cert_sign=False, crl_sign=False,
+                encipher_only=False, decipher_only=False), critical=True)
+            .add_extension(x509.ExtendedKeyUsage([ExtendedKeyUsageOID.CLIENT_AUTH]), critical=False)
+            .add_extension(x509.AuthorityKeyIdentifier.from_issuer_public_key(self.key.public_key()),
+                           critical=False)
+            .sign(self.key, hashes.SHA256())
+        )
+
+    def pem(self) -> bytes:
+        self.load()
+        return self.certificate.public_bytes(serialization.Encoding.PEM)
+
+class KeyPool:
+    """
+    Pre-generated private keys (PKCS#8 DER), refilled by a process pool.
+    Callers that find the pool empty are handed keys already being generated
+    before any more are started, so they never queue behind a whole refill.
+    """
+    def __init__(self, size: int = settings.CERT_POOL_SIZE,
+                 low_watermark: int = settings.CERT_POOL_LOW_WATERMARK,
+                 workers: int = settings.CERT_POOL_WORKERS,
+                 key_type: str = settings.CERT_KEY_TYPE,
+                 key_size: int = settings.CERT_KEY_SIZE):
+        self.size = size
+        self.low_watermark = min(low_watermark, size)
+        self.workers = workers
+        self.key_type = key_type
+        self.key_size = key_size
+        self.keys: deque = deque()
+        self.waiters: deque = deque()  # Futures of callers waiting for a key
+        self.generating = 0
+        self.generated = 0
+        self.taken = 0
+        self.misses = 0
+        self._executor: Optional[ProcessPoolExecutor] = None
+
+    def _generate(self):
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=_process_context())
+        started = time.perf_counter()
+        future = asyncio.get_running_loop().run_in_executor(
+            self._executor, generate_key_der, self.key_type, self.key_size)
+        future.add_done_callback(lambda f: CERT_KEYGEN_SECONDS.observe(time.perf_counter() - started))
+        future.add_done_callback(self._on_generated)
+        self.generating += 1
+
+    def _waiting(self) -> int:
+        while self.waiters and self.waiters[0].done():
+            self.waiters.popleft()  # Caller went away
+        return sum(1 for waiter in self.waiters if not waiter.done())
+
+    def _update_gauges(self):
+        CERT_POOL_KEYS.set(value=len(self.keys))
+        CERT_POOL_GENERATING.set(value=self.generating)
+
+    def refill(self):
+        """Top the pool up to its size once it is at or below the low watermark"""
+        supply = len(self.keys) + self.generating - self._waiting()
+        if self.size > 0 and supply <= self.low_watermark:
+            for _ in range(self.size - supply):
+                self._generate()
+        self._update_gauges()
+
+    def _on_generated(self, future: asyncio.Future):
+        self.generating -= 1
+        if future.cancelled():
+            return
+        error = future.exception()
+        if error is None:
+            self.generated += 1
+            self._deliver(future.result())
+        else:
+            if isinstance(error, BrokenProcessPool):
+                print(f"Certificates: key pool worker died, restarting pool - {error}")
+                self._executor = None
+            else:
+                print(f"Certificates: key generation failed - {error}")
+            if self._waiting():
+                self.waiters.popleft().set_exception(error)
+        self._update_gauges()
+
+    def _deliver(self, key: bytes):
+        if self._waiting():
+            self.waiters.popleft().set_result(key)
+        else:
+            self.keys.append(key)
+
+    async def take(self, count: int) -> List:
+        """
+        ``count`` private keys: pooled ones first, then keys already being
+        generated, then new ones generated in parallel across the workers
+        """
+        keys = [self.keys.popleft() for _ in range(min(count, len(self.keys)))]
+        shortfall = count - len(keys)
+        self.taken += len(keys)
+        if shortfall:
+            self.misses += shortfall
+            CERT_POOL_MISSES.inc(amount=shortfall)
+            loop = asyncio.get_running_loop()
+            waiters = [loop.create_future() for _ in range(shortfall)]
+            self.waiters.extend(waiters)
+            for _ in range(max(0, self._waiting() - self.generating)):
+                self._generate()
+            self._update_gauges()
+            keys.extend(await asyncio.gather(*waiters))
+        self.refill()
+        return [load_key_der(data) for data in keys]
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def stats(self) -> Dict:
+        return {
+            "available": len(self.keys),
+            "generating": self.generating,
+            "size": self.size,
+            "low_watermark": self.low_watermark,
+            "workers": self.workers,
+            "key_type": self.key_type,
+            "key_size": self.key_size if self.key_type == "rsa" else 256,
+            "generated": self.generated,
+            "taken_from_pool": self.taken,
+            "generated_on_demand": self.misses,
+        }
+
+PENDING_DIR = os.path.join(settings.CERT_DIR, "pending")
+ISSUED_DIR = os.path.join(settings.CERT_DIR, "issued")
+
+certificate_authority = CertificateAuthority()
+key_pool = KeyPool()
+
+class EnrollmentLimitError(Exception):
+    """Too many enrollment tokens are waiting to be claimed"""
+
+_reserved_enrollments = 0  # Being issued right now, not yet on disk
+
+def _record(certificate: x509.Certificate) -> Dict:
+    return {
+        "serial": format(certificate.serial_number, "x"),
+        "common_name": certificate.subject.get_attributes_for_oid(NameOID.COMMON_NAME)[0].value,
+        "not_before": certificate.not_valid_before_utc.isoformat(),
+        "not_after": certificate.not_valid_after_utc.isoformat(),
+        "sha256_fingerprint": certificate.fingerprint(hashes.SHA256()).hex(),
+    }
+
+def _sign_and_store(common_names: List[str], keys: List, days: int, include_private_key: bool) -> List[Dict]:
+    """Sign, serialize and store each certificate (runs in a worker thread)"""
+    os.makedirs(PENDING_DIR, exist_ok=True)
+    os.makedirs(ISSUED_DIR, exist_ok=True)
+    issued = []
+    for common_name, key in zip(common_names, keys):
+        certificate = certificate_authority.sign(key, common_name, days)
+        certificate_pem = certificate.public_bytes(serialization.Encoding.PEM)
+        key_pem = key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8,
+                                    serialization.NoEncryption())
+        record = _record(certificate)
+        token = secrets.token_urlsafe(24)
+        _write_private(os.path.join(PENDING_DIR, f"{token}.pem"), key_pem + certificate_pem)
+        with open(os.path.join(ISSUED_DIR, f"{record['serial']}.crt"), 'wb') as f:
+            f.write(certificate_pem)
+        result = {**record, "enrollment_token": token, "certificate_pem": certificate_pem.decode()}
+        if include_private_key:
+            result["private_key_pem"] = key_pem.decode()
+        issued.append(result)
+    return issued
+
+async def issue(common_names: List[str], days: int = settings.CERT_VALIDITY_DAYS,
+                include_private_key: bool = False) -> List[Dict]:
+    """
+    Sign a client certificate per common name. Each result carries the PEM
+    certificate and a one-time enrollment token for the PKCS#12 bundle, plus
+    the PEM private key only if include_private_key is set.
+    """
+    global _reserved_enrollments
+    if certificate_authority.certificate is None:
+        await asyncio.to_thread(certificate_authority.load)
+    await asyncio.to_thread(expire_enrollments)
+    pending = await asyncio.to_thread(count_pending_enrollments) + _reserved_enrollments
+    if pending + len(common_names) > settings.CERT_MAX_PENDING_ENROLLMENTS:
+        raise EnrollmentLimitError(
+            f"{pending} enrollments are unclaimed (limit {settings.CERT_MAX_PENDING_ENROLLMENTS}); "
+            f"claim them or wait for them to expire"
+        )
+    _reserved_enrollments += len(common_names)
+    try:
+        keys = await key_pool.take(len(common_names))
+        issued = await asyncio.to_thread(_sign_and_store, common_names, keys, days, include_private_key)
+    finally:
+        _reserved_enrollments -= len(common_names)
+    CERT_ISSUED.inc(amount=len(issued))
+    return issued
+
+def _expired(path: str) -> bool:
+    return os.path.getmtime(path) < time.time() - settings.CERT_ENROLLMENT_TTL_HOURS * 3600
+
+def expire_enrollments() -> int:
+    """Remove enrollment tokens (and their keys) unclaimed for CERT_ENROLLMENT_TTL_HOURS"""
+    if not os.path.exists(PENDING_DIR):
+        return 0
+    removed = 0
+    for file in os.listdir(PENDING_DIR):
+        path = os.path.join(PENDING_DIR, file)
+        try:
+            if file.endswith(".pem") and _expired(path):
+                os.remove(path)
+                removed += 1
+        except FileNotFoundError:
+            continue  # Claimed meanwhile
+    return removed
+
+def count_pending_enrollments() -> int:
+    if not os.path.exists(PENDING_DIR):
+        return 0
+    return sum(1 for file in os.listdir(PENDING_DIR) if file.endswith(".pem"))
+
+def claim_enrollment(token: str) -> Optional[Dict]:
+    """
+    PKCS#12 bundle (key, certificate and CA) for an enrollment token, which is
+    consumed. None if the token is unknown or already used.
+    """
+    if not token.replace("-", "").replace("_", "").isalnum():
+        return None
+    path = os.path.join(PENDING_DIR, f"{token}.pem")
+    try:
+        expired = _expired(path)
+        with open(path, 'rb') as f:
+            data = f.read()
+        os.remove(path)
+    except FileNotFoundError:
+        return None
+    if expired:
+        return None
+    certificate_authority.load()
+    key = serialization.load_pem_private_key(data, None, unsafe_skip_rsa_key_validation=True)
+    certificate = x509.load_pem_x509_certificate(data[data.index(b"-----BEGIN CERTIFICATE-----"):])
+    common_name = _record(certificate)["common_name"]
+    bundle = pkcs12.serialize_key_and_certificates(
+        common_name.encode(), key, certificate, [certificate_authority.certificate],
+        serialization.BestAvailableEncryption(settings.CERT_P12_PASSWORD.encode())
+    )
+    return {"common_name": common_name, "p12": bundle}
+
+def list_issued() -> List[Dict]:
+    if not os.path.exists(ISSUED_DIR):
+        return []
+    records = []
+    for file in sorted(os.listdir(ISSUED_DIR)):
+        if file.endswith(".crt"):
+            with open(os.path.join(ISSUED_DIR, file), 'rb') as f:
+                records.append(_record(x509.load_pem_x509_certificate(f.read())))
+    return records
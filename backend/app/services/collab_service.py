@@ -0,0 +1,201 @@
+"""
+Collab Service - Real-time collaborative note editing with operational transform
+
+Clients edit a note over a WebSocket by sending small text operations
+against the revision they last saw. The server transforms each operation
+against the operations applied since that revision, applies it, acks the
+sender and broadcasts the transformed operation to the other editors.
+Dirty sessions are periodically compacted into the ``Note`` row.
+
+Operations use the ot.js format described in ``app.utils.ot``.
+
+Sessions live in this process; in multi-node deployments editors of the
+same note must reach the same backend (e.g. sticky routing per note).
+"""
+import asyncio
+from typing import Dict, List, Optional, Set
+
+from fastapi import WebSocket
+from sqlalchemy import select
+
+from app.core.cache import response_cache
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal
+from app.core.metrics import record_broadcast, track_job
+from app.models.models import Note
+from app.services.revision_service import load_note_for_update, note_lock, record_revision
+from app.services.sync_service import record_change
+from app.utils.ot import OperationError, TextOperation, transform
+
+class NoteSession:
+    def __init__(self, note_id: int, content: str):
+        self.note_id = note_id
+        self.content = content
+        self.revision = 0
+        # Operations since revision ``history_base``; older ones are dropped
+        self.history: List[TextOperation] = []
+        self.history_base = 0
+        self.persisted_revision = 0
+        self.connections: Set[WebSocket] = set()
+        self.lock = asyncio.Lock()
+
+    @property
+    def dirty(self) -> bool:
+        return self.revision != self.persisted_revision
+
+    def apply_client_operation(self, revision: int, operation: TextOperation) -> TextOperation:
+        """Transform an operation made at revision against newer history and apply it"""
+        if revision > self.revision or revision < self.history_base:
+            raise OperationError("Revision out of range, resync required")
+        for concurrent in self.history[revision - self.history_base:]:
+            operation, _ = transform(operation, concurrent)
+        self.content = operation.apply(self.content)
+        self.history.append(operation)
+        self.revision += 1
+        overflow = len(self.history) - settings.COLLAB_HISTORY_LIMIT
+        if overflow > 0:
+            del self.history[:overflow]
+            self.history_base += overflow
+        return operation
+
+class CollabManager:
+    def __init__(self):
+        self.sessions: Dict[int, NoteSession] = {}
+        self._compactor: Optional[asyncio.Task] = None
+
+    async def join(self, note_id: int, websocket: WebSocket) -> Optional[NoteSession]:
+        """
+        Attach an accepted websocket to the note's session, loading it if
+        needed, and send it the current content and revision
+        """
+        while True:
+            session = self.sessions.get(note_id)
+            if session is None:
+                async with AsyncSessionLocal() as db:
+                    note = (await db.execute(select(Note).where(Note.id == note_id))).scalar_one_or_none()
+                if note is None:
+                    return None
+                # Another editor may have loaded the note while we were querying
+                session = self.sessions.setdefault(note_id, NoteSession(note_id, note.content or ""))
+            async with session.lock:
+                if self.sessions.get(note_id) is not session:
+                    continue  # Dropped by leave() while we waited; load it again
+                session.connections.add(websocket)
+                await websocket.send_json({
+                    "type": "init",
+                    "revision": session.revision,
+                    "content": session.content,
+                    "editors": len(session.connections)
+                })
+            return session
+
+    async def leave(self, note_id: int, websocket: WebSocket):
+        session = self.sessions.get(note_id)
+        if session is None:
+            return
+        session.connections.discard(websocket)
+        if session.connections:
+            return
+        try:
+            await self.compact(session)
+        except Exception as e:
+            # Still dirty, so the session is kept for the periodic compactor
+            print(f"Failed to compact note {note_id}: {e}")
+        async with session.lock:
+            # Editors may have rejoined, or a queued compaction not run yet
+            if not session.connections and not session.dirty and self.sessions.get(note_id) is session:
+                self.sessions.pop(note_id, None)
+
+    async def submit(self, note_id: int, websocket: WebSocket, revision: int, ops: List):
+        """
+        Apply a client operation, broadcast it to the other editors and ack the
+        sender. Both happen under the session lock so every editor sees
+        messages in revision order.
+        """
+        session = self.sessions[note_id]
+        async with session.lock:
+            operation = session.apply_client_operation(revision, TextOperation.from_json(ops))
+            message = {"type": "op", "revision": session.revision, "ops": operation.to_json()}
+            await self._broadcast(session, message, exclude=websocket)
+            await websocket.send_json({"type": "ack", "revision": session.revision})
+
+    async def replace_content(self, note_id: int, content: str):
+        """Push a whole-note replacement (e.g. a REST update) to live editors"""
+        session = self.sessions.get(note_id)
+        if session is None:
+            return
+        async with session.lock:
+            operation = TextOperation().delete(len(session.content)).insert(content)
+            operation = session.apply_client_operation(session.revision, operation)
+            session.persisted_revision = session.revision
+            await self._broadcast(session, {"type": "op", "revision": session.revision, "ops": operation.to_json()})
+
+    async def close(self, note_id: int):
+        """Disconnect every editor of a deleted note"""
+        session = self.sessions.pop(note_id, None)
+        if session is None:
+            return
+        for connection in list(session.connections):
+            try:
+                await connection.close(code=4404)
+            except Exception:
+                pass
+
+    async def compact(self, session: NoteSession):
+        """Write the session's current content to the Note row if it changed"""
+        # Per note rather than per session, so a compaction still queued when
+        # its session is dropped is serialized with the next session's, and
+        # shared with REST updates, which record revisions too
+        async with note_lock(session.note_id):
+            async with session.lock:
+                if not session.dirty:
+                    return
+                content, revision = session.content, session.revision
+            async with AsyncSessionLocal() as db:
+                note = await load_note_for_update(db, session.note_id)
+                if note is None:
+                    return
+                await record_revision(db, session.note_id, note.content, content, "collaborative")
+                note.content = content
+                await record_change(db, "note", session.note_id, "upsert")
+                await db.commit()
+            session.persisted_revision = revision
+        response_cache.invalidate(f"notes:get:{session.note_id}")
+        response_cache.invalidate_prefix("notes:list:")
+
+    async def compact_all(self):
+        if not self.sessions:
+            return
+        async with track_job("collab_compaction"):
+            for session in list(self.sessions.values()):
+                try:
+                    await self.compact(session)
+                except Exception as e:
+                    print(f"Failed to compact note {session.note_id}: {e}")
+
+    def start(self):
+        if self._compactor is None:
+            self._compactor = asyncio.create_task(self._compact_loop())
+
+    async def stop(self):
+        if self._compactor is not None:
+            self._compactor.cancel()
+            self._compactor = None
+        await self.compact_all()
+
+    async def _compact_loop(self):
+        while True:
+            await asyncio.sleep(settings.COLLAB_COMPACT_INTERVAL_SECONDS)
+            await self.compact_all()
+
+    async def _broadcast(self, session: NoteSession, message: Dict, exclude: Optional[WebSocket] = None):
+        record_broadcast("notes", len(session.connections) - (exclude in session.connections))
+        for connection in list(session.connections):
+            if connection is exclude:
+                continue
+            try:
+                await connection.send_json(message)
+            except Exception:
+                session.connections.discard(connection)
+
+collab_manager = CollabManager()
@@ -0,0 +1,202 @@
+"""
+CoT Service - Cursor-on-Target serialization for TAK clients
+
+Converts POIs, route waypoints and SDR checkpoints into CoT events and
+encodes them either as CoT XML or as TAK Protocol version 1 protobuf
+(``TakMessage`` / ``CotEvent``), written with a minimal hand-rolled protobuf
+encoder so no generated code is needed. Encoders are generators that yield
+batches, so large exports stream instead of being built in memory.
+"""
+import struct
+import xml.etree.ElementTree as ET
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterable, Iterator, List, Optional
+
+# TAK Protocol v1 magic byte used in stream framing
+TAK_MAGIC = 0xBF
+
+DEFAULT_STALE = timedelta(days=1)
+BATCH_SIZE = 256
+
+# POI categories to CoT types (MIL-STD-2525 style atoms, unknown affiliation)
+CATEGORY_TYPES = {
+    "person": "a-u-G",
+    "vehicle": "a-u-G-E-V",
+    "structure": "a-u-G-I",
+}
+DEFAULT_POI_TYPE = "b-m-p-s-m"  # Spot map marker
+WAYPOINT_TYPE = "b-m-p-w"
+CHECKPOINT_TYPE = "b-m-p-c-cp"
+
+MEDIA_TYPES = {
+    "xml": "application/xml",
+    "protobuf": "application/x-protobuf",
+}
+
+def _event(uid: str, cot_type: str, lat: float, lon: float, callsign: str,
+           remarks: str = "", hae: float = 0.0, now: Optional[datetime] = None,
+           stale: timedelta = DEFAULT_STALE) -> Dict:
+    now = now or datetime.now(timezone.utc)
+    return {
+        "uid": uid,
+        "type": cot_type,
+        "how": "h-g-i-g-o",  # Human entered, GPS-derived
+        "time": now,
+        "start": now,
+        "stale": now + stale,
+        "lat": lat,
+        "lon": lon,
+        "hae": hae,
+        "ce": 9999999.0,
+        "le": 9999999.0,
+        "callsign": callsign,
+        "remarks": remarks,
+    }
+
+def poi_events(pois: Iterable, now: Optional[datetime] = None) -> Iterator[Dict]:
+    """CoT events for POI rows; POIs without valid coordinates are skipped"""
+    for poi in pois:
+        try:
+            lat, lon = float(poi.latitude), float(poi.longitude)
+        except (TypeError, ValueError):
+            continue
+        yield _event(
+            f"otg-poi-{poi.id}",
+            CATEGORY_TYPES.get((poi.category or "").lower(), DEFAULT_POI_TYPE),
+            lat, lon, poi.name, poi.description or "", now=now
+        )
+
+def waypoint_events(route_name: str, waypoints: Iterable, now: Optional[datetime] = None) -> Iterator[Dict]:
+    """CoT events for route waypoints"""
+    for i, wp in enumerate(waypoints):
+        yield _event(
+            f"otg-route-{route_name}-{i}", WAYPOINT_TYPE,
+            wp.latitude, wp.longitude, wp.name, wp.description or "",
+            hae=wp.elevation or 0.0, now=now
+        )
+
+def checkpoint_events(sdr_id: str, checkpoints: Iterable[Dict], now: Optional[datetime] = None) -> Iterator[Dict]:
+    """CoT events for SDR checkpoints (as stored in the SDR JSON)"""
+    for i, cp in enumerate(checkpoints):
+        remarks = f"{cp.get('observation_type', '')} | threat: {cp.get('threat_level', 'low')}"
+        if cp.get("notes"):
+            remarks += f" | {cp['notes']}"
+        yield _event(
+            f"otg-{sdr_id}-cp{i}", CHECKPOINT_TYPE,
+            cp["latitude"], cp["longitude"], cp["name"], remarks, now=now
+        )
+
+def _cot_time(value: datetime) -> str:
+    return value.astimezone(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%f")[:-3] + "Z"
+
+def _detail_xml(event: Dict) -> ET.Element:
+    detail = ET.Element("detail")
+    ET.SubElement(detail, "contact", callsign=event["callsign"])
+    if event["remarks"]:
+        remarks = ET.SubElement(detail, "remarks")
+        remarks.text = event["remarks"]
+    return detail
+
+def event_to_xml(event: Dict) -> bytes:
+    """Serialize one event as a CoT XML <event> element"""
+    root = ET.Element("event", {
+        "version": "2.0",
+        "uid": event["uid"],
+        "type": event["type"],
+        "how": event["how"],
+        "time": _cot_time(event["time"]),
+        "start": _cot_time(event["start"]),
+        "stale": _cot_time(event["stale"]),
+    })
+    ET.SubElement(root, "point", {
+        "lat": repr(event["lat"]),
+        "lon": repr(event["lon"]),
+        "hae": repr(event["hae"]),
+        "ce": repr(event["ce"]),
+        "le": repr(event["le"]),
+    })
+    root.append(_detail_xml(event))
+    return ET.tostring(root, encoding="utf-8")
+
+# Minimal protobuf wire-format encoding
+
+def _varint(value: int) -> bytes:
+    out = bytearray()
+    while True:
+        byte = value & 0x7F
+        value >>= 7
+        if value:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return bytes(out)
+
+def _string_field(number: int, value: str) -> bytes:
+    data = value.encode("utf-8")
+    return _varint(number << 3 | 2) + _varint(len(data)) + data
+
+def _message_field(number: int, data: bytes) -> bytes:
+    return _varint(number << 3 | 2) + _varint(len(data)) + data
+
+def _uint64_field(number: int, value: int) -> bytes:
+    return _varint(number << 3) + _varint(value)
+
+def _double_field(number: int, value: float) -> bytes:
+    return _varint(number << 3 | 1) + struct.pack("<d", value)
+
+def _millis(value: datetime) -> int:
+    return int(value.timestamp() * 1000)
+
+def event_to_protobuf(event: Dict) -> bytes:
+    """Serialize one event as a TAK protocol v1 TakMessage payload (unframed)"""
+    remarks_xml = b""
+    if event["remarks"]:
+        remarks = ET.Element("remarks")
+        remarks.text = event["remarks"]
+        remarks_xml = ET.tostring(remarks, encoding="utf-8")
+
+    contact = _string_field(2, event["callsign"])  # Contact.callsign
+    detail = _message_field(2, contact)  # Detail.contact
+    if remarks_xml:
+        detail = _string_field(1, remarks_xml.decode("utf-8")) + detail  # Detail.xmlDetail
+
+    cot_event = b"".join((
+        _string_field(1, event["type"]),
+        _string_field(5, event["uid"]),
+        _uint64_field(6, _millis(event["time"])),
+        _uint64_field(7, _millis(event["start"])),
+        _uint64_field(8, _millis(event["stale"])),
+        _string_field(9, event["how"]),
+        _double_field(10, event["lat"]),
+        _double_field(11, event["lon"]),
+        _double_field(12, event["hae"]),
+        _double_field(13, event["ce"]),
+        _double_field(14, event["le"]),
+        _message_field(15, detail),
+    ))
+    return _message_field(2, cot_event)  # TakMessage.cotEvent
+
+def frame_stream(payload: bytes) -> bytes:
+    """TAK stream framing: magic byte, varint payload length, payload"""
+    return bytes([TAK_MAGIC]) + _varint(len(payload)) + payload
+
+def iter_encoded(events: Iterable[Dict], fmt: str, batch_size: int = BATCH_SIZE) -> Iterator[bytes]:
+    """
+    Encode events in batches of batch_size. XML events are written back to
+    back as on a TAK XML stream; protobuf messages use TAK stream framing.
+    """
+    if fmt not in MEDIA_TYPES:
+        raise ValueError(f"Unsupported CoT format: {fmt}")
+    if fmt == "xml":
+        encode, join = event_to_xml, lambda chunk: b"\n".join(chunk) + b"\n"
+    else:
+        encode, join = (lambda e: frame_stream(event_to_protobuf(e))), b"".join
+
+    batch: List[bytes] = []
+    for event in events:
+        batch.append(encode(event))
+        if len(batch) >= batch_size:
+            yield join(batch)
+            batch = []
+    if batch:
+        yield join(batch)
@@ -4,60 +4,269 @@ Deployment Service - Handles TAK server provisioning and automation
 import asyncio
 import json
 import os
-from typing import Dict
+import time
+from typing import Callable, Dict, List, Optional
+
+from app.core.config import settings
+from app.core.metrics import track_job
+from app.services.deployment_steps import DeploymentStep, StepCache, critical_path, steps_for
+
+ProgressCallback = Callable[[str, int], None]
+
+class FleetProgress:
+    """
+    Tracks per-host progress for a fleet deployment
+    """
+    def __init__(self, deployment_id: int, hosts: List[str]):
+        self.deployment_id = deployment_id
+        self.status = "pending"
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.abort_reason: Optional[str] = None
+        self.hosts: Dict[str, Dict] = {
+            host: {"status": "pending", "progress": 0, "step": None, "error": None}
+            for host in hosts
+        }
+
+    def update(self, host: str, step: str, progress: int):
+        self.hosts[host].update(status="in_progress", step=step, progress=progress)
+
+    def count(self, status: str) -> int:
+        return sum(1 for h in self.hosts.values() if h["status"] == status)
+
+    @property
+    def progress(self) -> int:
+        if not self.hosts:
+            return 0
+        return int(sum(h["progress"] for h in self.hosts.values()) / len(self.hosts))
+
+    def to_dict(self) -> Dict:
+        elapsed = None
+        if self.started_at is not None:
+            elapsed = round((self.finished_at or time.monotonic()) - self.started_at, 2)
+        return {
+            "deployment_id": self.deployment_id,
+            "status": self.status,
+            "progress": self.progress,
+            "elapsed_seconds": elapsed,
+            "abort_reason": self.abort_reason,
+            "summary": {
+                status: self.count(status)
+                for status in ("pending", "in_progress", "completed", "failed", "aborted")
+            },
+            "hosts": self.hosts
+        }
+
+# Fleet deployments by deployment id (in production, persist to database)
+fleet_progress: Dict[int, FleetProgress] = {}
+
+# Step timings and critical path by deployment id, then target host
+deployment_timings: Dict[int, Dict[str, Dict]] = {}
 
 class DeploymentService:
     @staticmethod
-    async def execute_deployment(deployment_id: int, config: Dict):
+    async def execute_deployment(
+        deployment_id: int,
+        config: Dict,
+        progress_callback: Optional[ProgressCallback] = None
+    ):
         """
         Execute deployment based on configuration
         """
         deployment_type = config.get("deployment_type")
-        
-        if deployment_type == "local":
-            await DeploymentService._execute_local_deployment(deployment_id, config)
-        elif deployment_type == "cloud":
-            await DeploymentService._execute_cloud_deployment(deployment_id, config)
-    
+
+        async with track_job(f"deployment_{deployment_type}"):
+            if deployment_type == "local":
+                await DeploymentService._execute_local_deployment(deployment_id, config, progress_callback)
+            elif deployment_type == "cloud":
+                await DeploymentService._execute_cloud_deployment(deployment_id, config, progress_callback)
+
+    @staticmethod
+    async def execute_fleet_deployment(deployment_id: int, config: Dict):
+        """
+        Execute the same deployment against every host in the fleet concurrently.
+
+        Up to ``max_concurrency`` hosts run at once, so bring-up time tracks the
+        slowest host rather than the sum of all hosts. Remaining hosts are aborted
+        once ``any_errors_fatal`` or ``max_fail_percentage`` is tripped.
+        """
+        hosts = config["hosts"]
+        tracker = FleetProgress(deployment_id, hosts)
+        fleet_progress[deployment_id] = tracker
+
+        # Bounded here too, for configs that did not come through the API model
+        semaphore = asyncio.Semaphore(
+            min(max(1, config.get("max_concurrency", 5)), settings.DEPLOYMENT_MAX_CONCURRENCY)
+        )
+        abort = asyncio.Event()
+
+        def should_abort() -> bool:
+            failed = tracker.count("failed")
+            if failed and config.get("any_errors_fatal"):
+                return True
+            max_fail_percentage = config.get("max_fail_percentage")
+            return max_fail_percentage is not None and failed * 100 / len(hosts) > max_fail_percentage
+
+        async def deploy_host(host: str):
+            async with semaphore:
+                if abort.is_set():
+                    tracker.hosts[host]["status"] = "aborted"
+                    return
+                host_config = {**config, "target_host": host}
+                try:
+                    await DeploymentService.execute_deployment(
+                        deployment_id,
+                        host_config,
+                        lambda step, progress: tracker.update(host, step, progress)
+                    )
+                    tracker.hosts[host].update(status="completed", progress=100)
+                except asyncio.CancelledError:
+                    tracker.hosts[host]["status"] = "aborted"
+                    raise
+                except Exception as e:
+                    tracker.hosts[host].update(status="failed", error=str(e))
+                    print(f"Deployment {deployment_id}: {host} failed - {e}")
+                    if should_abort():
+                        tracker.abort_reason = f"Aborted after {host} failed"
+                        abort.set()
+
+        tracker.status = "in_progress"
+        tracker.started_at = time.monotonic()
+        tasks = [asyncio.create_task(deploy_host(host)) for host in hosts]
+
+        async def watch_abort():
+            await abort.wait()
+            for task in tasks:
+                task.cancel()
+
+        async with track_job("fleet_deployment"):
+            watcher = asyncio.create_task(watch_abort())
+            await asyncio.gather(*tasks, return_exceptions=True)
+            watcher.cancel()
+        for host_state in tracker.hosts.values():
+            if host_state["status"] == "pending":
+                host_state["status"] = "aborted"
+
+        tracker.finished_at = time.monotonic()
+        if abort.is_set():
+            tracker.status = "aborted"
+        elif tracker.count("failed"):
+            tracker.status = "failed"
+        else:
+            tracker.status = "completed"
+        print(f"Deployment {deployment_id}: fleet {tracker.status} "
+              f"({tracker.count('completed')}/{len(hosts)} hosts) in {tracker.to_dict()['elapsed_seconds']}s")
+
+    @staticmethod
+    def _report(deployment_id: int, config: Dict, step: str, progress: int,
+                progress_callback: Optional[ProgressCallback]):
+        if progress_callback:
+            progress_callback(step, progress)
+        target = config.get("target_host")
+        prefix = f"Deployment {deployment_id}" + (f" [{target}]" if target else "")
+        # In production, update database with progress
+        print(f"{prefix}: {step} - {progress}%")
+
     @staticmethod
-    async def _execute_local_deployment(deployment_id: int, config: Dict):
+    async def _execute_local_deployment(
+        deployment_id: int,
+        config: Dict,
+        progress_callback: Optional[ProgressCallback] = None
+    ):
         """
         Execute local (bare metal) deployment
         """
-        steps = [
-            "Preparing environment",
-            "Installing TAK Server",
-            "Configuring security settings",
-            "Setting up networking",
-            "Configuring Traefik",
-            "Starting services",
-            "Running security scans"
-        ]
-        
-        # Simulate deployment process
-        for i, step in enumerate(steps):
-            await asyncio.sleep(2)  # Simulate work
-            progress = int((i + 1) / len(steps) * 100)
-            # In production, update database with progress
-            print(f"Deployment {deployment_id}: {step} - {progress}%")
-    
+        await DeploymentService._run_steps(deployment_id, config, progress_callback)
+
     @staticmethod
-    async def _execute_cloud_deployment(deployment_id: int, config: Dict):
+    async def _execute_cloud_deployment(
+        deployment_id: int,
+        config: Dict,
+        progress_callback: Optional[ProgressCallback] = None
+    ):
         """
         Execute cloud deployment using Terraform
         """
-        steps = [
-            "Initializing Terraform",
-            "Planning infrastructure",
-            "Provisioning cloud resources",
-            "Deploying containers",
-            "Configuring networking",
-            "Setting up SSL certificates",
-            "Running post-deployment checks"
+        await DeploymentService._run_steps(deployment_id, config, progress_callback)
+
+    @staticmethod
+    async def _run_steps(
+        deployment_id: int,
+        config: Dict,
+        progress_callback: Optional[ProgressCallback]
+    ):
+        """
+        Run the step graph with maximum parallelism: each step starts as soon as
+        the steps it depends on have finished. Steps whose config fingerprint is
+        unchanged since their last successful run, and none of whose
+        dependencies run, are skipped.
+        """
+        steps = steps_for(config)
+        cache = await asyncio.to_thread(StepCache, config)
+        plan = {entry["step"]: entry for entry in cache.plan(config, force=config.get("force", False))}
+        timings: Dict[str, Dict] = {}
+        completed = 0
+        started = time.monotonic()
+
+        async def run_step(step: DeploymentStep, dependencies: List[asyncio.Task]):
+            nonlocal completed
+            await asyncio.gather(*dependencies)
+            step_started = time.monotonic()
+            skipped = plan[step.name]["action"] == "skip"
+            if not skipped:
+                if step.playbook:
+                    command = DeploymentService._playbook_command(step.playbook, config, step.tags)
+                    print(f"Deployment {deployment_id}: {' '.join(command)}")
+                await asyncio.sleep(2)  # Simulate work
+                await cache.record(step, plan[step.name]["fingerprint"])
+            timings[step.name] = {
+                "started": round(step_started - started, 3),
+                "duration": round(time.monotonic() - step_started, 3),
+                "skipped": skipped
+            }
+            completed += 1
+            label = f"{step.name} (unchanged, skipped)" if skipped else step.name
+            DeploymentService._report(deployment_id, config, label,
+                                      int(completed / len(steps) * 100), progress_callback)
+
+        # Steps are in dependency order, so every dependency's task exists already
+        tasks: Dict[str, asyncio.Task] = {}
+        for step in steps:
+            tasks[step.name] = asyncio.create_task(
+                run_step(step, [tasks[dep] for dep in step.depends_on])
+            )
+
+        try:
+            await asyncio.gather(*tasks.values())
+        except BaseException:
+            for task in tasks.values():
+                task.cancel()
+            raise
+        finally:
+            path, path_seconds = critical_path(
+                [step for step in steps if step.name in timings],
+                {name: t["duration"] for name, t in timings.items()}
+            )
+            target = config.get("target_host") or "default"
+            deployment_timings.setdefault(deployment_id, {})[target] = {
+                "total_seconds": round(time.monotonic() - started, 3),
+                "critical_path": path,
+                "critical_path_seconds": round(path_seconds, 3),
+                "steps": timings
+            }
+
+    @staticmethod
+    def _playbook_command(playbook: str, config: Dict, tags: Optional[str] = None) -> List[str]:
+        """
+        Build the ansible-playbook invocation for a step, scoped to the target host
+        """
+        command = [
+            "ansible-playbook",
+            os.path.join(settings.ANSIBLE_PLAYBOOKS_DIR, playbook),
+            "--forks", str(min(max(1, config.get("ansible_forks", 5)), settings.ANSIBLE_MAX_FORKS))
         ]
-        
-        # Simulate deployment process
-        for i, step in enumerate(steps):
-            await asyncio.sleep(2)  # Simulate work
-            progress = int((i + 1) / len(steps) * 100)
-            print(f"Deployment {deployment_id}: {step} - {progress}%")
+        if config.get("target_host"):
+            command += ["--limit", config["target_host"]]
+        if tags:
+            command += ["--tags", tags]
+        return command
@@ -0,0 +1,267 @@
+"""
+Deployment step graph definitions and config fingerprinting for incremental redeploys
+"""
+import asyncio
+import hashlib
+import json
+import os
+import re
+import tempfile
+import threading
+from datetime import datetime
+from typing import Dict, List, Optional, Sequence, Set, Tuple
+
+STEP_CACHE_DIR = "data/deployments"
+
+ENABLE_FLAGS = ("enable_tailscale", "enable_zerotier", "enable_traefik", "enable_mediamtx")
+
+class DeploymentStep:
+    """
+    A single deployment step, the slice of DeploymentConfig it depends on and
+    its position in the step dependency graph
+    """
+    def __init__(
+        self,
+        name: str,
+        config_keys: Tuple[str, ...],
+        playbook: Optional[str] = None,
+        depends_on: Tuple[str, ...] = (),
+        enabled_if: Tuple[str, ...] = (),
+        tags: Optional[str] = None
+    ):
+        self.name = name
+        self.config_keys = config_keys
+        self.playbook = playbook
+        self.depends_on = depends_on
+        self.enabled_if = enabled_if  # Any of these enable_* flags turns the step on
+        self.tags = tags
+
+    def enabled(self, config: Dict) -> bool:
+        return not self.enabled_if or any(config.get(flag) for flag in self.enabled_if)
+
+    def fingerprint(self, config: Dict, dependency_fingerprints: Sequence[str] = ()) -> str:
+        """
+        Hash of the step definition, its relevant config slice and the
+        fingerprints of the steps it depends on, so a change upstream also
+        changes every step downstream of it
+        """
+        relevant = {key: config.get(key) for key in self.config_keys}
+        payload = json.dumps(
+            {"step": self.name, "playbook": self.playbook, "tags": self.tags, "config": relevant,
+             "dependencies": sorted(dependency_fingerprints)},
+            sort_keys=True,
+            default=str
+        )
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+SERVICE_KEYS = ("tak_server_config", "security_config", "networking_config") + ENABLE_FLAGS
+
+LOCAL_STEPS = [
+    DeploymentStep("Preparing environment", ("deployment_type",)),
+    DeploymentStep(
+        "Installing TAK Server", ("tak_server_config",), "install-tak-server.yml",
+        depends_on=("Preparing environment",)
+    ),
+    DeploymentStep(
+        "Configuring security settings", ("security_config",), "security-hardening.yml",
+        depends_on=("Installing TAK Server",)
+    ),
+    DeploymentStep(
+        "Setting up Tailscale", ("networking_config", "enable_tailscale"), "setup-networking.yml",
+        depends_on=("Preparing environment",), enabled_if=("enable_tailscale",), tags="tailscale"
+    ),
+    DeploymentStep(
+        "Setting up Zerotier", ("networking_config", "enable_zerotier"), "setup-networking.yml",
+        depends_on=("Preparing environment",), enabled_if=("enable_zerotier",), tags="zerotier"
+    ),
+    DeploymentStep(
+        "Configuring Traefik", ("enable_traefik", "tak_server_config"), "setup-traefik.yml",
+        depends_on=("Preparing environment",), enabled_if=("enable_traefik",)
+    ),
+    DeploymentStep(
+        "Configuring MediaMTX", ("enable_mediamtx",), "setup-mediamtx.yml",
+        depends_on=("Preparing environment",), enabled_if=("enable_mediamtx",)
+    ),
+    DeploymentStep(
+        "Starting services", SERVICE_KEYS,
+        depends_on=(
+            "Configuring security settings",
+            "Setting up Tailscale",
+            "Setting up Zerotier",
+            "Configuring Traefik",
+            "Configuring MediaMTX"
+        )
+    ),
+    DeploymentStep("Running security scans", SERVICE_KEYS, depends_on=("Starting services",)),
+]
+
+CLOUD_STEPS = [
+    DeploymentStep("Initializing Terraform", ("deployment_type",)),
+    DeploymentStep("Planning infrastructure", SERVICE_KEYS, depends_on=("Initializing Terraform",)),
+    DeploymentStep(
+        "Provisioning cloud resources",
+        ("tak_server_config", "security_config", "networking_config"),
+        depends_on=("Planning infrastructure",)
+    ),
+    DeploymentStep(
+        "Deploying containers", ("tak_server_config", "enable_traefik", "enable_mediamtx"),
+        depends_on=("Provisioning cloud resources",)
+    ),
+    DeploymentStep(
+        "Configuring networking", ("networking_config", "enable_tailscale", "enable_zerotier"),
+        depends_on=("Provisioning cloud resources",)
+    ),
+    DeploymentStep(
+        "Setting up SSL certificates", ("enable_traefik", "security_config"),
+        depends_on=("Provisioning cloud resources",)
+    ),
+    DeploymentStep(
+        "Running post-deployment checks", SERVICE_KEYS,
+        depends_on=("Deploying containers", "Configuring networking", "Setting up SSL certificates")
+    ),
+]
+
+def steps_for(config: Dict) -> List[DeploymentStep]:
+    """
+    Enabled steps for the deployment type in config, in dependency order.
+
+    Dependencies on steps disabled by an ``enable_*`` flag are dropped, so the
+    returned steps only reference each other.
+    """
+    all_steps = CLOUD_STEPS if config.get("deployment_type") == "cloud" else LOCAL_STEPS
+    enabled = {step.name: step for step in all_steps if step.enabled(config)}
+
+    ordered: List[DeploymentStep] = []
+    visiting: Dict[str, bool] = {}
+
+    def visit(step: DeploymentStep):
+        if visiting.get(step.name) is False:
+            return
+        if visiting.get(step.name):
+            raise ValueError(f"Dependency cycle at step '{step.name}'")
+        visiting[step.name] = True
+        for dep in step.depends_on:
+            if dep in enabled:
+                visit(enabled[dep])
+        visiting[step.name] = False
+        ordered.append(step)
+
+    for step in enabled.values():
+        visit(step)
+
+    return [
+        DeploymentStep(
+            step.name, step.config_keys, step.playbook,
+            depends_on=tuple(dep for dep in step.depends_on if dep in enabled),
+            enabled_if=step.enabled_if, tags=step.tags
+        )
+        for step in ordered
+    ]
+
+def critical_path(steps: List[DeploymentStep], durations: Dict[str, float]) -> Tuple[List[str], float]:
+    """
+    Longest chain of dependent steps by duration, i.e. the steps that
+    determined total deployment time. Steps must be in dependency order.
+    """
+    finish: Dict[str, float] = {}
+    previous: Dict[str, Optional[str]] = {}
+    for step in steps:
+        before = max(step.depends_on, key=lambda dep: finish[dep], default=None)
+        finish[step.name] = durations.get(step.name, 0.0) + (finish[before] if before else 0.0)
+        previous[step.name] = before
+
+    if not finish:
+        return [], 0.0
+    last = max(finish, key=finish.get)
+    path = []
+    node: Optional[str] = last
+    while node:
+        path.append(node)
+        node = previous[node]
+    return list(reversed(path)), finish[last]
+
+class StepCache:
+    """
+    Fingerprints of the last successful run of each step, persisted per
+    deployment target (deployment name plus target host). The file is read in
+    the constructor, so build it with asyncio.to_thread from async code; a
+    missing or unreadable file just means every step runs.
+    """
+    def __init__(self, config: Dict):
+        target = f"{config.get('deployment_type')}_{config.get('name')}"
+        if config.get("target_host"):
+            target += f"_{config['target_host']}"
+        safe_target = re.sub(r"[^A-Za-z0-9_.-]", "_", target)
+        self.path = os.path.join(STEP_CACHE_DIR, f"{safe_target}.json")
+        self.entries: Dict[str, Dict] = {}
+        self._version = 0  # Snapshots taken / written, so an older one never overwrites a newer
+        self._written = 0
+        self._write_lock = threading.Lock()
+        try:
+            with open(self.path, 'r') as f:
+                entries = json.load(f)
+            if isinstance(entries, dict):
+                self.entries = entries
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError) as e:
+            print(f"Deployment: ignoring unreadable step cache {self.path}: {e}")
+
+    def plan(self, config: Dict, force: bool = False) -> List[Dict]:
+        """
+        Decide which steps need to run for config. A step runs again whenever
+        a step it depends on runs.
+        """
+        plan = []
+        fingerprints: Dict[str, str] = {}
+        running: Set[str] = set()
+        for step in steps_for(config):
+            fingerprint = step.fingerprint(config, [fingerprints[dep] for dep in step.depends_on])
+            fingerprints[step.name] = fingerprint
+            cached = self.entries.get(step.name)
+            if force:
+                action, reason = "run", "forced"
+            elif not cached:
+                action, reason = "run", "not previously run"
+            elif running.intersection(step.depends_on):
+                action, reason = "run", "dependency re-run"
+            elif cached["fingerprint"] != fingerprint:
+                action, reason = "run", "config or dependencies changed"
+            else:
+                action, reason = "skip", "unchanged"
+            if action == "run":
+                running.add(step.name)
+            plan.append({
+                "step": step.name,
+                "action": action,
+                "reason": reason,
+                "depends_on": list(step.depends_on),
+                "fingerprint": fingerprint,
+                "last_run": cached["completed_at"] if cached else None
+            })
+        return plan
+
+    async def record(self, step: DeploymentStep, fingerprint: str):
+        """Record a successful step run with its planned fingerprint"""
+        self.entries[step.name] = {
+            "fingerprint": fingerprint,
+            "completed_at": datetime.now().isoformat()
+        }
+        self._version += 1
+        await asyncio.to_thread(self._write, json.dumps(self.entries, indent=2), self._version)
+
+    def _write(self, data: str, version: int):
+        """Replace the cache file atomically, so a crash never leaves it half written"""
+        with self._write_lock:
+            if version < self._written:
+                return
+            os.makedirs(STEP_CACHE_DIR, exist_ok=True)
+            fd, temp_path = tempfile.mkstemp(dir=STEP_CACHE_DIR, suffix=".tmp")
+            try:
+                with os.fdopen(fd, 'w') as f:
+                    f.write(data)
+                os.replace(temp_path, self.path)
+            except BaseException:
+                os.unlink(temp_path)
+                raise
+            self._written = version
@@ -0,0 +1,383 @@
+"""
+Geofence Service - In-memory geofence and proximity alert engine
+
+Fences come from SDR ``area_of_interest`` shapes and from a proximity radius
+around each SDR checkpoint. They are bucketed in a uniform lat/lon grid, so a
+position update only tests the handful of fences whose bounding box shares its
+grid cell instead of every fence. Fences spanning more than
+GEOFENCE_MAX_GRID_CELLS cells (huge areas of interest) are kept out of the
+grid in a short list tested on every update instead.
+
+Supported ``area_of_interest`` shapes:
+
+- circle: ``{"type": "circle", "center": [lat, lon], "radius_m": 500}``
+- GeoJSON ``Polygon`` / ``MultiPolygon`` geometries (``[lon, lat]`` order)
+- GeoJSON ``Feature`` / ``FeatureCollection`` wrapping either of the above
+  (``properties.name`` names the fence)
+"""
+import json
+import math
+import os
+import time
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from app.core.config import settings
+from app.core.websocket import manager
+
+SDR_DIR = "data/packages/sdr"
+
+EARTH_RADIUS_M = 6371008.8
+METERS_PER_DEGREE = math.pi * EARTH_RADIUS_M / 180
+
+Ring = List[Tuple[float, float]]  # (lat, lon) vertices
+
+class InvalidAreaError(ValueError):
+    """Malformed area_of_interest shape or checkpoint coordinates"""
+
+def _point(lat, lon) -> Tuple[float, float]:
+    position = parse_position(lat, lon)
+    if position is None:
+        raise InvalidAreaError(f"Invalid coordinates: {lat!r}, {lon!r}")
+    return position
+
+def _radius(value) -> float:
+    try:
+        radius = float(value)
+    except (TypeError, ValueError):
+        radius = math.nan
+    if not 0 < radius < math.inf:
+        raise InvalidAreaError(f"Invalid radius_m: {value!r}")
+    return radius
+
+class Fence:
+    """
+    A circle or (multi)polygon with a precomputed bounding box
+    """
+    def __init__(
+        self,
+        fence_id: str,
+        name: str,
+        sdr_id: str,
+        kind: str,
+        threat_level: Optional[str] = None,
+        center: Optional[Tuple[float, float]] = None,
+        radius_m: float = 0.0,
+        polygons: Optional[List[List[Ring]]] = None
+    ):
+        self.id = fence_id
+        self.name = name
+        self.sdr_id = sdr_id
+        self.kind = kind  # 'circle' or 'polygon'
+        self.threat_level = threat_level
+        self.center = center
+        self.radius_m = radius_m
+        self.polygons = polygons or []  # Each polygon: outer ring, then holes
+
+        if kind == "circle":
+            lat, lon = center
+            dlat = radius_m / METERS_PER_DEGREE
+            dlon = dlat / max(math.cos(math.radians(lat)), 1e-6)
+            self.bbox = (lat - dlat, lon - dlon, lat + dlat, lon + dlon)
+            self._cos_lat = math.cos(math.radians(lat))
+            self._radius_sq = (radius_m / METERS_PER_DEGREE) ** 2
+        else:
+            lats = [lat for polygon in self.polygons for lat, _ in polygon[0]]
+            lons = [lon for polygon in self.polygons for _, lon in polygon[0]]
+            self.bbox = (min(lats), min(lons), max(lats), max(lons))
+
+    def contains(self, lat: float, lon: float) -> bool:
+        min_lat, min_lon, max_lat, max_lon = self.bbox
+        if not (min_lat <= lat <= max_lat and min_lon <= lon <= max_lon):
+            return False
+        if self.kind == "circle":
+            # Equirectangular distance, accurate well below a meter at fence scales
+            dlat = lat - self.center[0]
+            dlon = (lon - self.center[1]) * self._cos_lat
+            return dlat * dlat + dlon * dlon <= self._radius_sq
+        for polygon in self.polygons:
+            if _in_ring(lat, lon, polygon[0]) and not any(_in_ring(lat, lon, hole) for hole in polygon[1:]):
+                return True
+        return False
+
+    def to_dict(self) -> Dict:
+        data = {
+            "id": self.id,
+            "name": self.name,
+            "sdr_id": self.sdr_id,
+            "type": self.kind,
+            "threat_level": self.threat_level,
+            "bbox": list(self.bbox)
+        }
+        if self.kind == "circle":
+            data.update(center=list(self.center), radius_m=self.radius_m)
+        else:
+            data["polygon_count"] = len(self.polygons)
+        return data
+
+def _in_ring(lat: float, lon: float, ring: Ring) -> bool:
+    """Even-odd ray casting test"""
+    inside = False
+    j = len(ring) - 1
+    for i in range(len(ring)):
+        lat_i, lon_i = ring[i]
+        lat_j, lon_j = ring[j]
+        if (lat_i > lat) != (lat_j > lat):
+            if lon < (lon_j - lon_i) * (lat - lat_i) / (lat_j - lat_i) + lon_i:
+                inside = not inside
+        j = i
+    return inside
+
+def _geojson_polygons(geometry: Dict) -> List[List[Ring]]:
+    if geometry.get("type") == "Polygon":
+        polygons = [geometry["coordinates"]]
+    elif geometry.get("type") == "MultiPolygon":
+        polygons = geometry["coordinates"]
+    else:
+        return []
+    return [
+        [[_point(point[1], point[0]) for point in ring] for ring in polygon]
+        for polygon in polygons
+        if polygon and len(polygon[0]) >= 3
+    ]
+
+def parse_area_of_interest(sdr_id: str, sdr_name: str, area: Optional[Dict]) -> List[Fence]:
+    """
+    Build fences from an SDR ``area_of_interest``. Unrecognized shapes are
+    ignored; malformed ones raise InvalidAreaError.
+    """
+    if not area:
+        return []
+    try:
+        return _parse_shapes(sdr_id, sdr_name, area)
+    except (AttributeError, IndexError, KeyError, TypeError) as e:
+        raise InvalidAreaError(f"Malformed area_of_interest: {e!r}") from e
+
+def _parse_shapes(sdr_id: str, sdr_name: str, area: Dict) -> List[Fence]:
+    if area.get("type") == "FeatureCollection":
+        shapes = [(f.get("geometry") or {}, f.get("properties") or {}) for f in area.get("features", [])]
+    elif area.get("type") == "Feature":
+        shapes = [(area.get("geometry") or {}, area.get("properties") or {})]
+    else:
+        shapes = [(area, area)]
+
+    fences = []
+    for index, (geometry, properties) in enumerate(shapes):
+        fence_id = f"{sdr_id}:aoi:{index}"
+        name = properties.get("name") or sdr_name
+        if geometry.get("type") == "circle" or "radius_m" in properties:
+            center = geometry.get("center") or properties.get("center")
+            radius = properties.get("radius_m") or geometry.get("radius_m")
+            if geometry.get("type") == "Point":
+                center = [geometry["coordinates"][1], geometry["coordinates"][0]]
+            if center and radius:
+                fences.append(Fence(
+                    fence_id, name, sdr_id, "circle",
+                    center=_point(center[0], center[1]), radius_m=_radius(radius)
+                ))
+            continue
+        polygons = _geojson_polygons(geometry)
+        if polygons:
+            fences.append(Fence(fence_id, name, sdr_id, "polygon", polygons=polygons))
+    return fences
+
+def fences_for_sdr(sdr_data: Dict) -> List[Fence]:
+    """
+    Area of interest fences plus a proximity circle around each checkpoint.
+    Raises InvalidAreaError for malformed shapes or coordinates.
+    """
+    sdr_id = sdr_data["id"]
+    fences = parse_area_of_interest(sdr_id, sdr_data.get("name", sdr_id), sdr_data.get("area_of_interest"))
+    radius = settings.GEOFENCE_CHECKPOINT_RADIUS_M
+    if radius > 0:
+        for index, checkpoint in enumerate(sdr_data.get("checkpoints", [])):
+            fences.append(Fence(
+                f"{sdr_id}:checkpoint:{index}",
+                checkpoint.get("name") or f"Checkpoint {index + 1}",
+                sdr_id,
+                "circle",
+                threat_level=checkpoint.get("threat_level"),
+                center=_point(checkpoint.get("latitude"), checkpoint.get("longitude")),
+                radius_m=radius
+            ))
+    return fences
+
+class GeofenceEngine:
+    """
+    Fence grid index plus the fences each tracked POI is currently inside
+    """
+    def __init__(self, cell_degrees: float = settings.GEOFENCE_GRID_CELL_DEGREES,
+                 dwell_seconds: float = settings.GEOFENCE_DWELL_SECONDS,
+                 max_grid_cells: int = settings.GEOFENCE_MAX_GRID_CELLS):
+        self.cell_degrees = cell_degrees
+        self.dwell_seconds = dwell_seconds
+        self.max_grid_cells = max_grid_cells
+        self.fences: Dict[str, Fence] = {}
+        self.grid: Dict[Tuple[int, int], List[str]] = {}
+        # Fences too large to index; tested for every position
+        self.large_fences: List[str] = []
+        self.sdr_fences: Dict[str, List[str]] = {}
+        # poi id -> fence id -> [entered_at, dwell_reported]
+        self.occupancy: Dict[int, Dict[str, List]] = {}
+        self.evaluations = 0
+        self.evaluation_seconds = 0.0
+
+    def _cell(self, lat: float, lon: float) -> Tuple[int, int]:
+        return int(math.floor(lat / self.cell_degrees)), int(math.floor(lon / self.cell_degrees))
+
+    def _cells(self, fence: Fence) -> Iterable[Tuple[int, int]]:
+        min_row, min_col = self._cell(fence.bbox[0], fence.bbox[1])
+        max_row, max_col = self._cell(fence.bbox[2], fence.bbox[3])
+        for row in range(min_row, max_row + 1):
+            for col in range(min_col, max_col + 1):
+                yield row, col
+
+    def _is_large(self, fence: Fence) -> bool:
+        min_row, min_col = self._cell(fence.bbox[0], fence.bbox[1])
+        max_row, max_col = self._cell(fence.bbox[2], fence.bbox[3])
+        return (max_row - min_row + 1) * (max_col - min_col + 1) > self.max_grid_cells
+
+    def add_fence(self, fence: Fence):
+        self.remove_fence(fence.id)
+        self.fences[fence.id] = fence
+        self.sdr_fences.setdefault(fence.sdr_id, []).append(fence.id)
+        if self._is_large(fence):
+            self.large_fences.append(fence.id)
+            return
+        for cell in self._cells(fence):
+            self.grid.setdefault(cell, []).append(fence.id)
+
+    def remove_fence(self, fence_id: str):
+        fence = self.fences.pop(fence_id, None)
+        if not fence:
+            return
+        if fence_id in self.large_fences:
+            self.large_fences.remove(fence_id)
+        else:
+            self._remove_from_grid(fence)
+        self.sdr_fences.get(fence.sdr_id, []).remove(fence_id)
+        for fences_inside in self.occupancy.values():
+            fences_inside.pop(fence_id, None)
+
+    def _remove_from_grid(self, fence: Fence):
+        fence_id = fence.id
+        for cell in self._cells(fence):
+            bucket = self.grid.get(cell)
+            if bucket and fence_id in bucket:
+                bucket.remove(fence_id)
+                if not bucket:
+                    del self.grid[cell]
+
+    def load_sdr(self, sdr_data: Dict, fences: Optional[List[Fence]] = None):
+        """Replace the fences belonging to an SDR, built from it unless given"""
+        if fences is None:
+            fences = fences_for_sdr(sdr_data)
+        for fence_id in list(self.sdr_fences.get(sdr_data["id"], [])):
+            self.remove_fence(fence_id)
+        for fence in fences:
+            self.add_fence(fence)
+
+    def load_directory(self, sdr_dir: str = SDR_DIR) -> int:
+        """Index every saved SDR, returning the number of fences loaded"""
+        if not os.path.exists(sdr_dir):
+            return 0
+        for file in os.listdir(sdr_dir):
+            if file.endswith('.json'):
+                try:
+                    with open(os.path.join(sdr_dir, file), 'r') as f:
+                        self.load_sdr(json.load(f))
+                except (OSError, ValueError, KeyError, TypeError) as e:
+                    print(f"Geofence: skipping {file} - {e}")
+        return len(self.fences)
+
+    def candidates(self, lat: float, lon: float) -> List[str]:
+        indexed = self.grid.get(self._cell(lat, lon), [])
+        return indexed + self.large_fences if self.large_fences else indexed
+
+    def evaluate(self, poi_id: int, lat: float, lon: float,
+                 timestamp: Optional[float] = None) -> List[Dict]:
+        """
+        Test a POI position against the index and return enter/exit/dwell events
+        """
+        started = time.perf_counter()
+        now = timestamp if timestamp is not None else time.time()
+        inside: Set[str] = {
+            fence_id for fence_id in self.candidates(lat, lon)
+            if self.fences[fence_id].contains(lat, lon)
+        }
+        previous = self.occupancy.get(poi_id, {})
+        events = []
+
+        for fence_id in previous.keys() - inside:
+            events.append(self._event("exit", poi_id, fence_id, lat, lon, now))
+            del previous[fence_id]
+        for fence_id in inside:
+            state = previous.get(fence_id)
+            if state is None:
+                previous[fence_id] = [now, False]
+                events.append(self._event("enter", poi_id, fence_id, lat, lon, now))
+            elif not state[1] and now - state[0] >= self.dwell_seconds:
+                state[1] = True
+                events.append(self._event("dwell", poi_id, fence_id, lat, lon, now, state[0]))
+
+        if previous:
+            self.occupancy[poi_id] = previous
+        else:
+            self.occupancy.pop(poi_id, None)
+
+        self.evaluations += 1
+        self.evaluation_seconds += time.perf_counter() - started
+        return events
+
+    def forget(self, poi_id: int) -> List[Dict]:
+        """Drop a deleted POI, emitting exits for the fences it was inside"""
+        previous = self.occupancy.pop(poi_id, {})
+        now = time.time()
+        return [self._event("exit", poi_id, fence_id, None, None, now) for fence_id in previous]
+
+    def _event(self, kind: str, poi_id: int, fence_id: str, lat: Optional[float],
+               lon: Optional[float], now: float, entered_at: Optional[float] = None) -> Dict:
+        fence = self.fences.get(fence_id)
+        event = {
+            "type": "geofence",
+            "event": kind,
+            "poi_id": poi_id,
+            "fence_id": fence_id,
+            "fence_name": fence.name if fence else None,
+            "sdr_id": fence.sdr_id if fence else None,
+            "threat_level": fence.threat_level if fence else None,
+            "latitude": lat,
+            "longitude": lon,
+            "timestamp": now
+        }
+        if entered_at is not None:
+            event["dwell_seconds"] = round(now - entered_at, 1)
+        return event
+
+    def stats(self) -> Dict:
+        return {
+            "fences": len(self.fences),
+            "sdrs": sum(1 for fence_ids in self.sdr_fences.values() if fence_ids),
+            "grid_cells": len(self.grid),
+            "large_fences": len(self.large_fences),
+            "tracked_pois": len(self.occupancy),
+            "evaluations": self.evaluations,
+            "avg_evaluation_us": round(self.evaluation_seconds / self.evaluations * 1e6, 2)
+                                 if self.evaluations else 0.0
+        }
+
+def parse_position(latitude, longitude) -> Optional[Tuple[float, float]]:
+    """POI coordinates are stored as strings; return floats or None if unset/invalid"""
+    try:
+        lat, lon = float(latitude), float(longitude)
+    except (TypeError, ValueError):
+        return None
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+        return None
+    return lat, lon
+
+async def publish(events: List[Dict]):
+    """Push geofence events to WebSocket clients"""
+    for event in events:
+        await manager.broadcast(event)
+
+geofence_engine = GeofenceEngine()
@@ -0,0 +1,178 @@
+"""
+Health Service - Concurrent status probes for the services on a kit
+
+Every service is probed at once with asyncio, each under its own timeout: a
+TCP connect to the TAK server, the Traefik and MediaMTX HTTP APIs, and the
+``tailscale`` / ``zerotier-cli`` status commands. Results are cached for
+HEALTH_CACHE_TTL_SECONDS and concurrent callers share one probe round, so a
+wall of dashboards costs one set of probes per TTL. Status changes are kept as
+transitions and pushed to WebSocket clients.
+
+Hosts, URLs and commands come from Settings, so the probes can be pointed at
+local stub servers.
+"""
+import asyncio
+import json
+import os
+import signal
+import time
+from collections import deque
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from app.core.config import settings
+from app.core.websocket import manager
+
+Probe = Callable[[], Awaitable[Dict]]
+
+async def _http_json(url: str):
+    import httpx
+
+    async with httpx.AsyncClient(timeout=None) as client:
+        response = await client.get(url)
+        response.raise_for_status()
+        return response.json()
+
+async def _command_json(*command: str):
+    """Run a status command and parse its JSON output"""
+    process = await asyncio.create_subprocess_exec(
+        *command, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE,
+        start_new_session=True
+    )
+    try:
+        stdout, stderr = await process.communicate()
+    finally:
+        if process.returncode is None:
+            # Timed out: don't leave the command (or anything it started) running
+            os.killpg(process.pid, signal.SIGKILL)
+            await process.wait()
+    if process.returncode != 0:
+        raise RuntimeError(stderr.decode(errors="replace").strip() or f"exit status {process.returncode}")
+    return json.loads(stdout)
+
+async def probe_tak_server() -> Dict:
+    port = settings.TAK_SERVER_DEFAULT_PORT
+    try:
+        _, writer = await asyncio.open_connection(settings.TAK_SERVER_HOST, port)
+    except OSError as e:
+        return {"status": "stopped", "port": port, "active_connections": None, "error": str(e)}
+    writer.close()
+    await writer.wait_closed()
+    return {"status": "running", "port": port, "active_connections": None}
+
+async def probe_traefik() -> Dict:
+    entrypoints = await _http_json(f"{settings.TRAEFIK_API_URL.rstrip('/')}/api/entrypoints")
+    return {
+        "status": "running",
+        "https_enabled": any(ep.get("address", "").endswith(":443") for ep in entrypoints),
+        "entrypoints": [ep.get("name") for ep in entrypoints],
+    }
+
+async def probe_mediamtx() -> Dict:
+    paths = await _http_json(f"{settings.MEDIAMTX_API_URL.rstrip('/')}/v3/paths/list")
+    return {"status": "running", "streams": paths.get("itemCount", len(paths.get("items", [])))}
+
+async def probe_tailscale() -> Dict:
+    state = await _command_json(settings.TAILSCALE_CLI, "status", "--json")
+    tailnet = state.get("CurrentTailnet") or {}
+    return {
+        "status": "connected" if state.get("BackendState") == "Running" else "disconnected",
+        "network": tailnet.get("Name", ""),
+        "backend_state": state.get("BackendState"),
+    }
+
+async def probe_zerotier() -> Dict:
+    networks = await _command_json(settings.ZEROTIER_CLI, "-j", "listnetworks")
+    if settings.ZEROTIER_NETWORK_ID:
+        networks = [n for n in networks if n.get("nwid", n.get("id")) == settings.ZEROTIER_NETWORK_ID]
+    joined = [n for n in networks if n.get("status") == "OK"]
+    network = (joined or networks or [{}])[0]
+    return {
+        "status": "connected" if joined else "disconnected",
+        "network": network.get("nwid", network.get("id", settings.ZEROTIER_NETWORK_ID)),
+        "network_name": network.get("name", ""),
+    }
+
+# Status reported when a probe cannot complete (connection refused, API error)
+DOWN_STATUS = {
+    "tak_server": "stopped",
+    "traefik": "stopped",
+    "mediamtx": "stopped",
+    "tailscale": "disconnected",
+    "zerotier": "disconnected",
+}
+
+DEFAULT_PROBES: Dict[str, Probe] = {
+    "tak_server": probe_tak_server,
+    "traefik": probe_traefik,
+    "mediamtx": probe_mediamtx,
+    "tailscale": probe_tailscale,
+    "zerotier": probe_zerotier,
+}
+
+class HealthProber:
+    """
+    Runs all probes concurrently, caches the round and records transitions
+    """
+    def __init__(self, probes: Optional[Dict[str, Probe]] = None,
+                 timeout: float = settings.HEALTH_PROBE_TIMEOUT_SECONDS,
+                 ttl: float = settings.HEALTH_CACHE_TTL_SECONDS,
+                 history: int = settings.HEALTH_TRANSITION_HISTORY):
+        self.probes = dict(DEFAULT_PROBES if probes is None else probes)
+        self.timeout = timeout
+        self.ttl = ttl
+        self.results: Dict[str, Dict] = {}
+        self.checked_at = 0.0  # monotonic
+        self.since: Dict[str, float] = {}
+        self.transitions: deque = deque(maxlen=history)
+        self.rounds = 0
+        self._round: Optional[asyncio.Task] = None
+
+    async def _probe(self, name: str, probe: Probe) -> Dict:
+        started = time.perf_counter()
+        try:
+            result = await asyncio.wait_for(probe(), self.timeout)
+        except asyncio.TimeoutError:
+            result = {"status": "timeout", "error": f"No response within {self.timeout:g}s"}
+        except FileNotFoundError as e:
+            result = {"status": "not_installed", "error": str(e)}
+        except Exception as e:
+            result = {"status": DOWN_STATUS.get(name, "error"), "error": str(e) or type(e).__name__}
+        result["latency_ms"] = round((time.perf_counter() - started) * 1000, 1)
+        return result
+
+    async def _run_round(self) -> Dict[str, Dict]:
+        names = list(self.probes)
+        results = await asyncio.gather(*(self._probe(name, self.probes[name]) for name in names))
+        now = time.time()
+        changes = []
+        for name, result in zip(names, results):
+            previous = self.results.get(name, {}).get("status")
+            if previous != result["status"]:
+                self.since[name] = now
+                if previous is not None:
+                    change = {"service": name, "from": previous, "to": result["status"],
+                              "error": result.get("error"), "timestamp": now}
+                    self.transitions.append(change)
+                    changes.append(change)
+            result["checked_at"] = now
+            result["since"] = self.since[name]
+            self.results[name] = result
+        self.checked_at = time.monotonic()
+        self.rounds += 1
+        for change in changes:
+            await manager.broadcast({"type": "service_status", **change})
+        return self.results
+
+    async def check(self, force: bool = False) -> Dict[str, Dict]:
+        """Current status of every service, probing only if the cache is stale"""
+        if not force and self.results and time.monotonic() - self.checked_at < self.ttl:
+            return self.results
+        if self._round is None or self._round.done():
+            self._round = asyncio.ensure_future(self._run_round())
+        # Shielded so one caller going away does not cancel the shared round
+        return await asyncio.shield(self._round)
+
+    def history(self, service: Optional[str] = None) -> List[Dict]:
+        return [t for t in reversed(self.transitions) if service is None or t["service"] == service]
+
+health_prober = HealthProber()
@@ -0,0 +1,199 @@
+"""
+Revision Service - Note history stored as compressed deltas
+
+Each note update is stored as a zlib-compressed delta against the previous
+version, using the same retain/insert/delete operation format as the
+collaborative editor. Every ``NOTE_REVISION_KEYFRAME_INTERVAL`` revisions
+(or whenever a delta would not be smaller) the full text is stored instead,
+so reconstructing any version replays at most one interval of deltas.
+Deltas are diffed by line, and by character only within small changed
+hunks, in a worker thread.
+
+Revision numbers are allocated as max + 1, so every writer of a note (REST
+updates, collaborative compactions) records revisions while holding
+``note_lock(note_id)`` and with the Note row locked (``FOR UPDATE`` under
+PostgreSQL, for writers in other processes) until it commits.
+"""
+import asyncio
+import difflib
+import json
+import zlib
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+from sqlalchemy import delete, func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.models.models import Note, NoteRevision
+from app.utils.ot import TextOperation
+
+# Changed hunks larger than this (old plus new characters) are stored as a
+# delete and insert instead of being diffed by character, which is quadratic
+MAX_CHAR_DIFF_WINDOW = 2000
+
+# note id -> [lock, number of holders and waiters]
+_note_locks: Dict[int, List] = {}
+
+@asynccontextmanager
+async def note_lock(note_id: int) -> AsyncIterator[None]:
+    """
+    Serializes the writers (and the deleter) of a note, from loading it until
+    they commit. The entry is dropped once nobody holds or waits for it.
+    """
+    entry = _note_locks.get(note_id)
+    if entry is None:
+        entry = _note_locks[note_id] = [asyncio.Lock(), 0]
+    entry[1] += 1
+    try:
+        async with entry[0]:
+            yield
+    finally:
+        entry[1] -= 1
+        if not entry[1]:
+            del _note_locks[note_id]
+
+async def load_note_for_update(db: AsyncSession, note_id: int) -> Optional[Note]:
+    """The Note row, locked until the transaction ends (a no-op on SQLite)"""
+    result = await db.execute(select(Note).where(Note.id == note_id).with_for_update())
+    return result.scalar_one_or_none()
+
+def _diff_chars(operation: TextOperation, old: str, new: str):
+    """Append a character diff of a small hunk, or a plain replacement of a large one"""
+    if len(old) + len(new) > MAX_CHAR_DIFF_WINDOW:
+        operation.delete(len(old)).insert(new)
+        return
+    matcher = difflib.SequenceMatcher(None, old, new, autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == "equal":
+            operation.retain(i2 - i1)
+        else:
+            operation.delete(i2 - i1).insert(new[j1:j2])
+
+def diff_operation(old: str, new: str) -> TextOperation:
+    """
+    Operation turning old into new. Only the changed middle is diffed: by
+    line, then by character within each changed hunk.
+    """
+    prefix = 0
+    limit = min(len(old), len(new))
+    while prefix < limit and old[prefix] == new[prefix]:
+        prefix += 1
+    suffix = 0
+    while suffix < limit - prefix and old[-1 - suffix] == new[-1 - suffix]:
+        suffix += 1
+
+    old_mid = old[prefix:len(old) - suffix]
+    new_mid = new[prefix:len(new) - suffix]
+    operation = TextOperation().retain(prefix)
+    if len(old_mid) + len(new_mid) <= MAX_CHAR_DIFF_WINDOW:
+        _diff_chars(operation, old_mid, new_mid)
+        return operation.retain(suffix)
+
+    old_lines = old_mid.splitlines(keepends=True)
+    new_lines = new_mid.splitlines(keepends=True)
+    matcher = difflib.SequenceMatcher(None, old_lines, new_lines)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == "equal":
+            operation.retain(sum(len(line) for line in old_lines[i1:i2]))
+        else:
+            _diff_chars(operation, "".join(old_lines[i1:i2]), "".join(new_lines[j1:j2]))
+    return operation.retain(suffix)
+
+def _encode(previous_content: Optional[str], content: str, is_keyframe: bool) -> Tuple[bool, bytes]:
+    """(is_keyframe, stored data); a delta unless it would not be smaller"""
+    full = _compress(content)
+    if is_keyframe:
+        return True, full
+    delta = _compress(json.dumps(diff_operation(previous_content, content).to_json(),
+                                 separators=(",", ":"), ensure_ascii=False))
+    return (False, delta) if len(delta) < len(full) else (True, full)
+
+def _compress(data: str) -> bytes:
+    return zlib.compress(data.encode("utf-8"), 9)
+
+def _decompress(data: bytes) -> str:
+    return zlib.decompress(data).decode("utf-8")
+
+async def _latest_revision(db: AsyncSession, note_id: int) -> int:
+    result = await db.execute(
+        select(func.max(NoteRevision.revision)).where(NoteRevision.note_id == note_id)
+    )
+    return result.scalar() or 0
+
+async def record_revision(
+    db: AsyncSession,
+    note_id: int,
+    previous_content: Optional[str],
+    content: str,
+    author: Optional[str] = None
+) -> int:
+    """
+    Record content as the note's next revision in the caller's transaction.
+    Notes created before revision tracking get previous_content as a baseline.
+    Existing notes must be loaded with load_note_for_update while holding
+    note_lock, until the caller commits.
+    """
+    latest = await _latest_revision(db, note_id)
+    if latest == 0 and previous_content is not None:
+        db.add(NoteRevision(note_id=note_id, revision=1, is_keyframe=True,
+                            data=_compress(previous_content), content_length=len(previous_content)))
+        latest = 1
+
+    revision = latest + 1
+    is_keyframe = previous_content is None or (revision - 1) % settings.NOTE_REVISION_KEYFRAME_INTERVAL == 0
+    # Diffing and compression are CPU-bound; keep them off the event loop
+    is_keyframe, data = await asyncio.to_thread(_encode, previous_content, content, is_keyframe)
+
+    db.add(NoteRevision(note_id=note_id, revision=revision, is_keyframe=is_keyframe,
+                        data=data, content_length=len(content), author=author))
+    return revision
+
+async def list_revisions(db: AsyncSession, note_id: int) -> List[Dict]:
+    result = await db.execute(
+        select(NoteRevision).where(NoteRevision.note_id == note_id).order_by(NoteRevision.revision)
+    )
+    return [
+        {
+            "revision": r.revision,
+            "is_keyframe": r.is_keyframe,
+            "stored_bytes": len(r.data),
+            "content_length": r.content_length,
+            "author": r.author,
+            "created_at": r.created_at.isoformat() if r.created_at else None
+        }
+        for r in result.scalars().all()
+    ]
+
+async def reconstruct(db: AsyncSession, note_id: int, revision: int) -> Optional[str]:
+    """Content of a revision: nearest keyframe at or before it plus the deltas after"""
+    keyframe = (await db.execute(
+        select(func.max(NoteRevision.revision)).where(
+            NoteRevision.note_id == note_id,
+            NoteRevision.revision <= revision,
+            NoteRevision.is_keyframe == True
+        )
+    )).scalar()
+    if keyframe is None:
+        return None
+
+    result = await db.execute(
+        select(NoteRevision)
+        .where(
+            NoteRevision.note_id == note_id,
+            NoteRevision.revision >= keyframe,
+            NoteRevision.revision <= revision
+        )
+        .order_by(NoteRevision.revision)
+    )
+    rows = result.scalars().all()
+    if not rows or rows[-1].revision != revision:
+        return None
+
+    content = _decompress(rows[0].data)
+    for row in rows[1:]:
+        content = TextOperation.from_json(json.loads(_decompress(row.data))).apply(content)
+    return content
+
+async def delete_revisions(db: AsyncSession, note_id: int):
+    await db.execute(delete(NoteRevision).where(NoteRevision.note_id == note_id))
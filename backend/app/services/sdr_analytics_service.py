@@ -0,0 +1,175 @@
+"""
+SDR Analytics Service - Route length, legs, transit time, separation and coverage
+
+All geometry runs as numpy array operations over the checkpoint coordinates.
+Route legs are linear in the checkpoint count; checkpoint separation compares
+every pair, in blocks of SEPARATION_BLOCK_ROWS rows so memory stays linear too.
+Callers bound the checkpoint count (SDR_MAX_CHECKPOINTS) and run these
+functions off the event loop.
+"""
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from app.core.config import settings
+
+EARTH_RADIUS_M = 6371008.8
+
+# Share of a leg's length counted as exposure when it touches a checkpoint
+THREAT_WEIGHTS = {"low": 0.0, "medium": 0.5, "high": 1.0}
+
+# Rows of the pairwise distance matrix computed at once for separation
+SEPARATION_BLOCK_ROWS = 512
+
+def coordinates(checkpoints: List[Dict]) -> np.ndarray:
+    """(n, 2) array of [lat, lon] in radians"""
+    if not checkpoints:
+        return np.zeros((0, 2))
+    return np.radians(np.array(
+        [[float(cp["latitude"]), float(cp["longitude"])] for cp in checkpoints], dtype=float
+    ))
+
+def threat_weights(checkpoints: List[Dict]) -> np.ndarray:
+    return np.array([THREAT_WEIGHTS.get(cp.get("threat_level") or "low", 0.0) for cp in checkpoints])
+
+def haversine(lat1, lon1, lat2, lon2) -> np.ndarray:
+    """Great-circle distance in meters between broadcastable radian arrays"""
+    a = (np.sin((lat2 - lat1) / 2) ** 2
+         + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+def bearing(lat1, lon1, lat2, lon2) -> np.ndarray:
+    """Initial bearing in degrees (0-360) between radian arrays"""
+    dlon = lon2 - lon1
+    x = np.sin(dlon) * np.cos(lat2)
+    y = np.cos(lat1) * np.sin(lat2) - np.sin(lat1) * np.cos(lat2) * np.cos(dlon)
+    return (np.degrees(np.arctan2(x, y)) + 360.0) % 360.0
+
+def distance_matrix(coords: np.ndarray) -> np.ndarray:
+    """(n, n) pairwise distances in meters"""
+    lat, lon = coords[:, 0], coords[:, 1]
+    return haversine(lat[:, None], lon[:, None], lat[None, :], lon[None, :])
+
+def nearest_neighbors(coords: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Distance in meters to, and index of, each point's nearest other point,
+    without holding the full (n, n) matrix
+    """
+    n = len(coords)
+    distances = np.empty(n)
+    indices = np.empty(n, dtype=int)
+    lat, lon = coords[:, 0], coords[:, 1]
+    for start in range(0, n, SEPARATION_BLOCK_ROWS):
+        stop = min(start + SEPARATION_BLOCK_ROWS, n)
+        block = haversine(lat[start:stop, None], lon[start:stop, None], lat[None, :], lon[None, :])
+        rows = np.arange(stop - start)
+        block[rows, rows + start] = np.inf
+        indices[start:stop] = block.argmin(axis=1)
+        distances[start:stop] = block[rows, indices[start:stop]]
+    return distances, indices
+
+def leg_distances(coords: np.ndarray, loop: bool = False) -> np.ndarray:
+    if len(coords) < 2:
+        return np.zeros(0)
+    ends = np.roll(coords, -1, axis=0) if loop else coords[1:]
+    starts = coords if loop else coords[:-1]
+    return haversine(starts[:, 0], starts[:, 1], ends[:, 0], ends[:, 1])
+
+def exposure(legs: np.ndarray, weights: np.ndarray) -> float:
+    """Leg length weighted by the threat level of the checkpoints at either end"""
+    if not len(legs):
+        return 0.0
+    leg_weights = np.maximum(weights[:len(legs)], np.roll(weights, -1)[:len(legs)])
+    return float(np.dot(legs, leg_weights))
+
+def route_cost(length_m: float, exposure_m: float, threat_weight: float) -> float:
+    """Lower is better: route length plus weighted threat exposure, in meters"""
+    return length_m + threat_weight * exposure_m
+
+def analyze(
+    checkpoints: List[Dict],
+    speed_kmh: Optional[float] = None,
+    dwell_minutes: Optional[float] = None,
+    loop: bool = False,
+    include_legs: bool = True
+) -> Dict:
+    """
+    Leg distances/bearings, total length, transit estimate, checkpoint
+    separation and coverage for an ordered list of checkpoints
+    """
+    speed_kmh = speed_kmh or settings.SDR_TRANSIT_SPEED_KMH
+    dwell_minutes = settings.SDR_CHECKPOINT_DWELL_MINUTES if dwell_minutes is None else dwell_minutes
+    coords = coordinates(checkpoints)
+    weights = threat_weights(checkpoints)
+    n = len(coords)
+
+    legs = leg_distances(coords, loop)
+    route_length = float(legs.sum())
+    transit_minutes = route_length / 1000 / speed_kmh * 60
+    exposure_m = exposure(legs, weights)
+
+    result = {
+        "parameters": {"speed_kmh": speed_kmh, "dwell_minutes": dwell_minutes, "loop": loop},
+        "checkpoint_count": n,
+        "route_length_m": round(route_length, 1),
+        "transit_minutes": round(transit_minutes, 1),
+        "total_minutes": round(transit_minutes + dwell_minutes * n, 1),
+        "threat_exposure_m": round(exposure_m, 1),
+        "separation": None,
+        "coverage": None,
+    }
+
+    if include_legs and len(legs):
+        ends = np.roll(coords, -1, axis=0)[:len(legs)]
+        bearings = bearing(coords[:len(legs), 0], coords[:len(legs), 1], ends[:, 0], ends[:, 1])
+        result["legs"] = [
+            {
+                "from": i,
+                "to": (i + 1) % n,
+                "distance_m": round(float(distance), 1),
+                "bearing_deg": round(float(heading), 1),
+                "transit_minutes": round(float(distance) / 1000 / speed_kmh * 60, 1)
+            }
+            for i, (distance, heading) in enumerate(zip(legs, bearings))
+        ]
+    elif include_legs:
+        result["legs"] = []
+
+    if n >= 2:
+        nearest, neighbor = nearest_neighbors(coords)
+        i = int(np.argmin(nearest))
+        j = int(neighbor[i])
+        result["separation"] = {
+            "min_m": round(float(nearest.min()), 1),
+            "mean_nearest_m": round(float(nearest.mean()), 1),
+            "max_nearest_m": round(float(nearest.max()), 1),
+            "closest_pair": [int(min(i, j)), int(max(i, j))],
+            "below_minimum": int((nearest < settings.SDR_MIN_SEPARATION_M).sum()),
+        }
+
+    if n:
+        lat_deg, lon_deg = np.degrees(coords[:, 0]), np.degrees(coords[:, 1])
+        centroid = coords.mean(axis=0)
+        spread = haversine(centroid[0], centroid[1], coords[:, 0], coords[:, 1])
+        height = haversine(coords[:, 0].min(), centroid[1], coords[:, 0].max(), centroid[1])
+        width = haversine(centroid[0], coords[:, 1].min(), centroid[0], coords[:, 1].max())
+        result["coverage"] = {
+            "bbox": [float(lat_deg.min()), float(lon_deg.min()), float(lat_deg.max()), float(lon_deg.max())],
+            "centroid": [round(float(np.degrees(centroid[0])), 6), round(float(np.degrees(centroid[1])), 6)],
+            "radius_m": round(float(spread.max()), 1),
+            "area_km2": round(float(height * width) / 1e6, 3),
+        }
+
+    return result
+
+def score(checkpoints: List[Dict], threat_weight: float = 1.0, **kwargs) -> Dict:
+    """
+    Summary metrics and a comparable cost for one candidate SDR
+    """
+    metrics = analyze(checkpoints, include_legs=False, **kwargs)
+    cost = route_cost(metrics["route_length_m"], metrics["threat_exposure_m"], threat_weight)
+    if metrics["separation"]:
+        # Checkpoints closer than the minimum cannot tell a follower apart
+        cost += metrics["separation"]["below_minimum"] * settings.SDR_MIN_SEPARATION_M
+    metrics["cost"] = round(cost, 1)
+    return metrics
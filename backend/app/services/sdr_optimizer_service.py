@@ -0,0 +1,235 @@
+"""
+SDR Optimizer Service - Checkpoint ordering heuristics
+
+Builds one cost matrix per request (haversine distance inflated by the threat
+level at either end of a leg), seeds a route with nearest neighbor and then
+improves it with 2-opt segment reversals and Or-opt segment moves until no
+move helps or the time budget runs out. Each improvement pass evaluates every
+candidate move for a position as a single numpy operation.
+
+Route length and threat exposure limits steer the search through the threat
+weight: a route over the exposure limit is searched again with a heavier
+weight, one over the length limit with a lighter one, while the budget lasts.
+"""
+import time
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from app.core.config import settings
+from app.services.sdr_analytics_service import coordinates, distance_matrix, score, threat_weights
+
+OR_OPT_SEGMENTS = (1, 2, 3)
+# Searches with an adjusted threat weight when a route misses its limits
+GOAL_ATTEMPTS = 6
+GOAL_WEIGHT_FACTOR = 4.0
+
+def cost_matrix(checkpoints: List[Dict], threat_weight: float) -> np.ndarray:
+    """
+    Pairwise leg cost: distance plus threat_weight times the distance counted as
+    threat exposure, matching sdr_analytics_service.route_cost
+    """
+    distances = distance_matrix(coordinates(checkpoints))
+    weights = threat_weights(checkpoints)
+    return distances * (1.0 + threat_weight * np.maximum(weights[:, None], weights[None, :]))
+
+def _padded(costs: np.ndarray) -> np.ndarray:
+    """Append a zero-cost sentinel node marking the free end of an open route"""
+    n = len(costs)
+    padded = np.zeros((n + 1, n + 1))
+    padded[:n, :n] = costs
+    return padded
+
+def route_length(costs: np.ndarray, route: List[int], loop: bool) -> float:
+    legs = costs[route[:-1], route[1:]].sum()
+    if loop and len(route) > 1:
+        legs += costs[route[-1], route[0]]
+    return float(legs)
+
+def nearest_neighbor(costs: np.ndarray, start: int) -> List[int]:
+    n = len(costs)
+    route = [start]
+    visited = np.zeros(n, dtype=bool)
+    visited[start] = True
+    for _ in range(n - 1):
+        row = np.where(visited, np.inf, costs[route[-1]])
+        nxt = int(np.argmin(row))
+        route.append(nxt)
+        visited[nxt] = True
+    return route
+
+def _extended(route: List[int], loop: bool, sentinel: int) -> np.ndarray:
+    """Route with its closing node appended: the start for loops, else the sentinel"""
+    return np.array(route + [route[0] if loop else sentinel])
+
+def two_opt_pass(costs: np.ndarray, route: List[int], loop: bool, deadline: float) -> bool:
+    """
+    Apply the best segment reversal found for each start position.
+    Position 0 stays fixed. Returns True if the route improved.
+    """
+    sentinel = len(costs) - 1
+    improved = False
+    n = len(route)
+    for i in range(1, n - 1):
+        if time.perf_counter() > deadline:
+            break
+        ext = _extended(route, loop, sentinel)
+        a, b = ext[i - 1], ext[i]
+        js = np.arange(i + 1, n)
+        c, d = ext[js], ext[js + 1]
+        delta = costs[a, c] + costs[b, d] - costs[a, b] - costs[c, d]
+        best = int(np.argmin(delta))
+        if delta[best] < -1e-9:
+            j = int(js[best])
+            route[i:j + 1] = route[i:j + 1][::-1]
+            improved = True
+    return improved
+
+def or_opt_pass(costs: np.ndarray, route: List[int], loop: bool, deadline: float) -> bool:
+    """
+    Move short segments (optionally reversed) to their cheapest position
+    elsewhere in the route. Position 0 stays fixed.
+    """
+    sentinel = len(costs) - 1
+    improved = False
+    for length in OR_OPT_SEGMENTS:
+        i = 1
+        while i + length <= len(route):
+            if time.perf_counter() > deadline:
+                return improved
+            ext = _extended(route, loop, sentinel)
+            first, last = ext[i], ext[i + length - 1]
+            prev, nxt = ext[i - 1], ext[i + length]
+            removal_gain = costs[prev, first] + costs[last, nxt] - costs[prev, nxt]
+
+            # Candidate edges (k, k + 1) outside the segment and its neighbors
+            ks = np.array([k for k in range(len(ext) - 1) if k < i - 1 or k > i + length - 1])
+            if not len(ks):
+                i += 1
+                continue
+            a, b = ext[ks], ext[ks + 1]
+            forward = costs[a, first] + costs[last, b] - costs[a, b]
+            backward = costs[a, last] + costs[first, b] - costs[a, b]
+            insert = np.minimum(forward, backward)
+            best = int(np.argmin(insert))
+            if insert[best] - removal_gain < -1e-9:
+                k = int(ks[best])
+                segment = route[i:i + length]
+                if backward[best] < forward[best]:
+                    segment = segment[::-1]
+                rest = route[:i] + route[i + length:]
+                # Edge (k, k + 1) shifts left by the segment length if it was after it
+                position = k + 1 if k < i else k + 1 - length
+                route[:] = rest[:position] + segment + rest[position:]
+                improved = True
+            else:
+                i += 1
+    return improved
+
+def optimize_order(
+    checkpoints: List[Dict],
+    loop: bool = False,
+    threat_weight: float = 1.0,
+    fix_start: bool = True,
+    time_budget_ms: Optional[float] = None
+) -> Dict:
+    """
+    Reorder checkpoints to minimize length plus weighted threat exposure.
+
+    With fix_start the first checkpoint stays first; otherwise (open routes
+    only) each checkpoint is tried as the start while the budget lasts.
+    """
+    started = time.perf_counter()
+    budget_ms = settings.SDR_OPTIMIZER_TIME_BUDGET_MS if time_budget_ms is None else time_budget_ms
+    deadline = started + budget_ms / 1000
+    n = len(checkpoints)
+    if n < 3:
+        return {"order": list(range(n)), "passes": 0, "starts_tried": 1, "stopped_by": "converged",
+                "elapsed_ms": round((time.perf_counter() - started) * 1000, 2)}
+
+    costs = _padded(cost_matrix(checkpoints, threat_weight))
+    starts = [0] if fix_start or loop else list(range(n))
+    best_route: Optional[List[int]] = None
+    best_cost = np.inf
+    passes = 0
+    starts_tried = 0
+    stopped_by = "converged"
+
+    for start in starts:
+        if best_route is not None and time.perf_counter() > deadline:
+            stopped_by = "time_budget"
+            break
+        route = nearest_neighbor(costs[:n, :n], start)
+        starts_tried += 1
+        while True:
+            passes += 1
+            improved = two_opt_pass(costs, route, loop, deadline)
+            improved = or_opt_pass(costs, route, loop, deadline) or improved
+            if time.perf_counter() > deadline:
+                stopped_by = "time_budget"
+                break
+            if not improved:
+                break
+        cost = route_length(costs, route, loop)
+        if cost < best_cost:
+            best_route, best_cost = route, cost
+        if stopped_by == "time_budget":
+            break
+
+    return {
+        "order": best_route,
+        "passes": passes,
+        "starts_tried": starts_tried,
+        "stopped_by": stopped_by,
+        "elapsed_ms": round((time.perf_counter() - started) * 1000, 2)
+    }
+
+def reorder(checkpoints: List[Dict], order: List[int]) -> List[Dict]:
+    return [checkpoints[i] for i in order]
+
+def goals_met(metrics: Dict, max_length_m: Optional[float],
+              max_exposure_m: Optional[float]) -> Dict[str, Optional[bool]]:
+    return {
+        "max_length_m": None if max_length_m is None else metrics["route_length_m"] <= max_length_m,
+        "max_exposure_m": None if max_exposure_m is None else metrics["threat_exposure_m"] <= max_exposure_m,
+    }
+
+def optimize_with_goals(
+    checkpoints: List[Dict],
+    loop: bool = False,
+    threat_weight: float = 1.0,
+    fix_start: bool = True,
+    time_budget_ms: Optional[float] = None,
+    max_length_m: Optional[float] = None,
+    max_exposure_m: Optional[float] = None
+) -> Dict:
+    """
+    optimize_order, searched again with a heavier threat weight while the
+    route exceeds max_exposure_m or a lighter one while it exceeds
+    max_length_m. Returns the order meeting the most limits, cheapest at the
+    requested threat_weight, plus the weight that found it.
+    """
+    started = time.perf_counter()
+    budget_ms = settings.SDR_OPTIMIZER_TIME_BUDGET_MS if time_budget_ms is None else time_budget_ms
+    weight = threat_weight
+    best, best_rank = None, None
+    for attempt in range(GOAL_ATTEMPTS):
+        remaining_ms = budget_ms - (time.perf_counter() - started) * 1000
+        if best is not None and remaining_ms <= 0:
+            break
+        result = optimize_order(checkpoints, loop=loop, threat_weight=weight, fix_start=fix_start,
+                                time_budget_ms=max(remaining_ms, 0.0))
+        metrics = score(reorder(checkpoints, result["order"]), threat_weight=threat_weight, loop=loop)
+        goals = goals_met(metrics, max_length_m, max_exposure_m)
+        rank = (sum(1 for met in goals.values() if met is False), metrics["cost"])
+        if best_rank is None or rank < best_rank:
+            best, best_rank = {**result, "threat_weight_used": weight}, rank
+        if goals["max_exposure_m"] is False and goals["max_length_m"] is not False:
+            weight = weight * GOAL_WEIGHT_FACTOR if weight > 0 else 1.0
+        elif goals["max_length_m"] is False and goals["max_exposure_m"] is not False and weight > 0:
+            weight /= GOAL_WEIGHT_FACTOR
+        else:
+            break  # Limits met, or both missed and no weight helps both
+    best["goal_attempts"] = attempt + 1
+    best["elapsed_ms"] = round((time.perf_counter() - started) * 1000, 2)
+    return best
@@ -0,0 +1,262 @@
+"""
+Stream Monitor Service - MediaMTX path inventory and bitrate tracking
+
+Polls the MediaMTX control API (``/v3/paths/list``) every
+STREAM_POLL_INTERVAL_SECONDS and keeps, per path, a fixed-size ring of byte
+counter samples from which ingest/egress bitrates are computed. A path that
+is live but whose received bytes stop growing for STREAM_STALL_SECONDS is
+flagged as stalled; egress above STREAM_SATURATION_KBPS is flagged as
+saturated. State changes (path added/removed, live/waiting/stalled, reader
+count, saturation) are pushed to WebSocket clients as ``stream`` messages.
+"""
+import asyncio
+import time
+from array import array
+from typing import Dict, List, Optional, Tuple
+
+from app.core.config import settings
+from app.core.websocket import manager
+
+MAX_BACKOFF_SECONDS = 30.0
+PAGE_SIZE = 500
+
+class RateBuffer:
+    """
+    Ring of (timestamp, bytes received, bytes sent) samples in one flat array
+    """
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.samples = array('d', [0.0]) * (3 * capacity)
+        self.count = 0
+        self.head = 0  # Next slot to write
+
+    def __len__(self) -> int:
+        return self.count
+
+    def add(self, timestamp: float, bytes_in: float, bytes_out: float):
+        offset = 3 * self.head
+        self.samples[offset:offset + 3] = array('d', (timestamp, bytes_in, bytes_out))
+        self.head = (self.head + 1) % self.capacity
+        self.count = min(self.count + 1, self.capacity)
+
+    def __getitem__(self, index: int) -> Tuple[float, float, float]:
+        """Sample by age, 0 = oldest and -1 = newest"""
+        if index < 0:
+            index += self.count
+        if not 0 <= index < self.count:
+            raise IndexError(index)
+        offset = 3 * ((self.head - self.count + index) % self.capacity)
+        return self.samples[offset], self.samples[offset + 1], self.samples[offset + 2]
+
+    def series(self, window: Optional[float] = None) -> List[Tuple[float, float, float]]:
+        """(timestamp, kbps in, kbps out) between consecutive samples, oldest first"""
+        points = []
+        newest = self[-1][0] if self.count else 0.0
+        for i in range(1, self.count):
+            (t0, in0, out0), (t1, in1, out1) = self[i - 1], self[i]
+            if window is not None and newest - t0 > window or t1 <= t0:
+                continue
+            # A counter that went backwards was reset (publisher reconnected)
+            delta_in = in1 - in0 if in1 >= in0 else in1
+            delta_out = out1 - out0 if out1 >= out0 else out1
+            points.append((t1, delta_in * 8 / 1000 / (t1 - t0), delta_out * 8 / 1000 / (t1 - t0)))
+        return points
+
+    def rate(self, window: float) -> Tuple[float, float]:
+        """Average (kbps in, kbps out) over the last ``window`` seconds"""
+        points = self.series(window)
+        if not points:
+            return 0.0, 0.0
+        return (sum(p[1] for p in points) / len(points), sum(p[2] for p in points) / len(points))
+
+class StreamState:
+    def __init__(self, name: str, now: float):
+        self.name = name
+        self.buffer = RateBuffer(settings.STREAM_HISTORY_SAMPLES)
+        self.ready = False
+        self.source: Optional[str] = None
+        self.tracks: List[str] = []
+        self.readers = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.last_growth = now
+        self.status = "waiting"
+        self.saturated = False
+        self.since = now
+
+    def update(self, item: Dict, now: float):
+        bytes_in = int(item.get("bytesReceived") or 0)
+        if bytes_in != self.bytes_in or not self.ready:
+            self.last_growth = now
+        self.ready = bool(item.get("ready"))
+        self.source = (item.get("source") or {}).get("type")
+        self.tracks = item.get("tracks") or []
+        self.readers = len(item.get("readers") or [])
+        self.bytes_in = bytes_in
+        self.bytes_out = int(item.get("bytesSent") or 0)
+        self.buffer.add(now, self.bytes_in, self.bytes_out)
+
+    def to_dict(self, history: bool = False) -> Dict:
+        current_in, current_out = self.buffer.series()[-1][1:] if len(self.buffer) > 1 else (0.0, 0.0)
+        average_in, average_out = self.buffer.rate(settings.STREAM_RATE_WINDOW_SECONDS)
+        data = {
+            "name": self.name,
+            "status": self.status,
+            "since": self.since,
+            "ready": self.ready,
+            "source": self.source,
+            "tracks": self.tracks,
+            "readers": self.readers,
+            "bytes_in": self.bytes_in,
+            "bytes_out": self.bytes_out,
+            "bitrate_in_kbps": round(current_in, 1),
+            "bitrate_out_kbps": round(current_out, 1),
+            "avg_bitrate_in_kbps": round(average_in, 1),
+            "avg_bitrate_out_kbps": round(average_out, 1),
+            "saturated": self.saturated,
+            "stalled_seconds": round(time.time() - self.last_growth, 1) if self.status == "stalled" else 0.0,
+        }
+        if history:
+            data["history"] = [
+                {"timestamp": t, "kbps_in": round(kbps_in, 1), "kbps_out": round(kbps_out, 1)}
+                for t, kbps_in, kbps_out in self.buffer.series()
+            ]
+        return data
+
+class StreamMonitor:
+    """
+    Background poller for the MediaMTX paths API
+    """
+    def __init__(self, api_url: str = settings.MEDIAMTX_API_URL,
+                 interval: float = settings.STREAM_POLL_INTERVAL_SECONDS):
+        self.api_url = api_url.rstrip('/')
+        self.interval = interval
+        self.streams: Dict[str, StreamState] = {}
+        self.reachable: Optional[bool] = None
+        self.last_poll: Optional[float] = None
+        self.last_error: Optional[str] = None
+        self.polls = 0
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._poll_loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _poll_loop(self):
+        import httpx
+
+        failures = 0
+        async with httpx.AsyncClient(timeout=settings.HEALTH_PROBE_TIMEOUT_SECONDS) as client:
+            while True:
+                try:
+                    await self.poll(client)
+                    failures = 0
+                except Exception as e:
+                    failures += 1
+                    self._unreachable(str(e) or type(e).__name__)
+                await asyncio.sleep(min(self.interval * 2 ** failures, MAX_BACKOFF_SECONDS)
+                                    if failures else self.interval)
+
+    async def fetch_paths(self, client) -> List[Dict]:
+        items, page = [], 0
+        while True:
+            response = await client.get(f"{self.api_url}/v3/paths/list",
+                                        params={"page": page, "itemsPerPage": PAGE_SIZE})
+            response.raise_for_status()
+            data = response.json()
+            items.extend(data.get("items", []))
+            page += 1
+            if page >= data.get("pageCount", 1):
+                return items
+
+    async def poll(self, client):
+        """Fetch every path once, update rates and publish state changes"""
+        items = await self.fetch_paths(client)
+        now = time.time()
+        events = []
+        if self.reachable is False:
+            print("MediaMTX API reachable again")
+        self.reachable, self.last_error, self.last_poll = True, None, now
+        self.polls += 1
+
+        seen = set()
+        for item in items:
+            name = item.get("name")
+            if not name:
+                continue
+            seen.add(name)
+            state = self.streams.get(name)
+            added = state is None
+            if added:
+                state = self.streams[name] = StreamState(name, now)
+            readers_before = state.readers
+            state.update(item, now)
+            changes = self._evaluate(state, now)
+            if added:
+                # One event carrying the initial state
+                events.append(self._event("added", state))
+            elif changes:
+                events.extend(changes)
+            elif state.readers != readers_before:
+                events.append(self._event("readers", state))
+
+        for name in list(self.streams):
+            if name not in seen:
+                state = self.streams.pop(name)
+                state.status = "removed"
+                events.append(self._event("removed", state))
+
+        for event in events:
+            await manager.broadcast(event)
+
+    def _evaluate(self, state: StreamState, now: float) -> List[Dict]:
+        events = []
+        if not state.ready:
+            status = "waiting"
+        elif now - state.last_growth >= settings.STREAM_STALL_SECONDS:
+            status = "stalled"
+        else:
+            status = "live"
+        if status != state.status:
+            previous, state.status, state.since = state.status, status, now
+            kind = "recovered" if previous == "stalled" and status == "live" else status
+            events.append(self._event(kind, state))
+
+        limit = settings.STREAM_SATURATION_KBPS
+        _, out_kbps = state.buffer.rate(settings.STREAM_RATE_WINDOW_SECONDS)
+        saturated = bool(limit) and out_kbps > limit
+        if saturated != state.saturated:
+            state.saturated = saturated
+            events.append(self._event("saturated" if saturated else "unsaturated", state))
+        return events
+
+    def _unreachable(self, error: str):
+        if self.reachable is not False:
+            print(f"MediaMTX API unreachable at {self.api_url}: {error}")
+        self.reachable, self.last_error = False, error
+
+    def _event(self, kind: str, state: StreamState) -> Dict:
+        return {"type": "stream", "event": kind, "stream": state.to_dict(), "timestamp": time.time()}
+
+    def summary(self) -> Dict:
+        streams = [state.to_dict() for state in sorted(self.streams.values(), key=lambda s: s.name)]
+        return {
+            "api_url": self.api_url,
+            "reachable": self.reachable,
+            "last_poll": self.last_poll,
+            "error": self.last_error,
+            "count": len(streams),
+            "live": sum(1 for s in streams if s["status"] == "live"),
+            "stalled": sum(1 for s in streams if s["status"] == "stalled"),
+            "readers": sum(s["readers"] for s in streams),
+            "bitrate_in_kbps": round(sum(s["bitrate_in_kbps"] for s in streams), 1),
+            "bitrate_out_kbps": round(sum(s["bitrate_out_kbps"] for s in streams), 1),
+            "streams": streams,
+        }
+
+stream_monitor = StreamMonitor()
@@ -0,0 +1,93 @@
+"""
+Sync Service - Change tracking for conditional GETs and delta sync
+
+Every create/update/delete of a synced record writes a row to
+``sync_changes`` in the same transaction. Only the latest change per record
+is kept, so the table holds one row per record ever seen: live records
+point at their last upsert and deleted records keep a tombstone. The
+monotonically increasing row id is the client's sync cursor.
+
+Cursors must also follow commit order, or a client could move past an id
+whose transaction commits later. SQLite serializes writers already; under
+PostgreSQL each writer takes a per-entity advisory lock, held until commit,
+before it draws an id.
+"""
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Dict, List, Optional, Tuple
+
+from fastapi import Request
+from fastapi.responses import Response
+from sqlalchemy import delete, func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models.models import SyncChange
+
+async def record_change(db: AsyncSession, entity: str, entity_id: int, operation: str):
+    """
+    Record an 'upsert' or 'delete'; commit with the caller's transaction.
+    Under PostgreSQL this holds the entity's sync lock until that commit, so
+    call it last, just before committing.
+    """
+    if db.get_bind().dialect.name == "postgresql":
+        await db.execute(select(func.pg_advisory_xact_lock(func.hashtext(f"sync_changes:{entity}"))))
+    await db.execute(
+        delete(SyncChange).where(SyncChange.entity == entity, SyncChange.entity_id == entity_id)
+    )
+    db.add(SyncChange(entity=entity, entity_id=entity_id, operation=operation))
+
+async def latest_change(db: AsyncSession, entity: str) -> Tuple[int, Optional[datetime]]:
+    """Current cursor and change time for an entity type"""
+    result = await db.execute(
+        select(SyncChange.id, SyncChange.changed_at)
+        .where(SyncChange.entity == entity)
+        .order_by(SyncChange.id.desc())
+        .limit(1)
+    )
+    row = result.first()
+    return (row[0], row[1]) if row else (0, None)
+
+async def changes_since(db: AsyncSession, entity: str, cursor: int) -> Tuple[List[int], List[int], int]:
+    """Ids upserted and deleted after cursor, plus the new cursor"""
+    result = await db.execute(
+        select(SyncChange.id, SyncChange.entity_id, SyncChange.operation)
+        .where(SyncChange.entity == entity, SyncChange.id > cursor)
+        .order_by(SyncChange.id)
+    )
+    upserted, deleted = [], []
+    new_cursor = cursor
+    for change_id, entity_id, operation in result:
+        (deleted if operation == "delete" else upserted).append(entity_id)
+        new_cursor = change_id
+    return upserted, deleted, new_cursor
+
+def sync_headers(entity: str, cursor: int, changed_at: Optional[datetime], variant: str = "") -> Dict[str, str]:
+    """ETag and Last-Modified headers for a list representation"""
+    headers = {"ETag": f'"{entity}-{cursor}{"-" + variant if variant else ""}"'}
+    if changed_at is not None:
+        if changed_at.tzinfo is None:
+            changed_at = changed_at.replace(tzinfo=timezone.utc)
+        headers["Last-Modified"] = format_datetime(changed_at.astimezone(timezone.utc), usegmt=True)
+    return headers
+
+def conditional_response(request: Request, response: Response) -> Response:
+    """Replace response with a 304 if the client's validators still match"""
+    etag = response.headers.get("etag")
+    last_modified = response.headers.get("last-modified")
+    validators = {key: value for key, value in (("ETag", etag), ("Last-Modified", last_modified)) if value}
+
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+        if etag and (etag in tags or "*" in tags):
+            return Response(status_code=304, headers=validators)
+        return response
+
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since and last_modified:
+        try:
+            if parsedate_to_datetime(last_modified) <= parsedate_to_datetime(if_modified_since):
+                return Response(status_code=304, headers=validators)
+        except (TypeError, ValueError):
+            pass
+    return response
@@ -0,0 +1,312 @@
+"""
+Tile Cache Service - Offline map tiles in a local MBTiles (SQLite) store
+
+Tiles live in a ``tile_cache`` table that also tracks size and last access
+time; the MBTiles ``tiles`` view over it keeps the file readable by standard
+MBTiles tools. Once the store grows past TILE_CACHE_MAX_BYTES the least
+recently used tiles are evicted. Reads record their access time in memory and
+write it back in batches, so serving a tile does not cost a write.
+
+Every method does blocking SQLite I/O; async callers run them in a worker
+thread (``asyncio.to_thread``).
+
+Tile addressing in this module is XYZ (slippy map); rows are flipped to TMS
+only at the MBTiles boundary.
+"""
+import json
+import math
+import os
+import re
+import sqlite3
+import threading
+import time
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from app.core.config import settings
+
+TOUCH_FLUSH_THRESHOLD = 256
+EVICT_TARGET_RATIO = 0.9  # Evict down to this share of the size limit
+MAX_ZOOM = 22
+ITER_BATCH_TILES = 64  # Tiles read per lock hold when streaming a selection
+
+MEDIA_TYPES = {
+    "png": "image/png",
+    "jpg": "image/jpeg",
+    "webp": "image/webp",
+    "pbf": "application/x-protobuf",
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS metadata (name TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS tile_cache (
+    zoom_level INTEGER NOT NULL,
+    tile_column INTEGER NOT NULL,
+    tile_row INTEGER NOT NULL,
+    tile_data BLOB NOT NULL,
+    size INTEGER NOT NULL,
+    last_access REAL NOT NULL,
+    PRIMARY KEY (zoom_level, tile_column, tile_row)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS ix_tile_cache_last_access ON tile_cache (last_access);
+CREATE VIEW IF NOT EXISTS tiles AS
+    SELECT zoom_level, tile_column, tile_row, tile_data FROM tile_cache;
+"""
+
+BBox = Tuple[float, float, float, float]  # min_lat, min_lon, max_lat, max_lon
+
+def lonlat_to_tile(lat: float, lon: float, zoom: int) -> Tuple[int, int]:
+    """XYZ tile containing a point"""
+    lat = max(min(lat, 85.05112878), -85.05112878)
+    n = 1 << zoom
+    x = int((lon + 180.0) / 360.0 * n)
+    y = int((1.0 - math.asinh(math.tan(math.radians(lat))) / math.pi) / 2.0 * n)
+    return min(max(x, 0), n - 1), min(max(y, 0), n - 1)
+
+def tile_ranges(bbox: BBox, min_zoom: int, max_zoom: int) -> List[Tuple[int, int, int, int, int]]:
+    """(zoom, min_x, max_x, min_y, max_y) covering bbox at each zoom"""
+    min_lat, min_lon, max_lat, max_lon = bbox
+    ranges = []
+    for zoom in range(min_zoom, max_zoom + 1):
+        min_x, min_y = lonlat_to_tile(max_lat, min_lon, zoom)
+        max_x, max_y = lonlat_to_tile(min_lat, max_lon, zoom)
+        ranges.append((zoom, min_x, max_x, min_y, max_y))
+    return ranges
+
+def tile_count(bbox: BBox, min_zoom: int, max_zoom: int) -> int:
+    return sum(
+        (max_x - min_x + 1) * (max_y - min_y + 1)
+        for _, min_x, max_x, min_y, max_y in tile_ranges(bbox, min_zoom, max_zoom)
+    )
+
+def pad_bbox(points: List[Tuple[float, float]], margin_m: float) -> BBox:
+    """Bounding box of (lat, lon) points grown by margin_m on every side"""
+    if not points:
+        raise ValueError("No coordinates to build a bounding box from")
+    lats = [lat for lat, _ in points]
+    lons = [lon for _, lon in points]
+    dlat = margin_m / 111320.0
+    dlon = dlat / max(math.cos(math.radians(sum(lats) / len(lats))), 1e-6)
+    return (
+        max(min(lats) - dlat, -85.05112878), max(min(lons) - dlon, -180.0),
+        min(max(lats) + dlat, 85.05112878), min(max(lons) + dlon, 180.0)
+    )
+
+def route_points(route_id: str) -> List[Tuple[float, float]]:
+    """(lat, lon) of every coordinate in a saved route KML"""
+    route_path = f"data/packages/routes/{os.path.basename(route_id)}.kml"
+    if not os.path.exists(route_path):
+        raise FileNotFoundError("Route not found")
+    import xml.etree.ElementTree as ET
+
+    points = []
+    for element in ET.parse(route_path).iter():
+        if element.tag.endswith("coordinates") and element.text:
+            for triple in element.text.split():
+                lon, lat = triple.split(",")[:2]
+                points.append((float(lat), float(lon)))
+    return points
+
+def sdr_points(sdr_id: str) -> List[Tuple[float, float]]:
+    """(lat, lon) of every checkpoint in a saved SDR"""
+    sdr_path = f"data/packages/sdr/{os.path.basename(sdr_id)}.json"
+    if not os.path.exists(sdr_path):
+        raise FileNotFoundError("SDR not found")
+    with open(sdr_path, 'r') as f:
+        sdr_data = json.load(f)
+    return [(float(cp["latitude"]), float(cp["longitude"])) for cp in sdr_data["checkpoints"]]
+
+class TileCache:
+    """
+    MBTiles-backed tile store with an LRU size limit
+    """
+    def __init__(self, path: str = settings.TILE_CACHE_PATH,
+                 max_bytes: int = settings.TILE_CACHE_MAX_BYTES,
+                 tile_format: str = settings.TILE_FORMAT):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.format = tile_format
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._touched: Dict[Tuple[int, int, int], float] = {}
+        self._total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def media_type(self) -> str:
+        return MEDIA_TYPES.get(self.format, "application/octet-stream")
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(SCHEMA)
+            conn.executemany(
+                "INSERT OR IGNORE INTO metadata (name, value) VALUES (?, ?)",
+                [("name", "OTG-TAK tile cache"), ("type", "baselayer"),
+                 ("version", "1.0"), ("format", self.format)]
+            )
+            conn.commit()
+            self._total_bytes = conn.execute("SELECT COALESCE(SUM(size), 0) FROM tile_cache").fetchone()[0]
+            self._conn = conn
+        return self._conn
+
+    def get(self, z: int, x: int, y: int) -> Optional[bytes]:
+        with self._lock:
+            row = self._connection().execute(
+                "SELECT tile_data FROM tile_cache WHERE zoom_level = ? AND tile_column = ? AND tile_row = ?",
+                (z, x, (1 << z) - 1 - y)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._touched[(z, x, y)] = time.time()
+            if len(self._touched) >= TOUCH_FLUSH_THRESHOLD:
+                self._flush_touches()
+                self._connection().commit()
+            return row[0]
+
+    def put(self, z: int, x: int, y: int, data: bytes):
+        with self._lock:
+            conn = self._connection()
+            tms_row = (1 << z) - 1 - y
+            previous = conn.execute(
+                "SELECT size FROM tile_cache WHERE zoom_level = ? AND tile_column = ? AND tile_row = ?",
+                (z, x, tms_row)
+            ).fetchone()
+            conn.execute(
+                "INSERT OR REPLACE INTO tile_cache VALUES (?, ?, ?, ?, ?, ?)",
+                (z, x, tms_row, data, len(data), time.time())
+            )
+            self._total_bytes += len(data) - (previous[0] if previous else 0)
+            if self._total_bytes > self.max_bytes:
+                self._evict()
+            conn.commit()
+
+    def has(self, z: int, x: int, y: int) -> bool:
+        with self._lock:
+            return self._connection().execute(
+                "SELECT 1 FROM tile_cache WHERE zoom_level = ? AND tile_column = ? AND tile_row = ?",
+                (z, x, (1 << z) - 1 - y)
+            ).fetchone() is not None
+
+    def missing(self, bbox: BBox, min_zoom: int, max_zoom: int) -> List[Tuple[int, int, int]]:
+        """XYZ tiles covering bbox that are not cached, one range query per zoom"""
+        tiles = []
+        for zoom, min_x, max_x, min_y, max_y in tile_ranges(bbox, min_zoom, max_zoom):
+            flip = (1 << zoom) - 1
+            with self._lock:
+                cached = set(self._connection().execute(
+                    "SELECT tile_column, tile_row FROM tile_cache WHERE zoom_level = ? "
+                    "AND tile_column BETWEEN ? AND ? AND tile_row BETWEEN ? AND ?",
+                    (zoom, min_x, max_x, flip - max_y, flip - min_y)
+                ).fetchall())
+            tiles.extend(
+                (zoom, x, y)
+                for x in range(min_x, max_x + 1)
+                for y in range(min_y, max_y + 1)
+                if (x, flip - y) not in cached
+            )
+        return tiles
+
+    def _flush_touches(self):
+        if self._touched:
+            self._conn.executemany(
+                "UPDATE tile_cache SET last_access = ? "
+                "WHERE zoom_level = ? AND tile_column = ? AND tile_row = ?",
+                [(at, z, x, (1 << z) - 1 - y) for (z, x, y), at in self._touched.items()]
+            )
+            self._touched.clear()
+
+    def _evict(self):
+        """Drop least recently used tiles until under the target size"""
+        self._flush_touches()
+        target = self.max_bytes * EVICT_TARGET_RATIO
+        cursor = self._conn.execute(
+            "SELECT zoom_level, tile_column, tile_row, size FROM tile_cache ORDER BY last_access"
+        )
+        victims = []
+        freed = 0
+        for z, x, row, size in cursor:
+            if self._total_bytes - freed <= target:
+                break
+            victims.append((z, x, row))
+            freed += size
+        cursor.close()
+        self._conn.executemany(
+            "DELETE FROM tile_cache WHERE zoom_level = ? AND tile_column = ? AND tile_row = ?", victims
+        )
+        self._total_bytes -= freed
+        self.evictions += len(victims)
+
+    def iter_tiles(self, bbox: BBox, min_zoom: int, max_zoom: int) -> Iterator[Tuple[int, int, int, bytes]]:
+        """
+        Stream cached (z, x, y, data) tiles covering bbox in primary key order,
+        ITER_BATCH_TILES at a time, without loading the whole selection into
+        memory. Bulk reads such as packaging are not counted as hits and do
+        not refresh the tiles' LRU access time.
+        """
+        for zoom, min_x, max_x, min_y, max_y in tile_ranges(bbox, min_zoom, max_zoom):
+            flip = (1 << zoom) - 1
+            after = (min_x - 1, 0)
+            while True:
+                with self._lock:
+                    rows = self._connection().execute(
+                        "SELECT tile_column, tile_row, tile_data FROM tile_cache WHERE zoom_level = ? "
+                        "AND tile_column BETWEEN ? AND ? AND tile_row BETWEEN ? AND ? "
+                        "AND (tile_column > ? OR (tile_column = ? AND tile_row > ?)) "
+                        "ORDER BY tile_column, tile_row LIMIT ?",
+                        (zoom, min_x, max_x, flip - max_y, flip - min_y,
+                         after[0], after[0], after[1], ITER_BATCH_TILES)
+                    ).fetchall()
+                for x, tms_row, data in rows:
+                    yield zoom, x, flip - tms_row, data
+                if len(rows) < ITER_BATCH_TILES:
+                    break
+                after = rows[-1][:2]
+
+    def clear(self):
+        with self._lock:
+            conn = self._connection()
+            conn.execute("DELETE FROM tile_cache")
+            conn.commit()
+            self._touched.clear()
+            self._total_bytes = 0
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._flush_touches()
+                self._conn.commit()
+                self._conn.close()
+                self._conn = None
+
+    def stats(self) -> Dict:
+        with self._lock:
+            conn = self._connection()
+            by_zoom = dict(conn.execute(
+                "SELECT zoom_level, COUNT(*) FROM tile_cache GROUP BY zoom_level"
+            ).fetchall())
+        return {
+            "path": self.path,
+            "format": self.format,
+            "tiles": sum(by_zoom.values()),
+            "tiles_by_zoom": by_zoom,
+            "bytes": self._total_bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+def upstream_url(z: int, x: int, y: int) -> Optional[str]:
+    """Tile URL on the configured upstream server, if any"""
+    if not settings.TILE_UPSTREAM_URL:
+        return None
+    return re.sub(r"\{([zxy])\}", lambda m: str({"z": z, "x": x, "y": y}[m.group(1)]), settings.TILE_UPSTREAM_URL)
+
+tile_cache = TileCache()
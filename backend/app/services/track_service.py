@@ -0,0 +1,255 @@
+"""
+Track Service - POI position history in compact chunks
+
+Fixes are grouped per POI into chunks covering at most TRACK_CHUNK_SECONDS or
+TRACK_CHUNK_MAX_FIXES fixes. A chunk stores its timestamps (milliseconds from
+the chunk start) and coordinates (1e-6 degrees, ~0.1 m) as three int32 columns,
+each delta-of-delta encoded, so a device reporting at a steady rate and speed
+produces columns of near-zero values. The open chunk is rewritten as fixes
+arrive; once full it is sealed and zlib-compressed, which brings a fix down to
+about 3 bytes (a million fixes in 3 MB) versus one ORM row each.
+
+Fixes older than the newest stored one (history imports, uploads after a
+connectivity gap) are stored as separate sealed chunks and merged into place
+when queried.
+"""
+import asyncio
+import math
+import sys
+import zlib
+from array import array
+from itertools import accumulate
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import delete, func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.models.models import POITrackChunk
+from app.services.geofence_service import METERS_PER_DEGREE
+
+COORDINATE_SCALE = 1_000_000
+# Chunk-relative timestamps are int32 milliseconds
+MAX_CHUNK_MS = 2 ** 31 - 1
+
+Fix = Tuple[int, int, int]  # (unix ms, lat * 1e6, lon * 1e6)
+
+def _delta(values: Sequence[int]) -> List[int]:
+    return [values[0]] + [b - a for a, b in zip(values, values[1:])] if values else []
+
+def encode_chunk(fixes: Sequence[Fix], start_ms: int) -> bytes:
+    """Columnar delta-of-delta int32 encoding of a chunk's fixes"""
+    times, lats, lons = zip(*fixes) if fixes else ((), (), ())
+    data = array('i')
+    for column in ([t - start_ms for t in times], lats, lons):
+        data.extend(_delta(_delta(column)))
+    if sys.byteorder == "big":
+        data.byteswap()
+    return data.tobytes()
+
+def decode_chunk(data: bytes, start_ms: int) -> List[Fix]:
+    values = array('i')
+    values.frombytes(data)
+    if sys.byteorder == "big":
+        values.byteswap()
+    count = len(values) // 3
+    times, lats, lons = (
+        list(accumulate(accumulate(values[i * count:(i + 1) * count]))) for i in range(3)
+    )
+    return [(start_ms + t, lat, lon) for t, lat, lon in zip(times, lats, lons)]
+
+def chunk_fixes(chunk: POITrackChunk) -> List[Fix]:
+    data = zlib.decompress(chunk.data) if chunk.sealed else chunk.data
+    return decode_chunk(data, chunk.start_ms)
+
+def to_fix(timestamp_ms: int, latitude: float, longitude: float) -> Fix:
+    """Fix from unix milliseconds and degrees"""
+    return (timestamp_ms, round(latitude * COORDINATE_SCALE), round(longitude * COORDINATE_SCALE))
+
+def from_fix(fix: Fix) -> Tuple[float, float, float]:
+    """(unix seconds, latitude, longitude) of a fix"""
+    return fix[0] / 1000, fix[1] / COORDINATE_SCALE, fix[2] / COORDINATE_SCALE
+
+def simplify(fixes: List[Fix], tolerance_m: float) -> List[Fix]:
+    """
+    Douglas-Peucker: drop fixes closer than tolerance_m to the line through
+    the fixes kept around them
+    """
+    if tolerance_m <= 0 or len(fixes) < 3:
+        return fixes
+    # Equirectangular projection around the track's first latitude
+    scale = METERS_PER_DEGREE / COORDINATE_SCALE
+    x_scale = scale * math.cos(math.radians(fixes[0][1] / COORDINATE_SCALE))
+    xs = [f[2] * x_scale for f in fixes]
+    ys = [f[1] * scale for f in fixes]
+
+    keep = bytearray(len(fixes))
+    keep[0] = keep[-1] = 1
+    stack = [(0, len(fixes) - 1)]
+    while stack:
+        first, last = stack.pop()
+        x0, y0 = xs[first], ys[first]
+        dx, dy = xs[last] - x0, ys[last] - y0
+        length = math.hypot(dx, dy)
+        farthest, distance = 0, tolerance_m
+        for i in range(first + 1, last):
+            if length:
+                d = abs(dy * (xs[i] - x0) - dx * (ys[i] - y0)) / length
+            else:
+                d = math.hypot(xs[i] - x0, ys[i] - y0)
+            if d > distance:
+                farthest, distance = i, d
+        if farthest:
+            keep[farthest] = 1
+            stack.append((first, farthest))
+            stack.append((farthest, last))
+    return [fix for fix, kept in zip(fixes, keep) if kept]
+
+def thin(fixes: List[Fix], max_points: int) -> List[Fix]:
+    """Evenly spaced subset of at most max_points fixes, keeping both ends"""
+    if len(fixes) <= max_points:
+        return fixes
+    if max_points < 2:
+        return fixes[-max_points:] if max_points else []
+    step = (len(fixes) - 1) / (max_points - 1)
+    return [fixes[round(i * step)] for i in range(max_points)]
+
+class TrackStore:
+    """
+    Appends and range queries over POITrackChunk rows
+    """
+    def __init__(self, chunk_seconds: int = settings.TRACK_CHUNK_SECONDS,
+                 max_fixes: int = settings.TRACK_CHUNK_MAX_FIXES):
+        self.chunk_ms = min(chunk_seconds * 1000, MAX_CHUNK_MS)
+        self.max_fixes = max_fixes
+        self._locks: Dict[int, asyncio.Lock] = {}
+
+    def _store(self, chunk: POITrackChunk, fixes: List[Fix], seal: bool):
+        data = encode_chunk(fixes, chunk.start_ms)
+        chunk.data = zlib.compress(data, 9) if seal else data
+        chunk.sealed = seal
+        chunk.end_ms = fixes[-1][0]
+        chunk.fix_count = len(fixes)
+
+    def _split(self, fixes: List[Fix]) -> List[List[Fix]]:
+        """Sorted fixes cut into runs that each fit in one chunk"""
+        runs = []
+        for fix in fixes:
+            if not runs or fix[0] - runs[-1][0][0] >= self.chunk_ms or len(runs[-1]) >= self.max_fixes:
+                runs.append([])
+            runs[-1].append(fix)
+        return runs
+
+    def _add_chunk(self, db: AsyncSession, poi_id: int, fixes: List[Fix], seal: bool) -> POITrackChunk:
+        chunk = POITrackChunk(poi_id=poi_id, start_ms=fixes[0][0])
+        self._store(chunk, fixes, seal)
+        db.add(chunk)
+        return chunk
+
+    async def append(self, db: AsyncSession, poi_id: int, fixes: List[Fix]) -> Dict:
+        """
+        Store fixes for a POI and commit. Fixes newer than the last stored one
+        extend the open chunk; older ones (history imports, late uploads) are
+        written as separate sealed chunks that queries merge back in order.
+        """
+        fixes = sorted(fixes)
+        lock = self._locks.setdefault(poi_id, asyncio.Lock())
+        async with lock:
+            result = await db.execute(
+                select(POITrackChunk)
+                .where(POITrackChunk.poi_id == poi_id, POITrackChunk.sealed == False)  # noqa: E712
+                .order_by(POITrackChunk.start_ms.desc())
+                .limit(1)
+            )
+            chunk = result.scalar_one_or_none()
+            if chunk is not None:
+                last_ms = chunk.end_ms
+            else:
+                result = await db.execute(
+                    select(func.max(POITrackChunk.end_ms)).where(POITrackChunk.poi_id == poi_id)
+                )
+                last_ms = result.scalar()
+
+            split = 0
+            if last_ms is not None:
+                while split < len(fixes) and fixes[split][0] <= last_ms:
+                    split += 1
+            backfill, fresh = fixes[:split], fixes[split:]
+
+            for run in self._split(backfill):
+                self._add_chunk(db, poi_id, run, seal=True)
+
+            if fresh:
+                stored = chunk_fixes(chunk) if chunk is not None else []
+                if stored and fresh[0][0] - chunk.start_ms < self.chunk_ms and len(stored) < self.max_fixes:
+                    # Top up the open chunk first
+                    room = self.max_fixes - len(stored)
+                    fill = 0
+                    while fill < min(room, len(fresh)) and fresh[fill][0] - chunk.start_ms < self.chunk_ms:
+                        fill += 1
+                    stored.extend(fresh[:fill])
+                    fresh = fresh[fill:]
+                    self._store(chunk, stored, seal=bool(fresh) or len(stored) >= self.max_fixes)
+                elif chunk is not None:
+                    self._store(chunk, stored, seal=True)
+                runs = self._split(fresh)
+                for i, run in enumerate(runs):
+                    self._add_chunk(db, poi_id, run, seal=i < len(runs) - 1 or len(run) >= self.max_fixes)
+
+            if fixes:
+                await db.commit()
+        return {"appended": len(fixes) - len(backfill), "backfilled": len(backfill)}
+
+    async def query(self, db: AsyncSession, poi_id: int, start_ms: Optional[int] = None,
+                    end_ms: Optional[int] = None) -> List[Fix]:
+        """Fixes of a POI between start_ms and end_ms (inclusive), oldest first"""
+        query = select(POITrackChunk).where(POITrackChunk.poi_id == poi_id)
+        if start_ms is not None:
+            query = query.where(POITrackChunk.end_ms >= start_ms)
+        if end_ms is not None:
+            query = query.where(POITrackChunk.start_ms <= end_ms)
+        result = await db.execute(query.order_by(POITrackChunk.start_ms))
+
+        fixes = []
+        overlapping = False
+        for chunk in result.scalars():
+            if fixes and chunk.start_ms <= fixes[-1][0]:
+                overlapping = True
+            decoded = chunk_fixes(chunk)
+            if (start_ms is None or chunk.start_ms >= start_ms) and (end_ms is None or chunk.end_ms <= end_ms):
+                fixes.extend(decoded)
+            else:
+                fixes.extend(fix for fix in decoded
+                             if (start_ms is None or fix[0] >= start_ms) and (end_ms is None or fix[0] <= end_ms))
+        if overlapping:
+            # Backfilled chunks interleave with others; one fix per timestamp
+            fixes.sort()
+            fixes = [fix for i, fix in enumerate(fixes) if i == 0 or fix[0] != fixes[i - 1][0]]
+        return fixes
+
+    async def stats(self, db: AsyncSession, poi_id: int) -> Dict:
+        result = await db.execute(
+            select(
+                func.count(POITrackChunk.id),
+                func.sum(POITrackChunk.fix_count),
+                func.sum(func.length(POITrackChunk.data)),
+                func.min(POITrackChunk.start_ms),
+                func.max(POITrackChunk.end_ms),
+            ).where(POITrackChunk.poi_id == poi_id)
+        )
+        chunks, fix_count, stored_bytes, first_ms, last_ms = result.one()
+        return {
+            "chunks": chunks,
+            "fixes": fix_count or 0,
+            "stored_bytes": stored_bytes or 0,
+            "bytes_per_fix": round(stored_bytes / fix_count, 2) if fix_count else 0.0,
+            "first": first_ms / 1000 if first_ms is not None else None,
+            "last": last_ms / 1000 if last_ms is not None else None,
+        }
+
+    async def delete(self, db: AsyncSession, poi_id: int):
+        """Remove a POI's track; the caller commits"""
+        await db.execute(delete(POITrackChunk).where(POITrackChunk.poi_id == poi_id))
+        self._locks.pop(poi_id, None)
+
+track_store = TrackStore()
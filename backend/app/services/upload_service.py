@@ -0,0 +1,274 @@
+"""
+Upload Service - Resumable chunked uploads (tus-style)
+
+An upload is created with its final size, then its bytes are sent in any
+number of PATCH requests, each starting at the current offset. The offset is
+the size of the partial file on disk, so an upload interrupted by a dropped
+link, or by a server restart, resumes from the last byte written instead of
+from zero. Bytes received before a connection drops are kept.
+
+Partial files live in ``data/uploads/.incoming`` next to a small JSON state
+file and are renamed into ``data/uploads`` once complete and verified, so
+finished files are never copied. Each request holds at most
+UPLOAD_WRITE_BUFFER bytes in memory, and the SHA-256 of the file is updated
+as chunks arrive rather than re-read at the end (unless the server restarted
+mid-upload).
+"""
+import asyncio
+import base64
+import hashlib
+import json
+import os
+import re
+import time
+import uuid
+from typing import AsyncIterator, Dict, List, Optional
+
+from app.core.config import settings
+from app.core.metrics import UPLOAD_BYTES, UPLOADS
+
+UPLOADS_DIR = "data/uploads"
+INCOMING_DIR = os.path.join(UPLOADS_DIR, ".incoming")
+UPLOAD_ID_PATTERN = re.compile(r"^[0-9a-f]{32}$")
+
+class UploadError(Exception):
+    """Rejected upload operation, with the HTTP status the API should return"""
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+def _sha256_file(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+class Upload:
+    def __init__(self, upload_id: str, state: Dict):
+        self.id = upload_id
+        self.filename: str = state["filename"]
+        self.size: int = state["size"]
+        self.sha256: Optional[str] = state.get("sha256")
+        self.metadata: Dict = state.get("metadata") or {}
+        self.created_at: float = state["created_at"]
+        self.lock = asyncio.Lock()
+        # Running digest of the bytes on disk; None after a restart
+        self.digest = hashlib.sha256() if not os.path.getsize(self.part_path) else None
+
+    @property
+    def part_path(self) -> str:
+        return os.path.join(INCOMING_DIR, f"{self.id}.part")
+
+    @property
+    def state_path(self) -> str:
+        return os.path.join(INCOMING_DIR, f"{self.id}.json")
+
+    @property
+    def offset(self) -> int:
+        return os.path.getsize(self.part_path)
+
+    def to_dict(self) -> Dict:
+        offset = self.offset
+        return {
+            "id": self.id,
+            "filename": self.filename,
+            "size": self.size,
+            "offset": offset,
+            "complete": offset == self.size,
+            "sha256": self.sha256,
+            "metadata": self.metadata,
+            "created_at": self.created_at,
+            "updated_at": os.path.getmtime(self.part_path),
+        }
+
+class UploadManager:
+    """
+    Resumable uploads, persisted under INCOMING_DIR
+    """
+    def __init__(self):
+        self.uploads: Dict[str, Upload] = {}
+
+    def get(self, upload_id: str) -> Upload:
+        upload = self.uploads.get(upload_id)
+        if upload is None and UPLOAD_ID_PATTERN.match(upload_id):
+            # Left over from before a restart
+            try:
+                with open(os.path.join(INCOMING_DIR, f"{upload_id}.json")) as f:
+                    upload = self.uploads[upload_id] = Upload(upload_id, json.load(f))
+            except (OSError, ValueError, KeyError):
+                upload = None
+        if upload is None:
+            raise UploadError(404, "Upload not found")
+        return upload
+
+    def create(self, filename: str, size: int, sha256: Optional[str] = None,
+               metadata: Optional[Dict] = None) -> Upload:
+        if size > settings.UPLOAD_MAX_SIZE:
+            raise UploadError(413, f"Upload exceeds UPLOAD_MAX_SIZE ({settings.UPLOAD_MAX_SIZE} bytes)")
+        self.expire()
+        os.makedirs(INCOMING_DIR, exist_ok=True)
+        upload_id = uuid.uuid4().hex
+        state = {
+            "filename": os.path.basename(filename),
+            "size": size,
+            "sha256": sha256.lower() if sha256 else None,
+            "metadata": metadata or {},
+            "created_at": time.time(),
+        }
+        open(os.path.join(INCOMING_DIR, f"{upload_id}.part"), 'wb').close()
+        with open(os.path.join(INCOMING_DIR, f"{upload_id}.json"), 'w') as f:
+            json.dump(state, f)
+        upload = self.uploads[upload_id] = Upload(upload_id, state)
+        UPLOADS.inc("created")
+        return upload
+
+    async def append(self, upload_id: str, offset: int, chunks: AsyncIterator[bytes],
+                     checksum: Optional[str] = None) -> int:
+        """
+        Write a request body at ``offset`` and return the new offset.
+        ``checksum`` ("sha256 <base64>", tus checksum extension) covers this
+        body; on mismatch the chunk is discarded.
+        """
+        upload = self.get(upload_id)
+        if upload.lock.locked():
+            raise UploadError(409, "Another request is writing to this upload")
+        expected = None
+        if checksum is not None:
+            algorithm, _, value = checksum.partition(" ")
+            if algorithm.lower() != "sha256":
+                raise UploadError(400, "Upload-Checksum must use sha256")
+            try:
+                expected = base64.b64decode(value.strip(), validate=True)
+            except ValueError:
+                raise UploadError(400, "Invalid Upload-Checksum value")
+
+        async with upload.lock:
+            current = upload.offset
+            if offset != current:
+                raise UploadError(409, f"Upload-Offset {offset} does not match the current offset {current}")
+            limit = min(upload.size - current, settings.UPLOAD_MAX_CHUNK_SIZE)
+            chunk_digest = hashlib.sha256() if expected is not None else None
+            # Restored if the chunk checksum fails
+            digest_before = upload.digest.copy() if upload.digest is not None and expected is not None else None
+
+            written, buffer = 0, bytearray()
+            with open(upload.part_path, 'r+b') as f:
+                f.seek(current)
+                try:
+                    async for data in chunks:
+                        if written + len(buffer) + len(data) > limit:
+                            raise UploadError(413, "Chunk exceeds the upload size or UPLOAD_MAX_CHUNK_SIZE")
+                        buffer += data
+                        if len(buffer) >= settings.UPLOAD_WRITE_BUFFER:
+                            written += await self._write(upload, f, buffer, chunk_digest)
+                            buffer = bytearray()
+                    if buffer:
+                        written += await self._write(upload, f, buffer, chunk_digest)
+                        buffer = bytearray()
+                    if expected is not None and chunk_digest.digest() != expected:
+                        raise UploadError(460, "Upload-Checksum mismatch; chunk discarded")
+                except BaseException:
+                    if expected is None:
+                        # Keep what arrived before the connection dropped
+                        if buffer:
+                            written += await self._write(upload, f, buffer, chunk_digest)
+                    else:
+                        # A partial or corrupt chunk cannot be verified
+                        f.truncate(current)
+                        upload.digest = digest_before
+                    raise
+                finally:
+                    await asyncio.to_thread(os.fsync, f.fileno())
+            return current + written
+
+    async def _write(self, upload: Upload, f, buffer: bytearray, chunk_digest) -> int:
+        await asyncio.to_thread(f.write, buffer)
+        if upload.digest is not None:
+            upload.digest.update(buffer)
+        if chunk_digest is not None:
+            chunk_digest.update(buffer)
+        UPLOAD_BYTES.inc(amount=len(buffer))
+        return len(buffer)
+
+    async def complete(self, upload_id: str, sha256: Optional[str] = None) -> Dict:
+        """
+        Verify a fully received upload and move it into UPLOADS_DIR
+        """
+        upload = self.get(upload_id)
+        async with upload.lock:
+            if upload.offset != upload.size:
+                raise UploadError(409, f"Upload incomplete: {upload.offset} of {upload.size} bytes received")
+            if upload.digest is not None:
+                actual = upload.digest.hexdigest()
+            else:
+                actual = await asyncio.to_thread(_sha256_file, upload.part_path)
+            expected = (sha256 or upload.sha256 or "").lower()
+            if not expected:
+                raise UploadError(400, "sha256 is required, at creation or completion")
+            if expected != actual:
+                UPLOADS.inc("checksum_mismatch")
+                raise UploadError(422, f"SHA-256 mismatch: expected {expected}, received {actual}")
+
+            safe_name = f"{uuid.uuid4()}_{upload.filename}"
+            path = os.path.join(UPLOADS_DIR, safe_name)
+            os.replace(upload.part_path, path)
+            os.remove(upload.state_path)
+            self.uploads.pop(upload_id, None)
+        UPLOADS.inc("completed")
+        return {"filename": upload.filename, "path": path, "size": upload.size, "sha256": actual}
+
+    def delete(self, upload_id: str):
+        upload = self.get(upload_id)
+        if upload.lock.locked():
+            raise UploadError(409, "Upload is being written")
+        self._remove(upload_id)
+
+    def _remove(self, upload_id: str):
+        self.uploads.pop(upload_id, None)
+        for suffix in (".part", ".json"):
+            try:
+                os.remove(os.path.join(INCOMING_DIR, f"{upload_id}{suffix}"))
+            except FileNotFoundError:
+                pass
+
+    def list(self) -> List[Dict]:
+        if not os.path.exists(INCOMING_DIR):
+            return []
+        uploads = []
+        for file in sorted(os.listdir(INCOMING_DIR)):
+            if file.endswith(".json"):
+                try:
+                    uploads.append(self.get(file[:-5]).to_dict())
+                except (UploadError, OSError):
+                    continue
+        return uploads
+
+    def expire(self) -> int:
+        """Remove unfinished uploads idle for longer than UPLOAD_EXPIRY_HOURS"""
+        if not os.path.exists(INCOMING_DIR):
+            return 0
+        cutoff = time.time() - settings.UPLOAD_EXPIRY_HOURS * 3600
+        removed = 0
+        for file in os.listdir(INCOMING_DIR):
+            upload_id, ext = os.path.splitext(file)
+            if ext != ".json":
+                continue
+            upload = self.uploads.get(upload_id)
+            if upload is not None and upload.lock.locked():
+                continue
+            part_path = os.path.join(INCOMING_DIR, f"{upload_id}.part")
+            try:
+                idle_since = os.path.getmtime(part_path if os.path.exists(part_path) else
+                                              os.path.join(INCOMING_DIR, file))
+            except FileNotFoundError:
+                continue
+            if idle_since < cutoff:
+                self._remove(upload_id)
+                removed += 1
+        if removed:
+            UPLOADS.inc("expired", amount=removed)
+        return removed
+
+upload_manager = UploadManager()
@@ -0,0 +1,155 @@
+"""
+Operational transform for plain text
+
+Operations use the ot.js format: a list whose items are a positive int
+(retain n characters), a string (insert it) or a negative int (delete n
+characters). Positions count Unicode code points.
+"""
+from typing import List, Union
+
+Component = Union[int, str]
+
+class OperationError(ValueError):
+    pass
+
+class TextOperation:
+    def __init__(self):
+        self.ops: List[Component] = []
+        self.base_length = 0
+        self.target_length = 0
+
+    @classmethod
+    def from_json(cls, ops: List) -> "TextOperation":
+        operation = cls()
+        for op in ops:
+            if isinstance(op, bool) or not isinstance(op, (int, str)):
+                raise OperationError(f"Invalid operation component: {op!r}")
+            if isinstance(op, str):
+                operation.insert(op)
+            elif op > 0:
+                operation.retain(op)
+            elif op < 0:
+                operation.delete(-op)
+        return operation
+
+    def to_json(self) -> List[Component]:
+        return list(self.ops)
+
+    def retain(self, n: int) -> "TextOperation":
+        if n <= 0:
+            return self
+        self.base_length += n
+        self.target_length += n
+        if self.ops and _is_retain(self.ops[-1]):
+            self.ops[-1] += n
+        else:
+            self.ops.append(n)
+        return self
+
+    def insert(self, text: str) -> "TextOperation":
+        if not text:
+            return self
+        self.target_length += len(text)
+        ops = self.ops
+        if ops and isinstance(ops[-1], str):
+            ops[-1] += text
+        elif ops and _is_delete(ops[-1]):
+            # Keep inserts before deletes so equivalent operations compare equal
+            if len(ops) > 1 and isinstance(ops[-2], str):
+                ops[-2] += text
+            else:
+                ops.insert(len(ops) - 1, text)
+        else:
+            ops.append(text)
+        return self
+
+    def delete(self, n: int) -> "TextOperation":
+        if n <= 0:
+            return self
+        self.base_length += n
+        if self.ops and _is_delete(self.ops[-1]):
+            self.ops[-1] -= n
+        else:
+            self.ops.append(-n)
+        return self
+
+    def apply(self, doc: str) -> str:
+        if len(doc) != self.base_length:
+            raise OperationError("Operation base length does not match document length")
+        parts = []
+        index = 0
+        for op in self.ops:
+            if _is_retain(op):
+                parts.append(doc[index:index + op])
+                index += op
+            elif isinstance(op, str):
+                parts.append(op)
+            else:
+                index -= op
+        return "".join(parts)
+
+def _is_retain(op: Component) -> bool:
+    return isinstance(op, int) and op > 0
+
+def _is_delete(op: Component) -> bool:
+    return isinstance(op, int) and op < 0
+
+def transform(a: TextOperation, b: TextOperation):
+    """
+    Transform concurrent operations a and b (same base document) into
+    (a', b') such that apply(apply(doc, a), b') == apply(apply(doc, b), a')
+    """
+    if a.base_length != b.base_length:
+        raise OperationError("Concurrent operations must have the same base length")
+    a_prime, b_prime = TextOperation(), TextOperation()
+    ops1, ops2 = list(a.ops), list(b.ops)
+    i1 = i2 = 0
+    op1 = ops1[0] if ops1 else None
+    op2 = ops2[0] if ops2 else None
+
+    def next1():
+        nonlocal i1
+        i1 += 1
+        return ops1[i1] if i1 < len(ops1) else None
+
+    def next2():
+        nonlocal i2
+        i2 += 1
+        return ops2[i2] if i2 < len(ops2) else None
+
+    while op1 is not None or op2 is not None:
+        if isinstance(op1, str):
+            a_prime.insert(op1)
+            b_prime.retain(len(op1))
+            op1 = next1()
+            continue
+        if isinstance(op2, str):
+            a_prime.retain(len(op2))
+            b_prime.insert(op2)
+            op2 = next2()
+            continue
+        if op1 is None or op2 is None:
+            raise OperationError("Operations have different lengths")
+
+        if _is_retain(op1) and _is_retain(op2):
+            n = min(op1, op2)
+            a_prime.retain(n)
+            b_prime.retain(n)
+            op1 = op1 - n if op1 > n else next1()
+            op2 = op2 - n if op2 > n else next2()
+        elif _is_delete(op1) and _is_delete(op2):
+            n = min(-op1, -op2)
+            op1 = op1 + n if -op1 > n else next1()
+            op2 = op2 + n if -op2 > n else next2()
+        elif _is_delete(op1) and _is_retain(op2):
+            n = min(-op1, op2)
+            a_prime.delete(n)
+            op1 = op1 + n if -op1 > n else next1()
+            op2 = op2 - n if op2 > n else next2()
+        else:  # retain / delete
+            n = min(op1, -op2)
+            b_prime.delete(n)
+            op1 = op1 - n if op1 > n else next1()
+            op2 = op2 + n if -op2 > n else next2()
+
+    return a_prime, b_prime
@@ -0,0 +1,410 @@
+"""
+End-to-end API benchmark
+
+Seeds a scratch data directory with a fixed synthetic dataset, then drives
+every router (QR, packages, routes, SDR, convert, status, POI, notes,
+geofence, tiles and both WebSockets) at a set concurrency, in-process through
+the ASGI app and/or over a local uvicorn server. Reports p50/p99 latency and
+throughput per scenario plus peak RSS as JSON, tagged with the git commit so
+runs can be compared across commits.
+
+    cd backend
+    python -m benchmarks.api_bench --mode both --output bench.json
+    python -m benchmarks.api_bench --compare bench.json
+
+Exits with status 1 if any scenario had failed requests, after writing the
+report.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from typing import Callable, Dict, List, Optional
+
+import httpx
+import psutil
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def percentile(samples: List[float], fraction: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+def git_info() -> Dict:
+    def git(*args):
+        try:
+            return subprocess.run(["git", *args], cwd=BACKEND_DIR, capture_output=True,
+                                  text=True, timeout=10).stdout.strip()
+        except (OSError, subprocess.SubprocessError):
+            return ""
+    return {"sha": git("rev-parse", "HEAD") or None, "dirty": bool(git("status", "--porcelain", "--", "."))}
+
+class Scenario:
+    """
+    One benchmarked operation: a request (or WebSocket exchange) built fresh
+    for every iteration
+    """
+    def __init__(self, name: str, method: str, path: Callable[[], str],
+                 body: Optional[Callable[[], Dict]] = None, requests: Optional[int] = None,
+                 kind: str = "json"):
+        self.name = name
+        self.method = method
+        self.path = path
+        self.body = body
+        self.requests = requests  # Overrides --requests for slow endpoints
+        self.kind = kind  # json, multipart, ws_broadcast, ws_collab
+
+class ASGIWebSocket:
+    """Minimal in-process WebSocket client speaking ASGI to the app directly"""
+    def __init__(self, app, path: str):
+        self.app = app
+        self.path = path
+        self.to_app: asyncio.Queue = asyncio.Queue()
+        self.from_app: asyncio.Queue = asyncio.Queue()
+        self.task: Optional[asyncio.Task] = None
+
+    async def __aenter__(self):
+        scope = {
+            "type": "websocket", "asgi": {"version": "3.0"}, "scheme": "ws",
+            "path": self.path, "raw_path": self.path.encode(), "root_path": "",
+            "query_string": b"", "headers": [], "subprotocols": [],
+            "server": ("testserver", 80), "client": ("127.0.0.1", 50000),
+        }
+        self.task = asyncio.create_task(self.app(scope, self.to_app.get, self.from_app.put))
+        await self.to_app.put({"type": "websocket.connect"})
+        message = await self.from_app.get()
+        if message["type"] != "websocket.accept":
+            raise ConnectionError(f"WebSocket rejected: {message}")
+        return self
+
+    async def send(self, text: str):
+        await self.to_app.put({"type": "websocket.receive", "text": text})
+
+    async def recv(self) -> str:
+        message = await self.from_app.get()
+        if message["type"] == "websocket.close":
+            raise ConnectionError("WebSocket closed")
+        return message.get("text") or message["bytes"].decode()
+
+    async def __aexit__(self, *exc):
+        await self.to_app.put({"type": "websocket.disconnect", "code": 1000})
+        await asyncio.wait_for(self.task, 5)
+
+def dataset(args, rng: random.Random) -> Dict:
+    """Fixed synthetic payloads; the same seed gives the same dataset"""
+    def poi():
+        return {
+            "name": f"POI {rng.randrange(10 ** 6)}",
+            "description": "Observed near the northern checkpoint, moving east on foot",
+            "category": rng.choice(["person", "vehicle", "structure"]),
+            "latitude": f"{rng.uniform(34.0, 34.5):.6f}",
+            "longitude": f"{rng.uniform(-118.0, -117.5):.6f}",
+            "metadata": {"source": "patrol", "confidence": round(rng.random(), 3)},
+        }
+
+    def checkpoints(n):
+        return [
+            {"name": f"CP {i}", "latitude": rng.uniform(34.0, 34.2), "longitude": rng.uniform(-118.0, -117.8),
+             "observation_type": "checkpoint", "threat_level": rng.choice(["low", "medium", "high"])}
+            for i in range(n)
+        ]
+
+    waypoints = [
+        {"name": f"WP {i}", "latitude": 34.0 + i * 0.001, "longitude": -118.0 + i * 0.001, "elevation": 100.0}
+        for i in range(100)
+    ]
+    kml = ("<?xml version='1.0' encoding='utf-8'?><kml xmlns=\"http://www.opengis.net/kml/2.2\"><Document>"
+           + "".join(f"<Placemark><name>{w['name']}</name><Point><coordinates>{w['longitude']},"
+                     f"{w['latitude']},0</coordinates></Point></Placemark>" for w in waypoints)
+           + "</Document></kml>").encode()
+    qr = {"server_url": "tak.example.com", "certificate_data": "MIIB" + "A" * 600,
+          "username": "user", "password": "changeme"}
+    return {
+        "poi": poi,
+        "checkpoints": checkpoints,
+        "sdr_checkpoints": checkpoints(args.checkpoints),
+        "route": {"name": "Patrol", "description": "Benchmark route", "waypoints": waypoints},
+        "kml": kml,
+        "qr": qr,
+        "note": lambda: {"title": f"Shift log {rng.randrange(10 ** 6)}",
+                         "content": "Routine patrol, no contact. " * 40, "author": "ops"},
+    }
+
+async def seed(client: httpx.AsyncClient, args, data: Dict) -> Dict:
+    for _ in range(args.pois):
+        (await client.post("/api/poi/create", json=data["poi"]())).raise_for_status()
+    for _ in range(args.notes):
+        (await client.post("/api/notes/create", json=data["note"]())).raise_for_status()
+    sdr = (await client.post("/api/sdr/create", json={
+        "name": "Benchmark SDR", "checkpoints": data["sdr_checkpoints"]
+    })).json()
+    pois = (await client.get("/api/poi/list")).json()
+    notes = (await client.get("/api/notes/list")).json()
+    return {"sdr_id": sdr["id"], "poi_ids": [p["id"] for p in pois], "note_ids": [n["id"] for n in notes]}
+
+def scenarios(args, data: Dict, ids: Dict, rng: random.Random) -> List[Scenario]:
+    poi_id = lambda: rng.choice(ids["poi_ids"])
+    note_id = lambda: rng.choice(ids["note_ids"])
+    return [
+        Scenario("health", "GET", lambda: "/health"),
+        Scenario("qr_generate", "POST", lambda: "/api/qr/generate", lambda: data["qr"]),
+        Scenario("qr_batch_10", "POST", lambda: "/api/qr/batch-generate", lambda: [data["qr"]] * 10,
+                 requests=max(1, args.requests // 10)),
+        Scenario("packages_create", "POST", lambda: "/api/packages/create",
+                 lambda: {"name": f"pkg-{uuid.uuid4().hex[:8]}", "files": ["a.kml", "b.png"]}),
+        Scenario("packages_list", "GET", lambda: "/api/packages/list"),
+        Scenario("routes_create", "POST", lambda: "/api/routes/create", lambda: data["route"]),
+        Scenario("routes_list", "GET", lambda: "/api/routes/list"),
+        Scenario("sdr_create", "POST", lambda: "/api/sdr/create",
+                 lambda: {"name": "Bench", "checkpoints": data["checkpoints"](20)}),
+        Scenario("sdr_get", "GET", lambda: f"/api/sdr/{ids['sdr_id']}"),
+        Scenario("sdr_list", "GET", lambda: "/api/sdr/list"),
+        Scenario("sdr_analytics", "GET", lambda: f"/api/sdr/{ids['sdr_id']}/analytics?loop=true"),
+        Scenario("sdr_optimize", "POST", lambda: "/api/sdr/optimize",
+                 lambda: {"checkpoints": data["sdr_checkpoints"], "time_budget_ms": 200},
+                 requests=max(1, args.requests // 10)),
+        Scenario("convert_kml_to_kmz", "POST", lambda: "/api/convert/kml-to-kmz", kind="multipart"),
+        # Samples CPU over a blocking interval, so keep the count low
+        Scenario("status_current", "GET", lambda: "/api/status/current", requests=max(1, args.requests // 50)),
+        Scenario("status_services", "GET", lambda: "/api/status/services"),
+        Scenario("status_cache", "GET", lambda: "/api/status/cache"),
+        Scenario("poi_create", "POST", lambda: "/api/poi/create", data["poi"]),
+        Scenario("poi_list", "GET", lambda: "/api/poi/list"),
+        Scenario("poi_get", "GET", lambda: f"/api/poi/{poi_id()}"),
+        Scenario("poi_update", "PUT", lambda: f"/api/poi/{poi_id()}", data["poi"]),
+        Scenario("poi_sync", "GET", lambda: "/api/poi/sync?since=0"),
+        Scenario("notes_create", "POST", lambda: "/api/notes/create", data["note"]),
+        Scenario("notes_list", "GET", lambda: "/api/notes/list"),
+        Scenario("notes_get", "GET", lambda: f"/api/notes/{note_id()}"),
+        Scenario("notes_sync", "GET", lambda: "/api/notes/sync?since=0"),
+        Scenario("geofence_positions", "POST", lambda: "/api/geofence/positions", lambda: {"positions": [
+            {"poi_id": rng.randrange(1000), "latitude": rng.uniform(34.0, 34.2),
+             "longitude": rng.uniform(-118.0, -117.8)} for _ in range(100)
+        ]}),
+        Scenario("tiles_stats", "GET", lambda: "/api/tiles/stats"),
+        Scenario("ws_broadcast", "WS", lambda: "/ws", kind="ws_broadcast"),
+        Scenario("ws_collab_edit", "WS", lambda: f"/api/notes/ws/{note_id()}", kind="ws_collab"),
+    ]
+
+async def ws_exchange(connect: Callable, scenario: Scenario):
+    """Open a WebSocket, complete one message round trip, close"""
+    async with connect(scenario.path()) as ws:
+        if scenario.kind == "ws_broadcast":
+            token = uuid.uuid4().hex
+            await ws.send(token)
+            # Other clients' broadcasts may arrive first
+            while json.loads(await ws.recv()).get("message") != token:
+                pass
+        else:
+            init = json.loads(await ws.recv())
+            await ws.send(json.dumps({"type": "op", "revision": init["revision"],
+                                      "ops": [len(init["content"]), "."]}))
+            while json.loads(await ws.recv())["type"] != "ack":
+                pass
+
+async def run_scenario(client: httpx.AsyncClient, connect: Callable, scenario: Scenario,
+                       data: Dict, requests: int, concurrency: int) -> Dict:
+    latencies: List[float] = []
+    errors = 0
+    remaining = requests
+
+    async def worker():
+        nonlocal remaining, errors
+        while remaining > 0:
+            remaining -= 1
+            started = time.perf_counter()
+            try:
+                if scenario.kind.startswith("ws_"):
+                    await ws_exchange(connect, scenario)
+                elif scenario.kind == "multipart":
+                    response = await client.post(scenario.path(), files={
+                        "file": ("route.kml", data["kml"], "application/vnd.google-earth.kml+xml")
+                    })
+                    response.raise_for_status()
+                else:
+                    response = await client.request(
+                        scenario.method, scenario.path(), json=scenario.body() if scenario.body else None
+                    )
+                    response.raise_for_status()
+                latencies.append(time.perf_counter() - started)
+            except Exception:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(min(concurrency, requests))))
+    elapsed = time.perf_counter() - started
+    return {
+        "requests": requests,
+        "errors": errors,
+        "throughput_rps": round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 3),
+        "max_ms": round(max(latencies, default=0.0) * 1000, 3),
+    }
+
+async def sample_rss(pid: int, peak: List[int], stop: asyncio.Event):
+    process = psutil.Process(pid)
+    while not stop.is_set():
+        try:
+            peak[0] = max(peak[0], process.memory_info().rss)
+        except psutil.Error:
+            return
+        await asyncio.sleep(0.05)
+
+async def run_suite(client: httpx.AsyncClient, connect: Callable, args, pid: int) -> Dict:
+    rng = random.Random(args.seed)
+    data = dataset(args, rng)
+    seed_started = time.perf_counter()
+    ids = await seed(client, args, data)
+    seed_seconds = time.perf_counter() - seed_started
+
+    peak = [0]
+    stop = asyncio.Event()
+    sampler = asyncio.create_task(sample_rss(pid, peak, stop))
+    results = {}
+    for scenario in scenarios(args, data, ids, rng):
+        if args.only and scenario.name not in args.only:
+            continue
+        results[scenario.name] = await run_scenario(
+            client, connect, scenario, data, scenario.requests or args.requests, args.concurrency
+        )
+        print(f"  {scenario.name}: {results[scenario.name]}", file=sys.stderr)
+    stop.set()
+    await sampler
+    return {"seed_seconds": round(seed_seconds, 2), "peak_rss_mb": round(peak[0] / 2 ** 20, 1),
+            "scenarios": results}
+
+async def bench_inprocess(args) -> Dict:
+    import main as app_main
+
+    app = app_main.app
+    await app.router.startup()
+    try:
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://testserver") as client:
+            return await run_suite(client, lambda path: ASGIWebSocket(app, path), args, os.getpid())
+    finally:
+        await app.router.shutdown()
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+async def bench_uvicorn(args, workdir: str) -> Dict:
+    import websockets
+
+    port = args.port or free_port()
+    env = {**os.environ, "PYTHONPATH": BACKEND_DIR}
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port),
+         "--log-level", "warning"],
+        cwd=workdir, env=env
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    try:
+        limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+        async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60.0) as client:
+            for _ in range(100):
+                try:
+                    if (await client.get("/health")).status_code == 200:
+                        break
+                except httpx.TransportError:
+                    pass
+                await asyncio.sleep(0.1)
+            else:
+                raise RuntimeError("uvicorn did not start")
+            connect = lambda path: websockets.connect(f"ws://127.0.0.1:{port}{path}")
+            return await run_suite(client, connect, args, server.pid)
+    finally:
+        server.terminate()
+        server.wait(timeout=10)
+
+def compare(report: Dict, baseline: Dict) -> Dict:
+    """Per-scenario p50/p99/throughput ratios against a previous run (>1 means slower)"""
+    deltas = {}
+    for mode, result in report["modes"].items():
+        previous = baseline.get("modes", {}).get(mode, {}).get("scenarios", {})
+        for name, current in result["scenarios"].items():
+            before = previous.get(name)
+            if not before:
+                continue
+            deltas.setdefault(mode, {})[name] = {
+                "p50_ratio": round(current["p50_ms"] / before["p50_ms"], 2) if before["p50_ms"] else None,
+                "p99_ratio": round(current["p99_ms"] / before["p99_ms"], 2) if before["p99_ms"] else None,
+                "throughput_ratio": round(before["throughput_rps"] / current["throughput_rps"], 2)
+                                    if current["throughput_rps"] else None,
+            }
+    return {"baseline_sha": baseline.get("git", {}).get("sha"), "scenarios": deltas}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--mode", choices=["inprocess", "uvicorn", "both"], default="inprocess")
+    parser.add_argument("--requests", type=int, default=200, help="Requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--pois", type=int, default=500)
+    parser.add_argument("--notes", type=int, default=200)
+    parser.add_argument("--checkpoints", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--port", type=int, default=None)
+    parser.add_argument("--only", nargs="*", help="Run only these scenarios")
+    parser.add_argument("--output", help="Write the JSON report here as well as stdout")
+    parser.add_argument("--compare", help="Previous report to compare against")
+    args = parser.parse_args()
+    # The in-process run changes directory into its scratch data directory
+    args.output = os.path.abspath(args.output) if args.output else None
+    args.compare = os.path.abspath(args.compare) if args.compare else None
+
+    report = {
+        "git": git_info(),
+        "started_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "parameters": {key: value for key, value in vars(args).items() if key not in ("output", "compare")},
+        "modes": {},
+    }
+    modes = ["inprocess", "uvicorn"] if args.mode == "both" else [args.mode]
+    for mode in modes:
+        # Fresh data directory per mode so both start from the same dataset
+        workdir = tempfile.mkdtemp(prefix=f"otg-api-bench-{mode}-")
+        os.makedirs(os.path.join(workdir, "data"))
+        os.environ["DATABASE_URL"] = f"sqlite:///{workdir}/data/bench.db"
+        print(f"{mode}: {workdir}", file=sys.stderr)
+        if mode == "inprocess":
+            os.chdir(workdir)
+            sys.path.insert(0, BACKEND_DIR)
+            report["modes"][mode] = asyncio.run(bench_inprocess(args))
+        else:
+            report["modes"][mode] = asyncio.run(bench_uvicorn(args, workdir))
+
+    if args.compare:
+        with open(args.compare, 'r') as f:
+            report["comparison"] = compare(report, json.load(f))
+
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output)
+
+    failing = [f"{mode}/{name} ({scenario['errors']} errors)"
+               for mode, result in report["modes"].items()
+               for name, scenario in result["scenarios"].items() if scenario["errors"]]
+    if failing:
+        print(f"Scenarios with errors: {', '.join(failing)}", file=sys.stderr)
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,130 @@
+"""
+Concurrent read/write database benchmark
+
+Runs concurrent writers (notes, POIs, server metrics) and readers against a
+scratch database built with a given engine profile and prints a JSON report.
+
+    cd backend
+    python -m benchmarks.db_concurrency --profile production
+    python -m benchmarks.db_concurrency --profile default
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import tempfile
+import time
+from typing import Dict, List
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import sessionmaker
+
+from app.core.database import Base, make_engine
+from app.models.models import Note, POI, ServerMetrics
+
+CATEGORIES = ["general", "vehicle", "person", "structure"]
+
+def percentile(samples: List[float], pct: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+def summarize(latencies: List[float], errors: int, duration: float) -> Dict:
+    return {
+        "operations": len(latencies),
+        "errors": errors,
+        "ops_per_second": round(len(latencies) / duration, 1),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 3),
+        "mean_ms": round(statistics.fmean(latencies) * 1000, 3) if latencies else 0.0,
+    }
+
+async def writer(Session, deadline: float, latencies: List[float], errors: List[int]):
+    n = 0
+    while time.monotonic() < deadline:
+        started = time.monotonic()
+        try:
+            async with Session() as session:
+                kind = n % 3
+                if kind == 0:
+                    session.add(Note(title=f"note {n}", content="x" * 512, author="bench"))
+                elif kind == 1:
+                    session.add(POI(
+                        name=f"poi {n}",
+                        category=random.choice(CATEGORIES),
+                        latitude=f"{random.uniform(-90, 90):.6f}",
+                        longitude=f"{random.uniform(-180, 180):.6f}",
+                        poi_metadata={"source": "bench"}
+                    ))
+                else:
+                    session.add(ServerMetrics(cpu_usage=random.randint(0, 100), memory_usage=50,
+                                              disk_usage=40, network_in=n, network_out=n,
+                                              active_connections=0))
+                await session.commit()
+            latencies.append(time.monotonic() - started)
+        except Exception:
+            errors[0] += 1
+        n += 1
+
+async def reader(Session, deadline: float, latencies: List[float], errors: List[int]):
+    n = 0
+    while time.monotonic() < deadline:
+        started = time.monotonic()
+        try:
+            async with Session() as session:
+                if n % 2:
+                    query = select(Note).where(Note.shared == True).order_by(Note.created_at.desc()).limit(50)
+                else:
+                    query = select(POI).where(POI.category == random.choice(CATEGORIES)).limit(50)
+                (await session.execute(query)).scalars().all()
+            latencies.append(time.monotonic() - started)
+        except Exception:
+            errors[0] += 1
+        n += 1
+
+async def run(profile: str, writers: int, readers: int, duration: float, database_url: str) -> Dict:
+    engine = make_engine(database_url, profile)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    Session = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+
+    write_latencies: List[float] = []
+    read_latencies: List[float] = []
+    write_errors, read_errors = [0], [0]
+    deadline = time.monotonic() + duration
+    await asyncio.gather(
+        *(writer(Session, deadline, write_latencies, write_errors) for _ in range(writers)),
+        *(reader(Session, deadline, read_latencies, read_errors) for _ in range(readers)),
+    )
+    await engine.dispose()
+
+    return {
+        "profile": profile,
+        "writers": writers,
+        "readers": readers,
+        "duration_seconds": duration,
+        "writes": summarize(write_latencies, write_errors[0], duration),
+        "reads": summarize(read_latencies, read_errors[0], duration),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--profile", default="production", choices=["production", "default"])
+    parser.add_argument("--writers", type=int, default=8)
+    parser.add_argument("--readers", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--database-url", help="Defaults to a scratch SQLite file")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        database_url = args.database_url or f"sqlite:///{os.path.join(tmp, 'bench.db')}"
+        report = asyncio.run(run(args.profile, args.writers, args.readers, args.duration, database_url))
+    print(json.dumps(report, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""
+Geofence evaluation benchmark
+
+Indexes synthetic circle and polygon fences scattered over a region, then
+replays random POI position updates through the engine and reports
+per-update latency percentiles and throughput as JSON.
+
+    cd backend
+    python -m benchmarks.geofence --fences 5000 --updates 100000
+"""
+import argparse
+import json
+import math
+import os
+import random
+import sys
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def percentile(samples, fraction: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+def synthetic_sdr(index: int, region: float, rng: random.Random) -> dict:
+    lat, lon = 34.0 + rng.uniform(0, region), -118.0 + rng.uniform(0, region)
+    if index % 2:
+        area = {"type": "circle", "center": [lat, lon], "radius_m": rng.uniform(100, 2000)}
+    else:
+        size = rng.uniform(0.002, 0.02)
+        ring = [
+            [lon + size * math.cos(a), lat + size * math.sin(a)]
+            for a in (2 * math.pi * k / 8 for k in range(8))
+        ]
+        area = {"type": "Polygon", "coordinates": [ring + [ring[0]]]}
+    return {"id": f"bench_{index}", "name": f"Fence {index}", "area_of_interest": area, "checkpoints": []}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--fences", type=int, default=5000)
+    parser.add_argument("--updates", type=int, default=100000)
+    parser.add_argument("--pois", type=int, default=500)
+    parser.add_argument("--region", type=float, default=1.0, help="Region size in degrees")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    sys.path.insert(0, BACKEND_DIR)
+    from app.services.geofence_service import GeofenceEngine
+
+    rng = random.Random(args.seed)
+    engine = GeofenceEngine()
+    started = time.perf_counter()
+    for i in range(args.fences):
+        engine.load_sdr(synthetic_sdr(i, args.region, rng))
+    index_seconds = time.perf_counter() - started
+
+    positions = [
+        (rng.randrange(args.pois), 34.0 + rng.uniform(0, args.region), -118.0 + rng.uniform(0, args.region))
+        for _ in range(args.updates)
+    ]
+    latencies = []
+    events = 0
+    started = time.perf_counter()
+    for n, (poi_id, lat, lon) in enumerate(positions):
+        t = time.perf_counter()
+        events += len(engine.evaluate(poi_id, lat, lon, timestamp=float(n)))
+        latencies.append(time.perf_counter() - t)
+    elapsed = time.perf_counter() - started
+
+    print(json.dumps({
+        "fences": len(engine.fences),
+        "grid_cells": len(engine.grid),
+        "index_build_ms": round(index_seconds * 1000, 1),
+        "updates": args.updates,
+        "events": events,
+        "updates_per_second": round(args.updates / elapsed),
+        "p50_us": round(percentile(latencies, 0.50) * 1e6, 2),
+        "p99_us": round(percentile(latencies, 0.99) * 1e6, 2),
+        "max_us": round(max(latencies) * 1e6, 2),
+    }, indent=2))
+
+if __name__ == "__main__":
+    main()
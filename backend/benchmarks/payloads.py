@@ -0,0 +1,115 @@
+"""
+Bytes-on-wire and JSON serialization benchmark
+
+Seeds a scratch database with synthetic data, fetches the large-payload
+endpoints in-process with identity, gzip and zstd encodings, and times the
+stdlib and orjson encoders on each payload. Prints a JSON report.
+
+    cd backend
+    python -m benchmarks.payloads
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from typing import Callable, Dict
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def encoder_cpu(encode: Callable, payload, iterations: int) -> float:
+    """CPU milliseconds per encode"""
+    started = time.process_time()
+    for _ in range(iterations):
+        encode(payload)
+    return round((time.process_time() - started) * 1000 / iterations, 3)
+
+def wire_bytes(response) -> int:
+    return int(response.headers.get("content-length") or response.num_bytes_downloaded)
+
+def seed(client, pois: int, notes: int, checkpoints: int) -> Dict[str, str]:
+    for i in range(pois):
+        client.post("/api/poi/create", json={
+            "name": f"POI {i}",
+            "description": "Observed near the northern checkpoint, moving east on foot",
+            "category": random.choice(["person", "vehicle", "structure"]),
+            "latitude": f"{random.uniform(34.0, 35.0):.6f}",
+            "longitude": f"{random.uniform(-118.0, -117.0):.6f}",
+            "metadata": {"source": "patrol", "confidence": random.random(), "tags": ["a", "b"]},
+        })
+    for i in range(notes):
+        client.post("/api/notes/create", json={
+            "title": f"Shift log {i}",
+            "content": "Routine patrol, no contact. " * 20,
+            "author": "ops",
+        })
+    sdr = client.post("/api/sdr/create", json={
+        "name": "Benchmark SDR",
+        "checkpoints": [
+            {
+                "name": f"CP {i}",
+                "latitude": 34.0 + i * 0.001,
+                "longitude": -118.0 + i * 0.001,
+                "observation_type": "checkpoint",
+                "notes": "Check for repeat vehicles",
+                "threat_level": random.choice(["low", "medium", "high"]),
+            }
+            for i in range(checkpoints)
+        ],
+    }).json()
+    return {"sdr_id": sdr["id"]}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--pois", type=int, default=500)
+    parser.add_argument("--notes", type=int, default=200)
+    parser.add_argument("--checkpoints", type=int, default=200)
+    parser.add_argument("--qr-batch", type=int, default=10)
+    parser.add_argument("--iterations", type=int, default=50)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="otg-bench-")
+    os.makedirs(os.path.join(workdir, "data"))
+    os.chdir(workdir)
+    os.environ.setdefault("DATABASE_URL", f"sqlite:///{workdir}/data/bench.db")
+    os.environ["RESPONSE_CACHE_ENABLED"] = "false"
+    sys.path.insert(0, BACKEND_DIR)
+
+    from fastapi.testclient import TestClient
+    from starlette.responses import JSONResponse
+    from app.core.responses import orjson
+    import main as app_main
+
+    report = {"endpoints": {}}
+    with TestClient(app_main.app) as client:
+        ids = seed(client, args.pois, args.notes, args.checkpoints)
+        qr_batch = [
+            {"server_url": "tak.example.com", "certificate_data": "MIIB" + "A" * 600,
+             "username": f"user{i}", "password": "changeme"}
+            for i in range(args.qr_batch)
+        ]
+        endpoints = {
+            "qr_batch": ("POST", "/api/qr/batch-generate", qr_batch),
+            "sdr_get": ("GET", f"/api/sdr/{ids['sdr_id']}", None),
+            "poi_list": ("GET", "/api/poi/list", None),
+            "notes_list": ("GET", "/api/notes/list", None),
+        }
+        for name, (method, path, body) in endpoints.items():
+            result = {}
+            for encoding in ("identity", "gzip", "zstd"):
+                response = client.request(method, path, json=body, headers={"Accept-Encoding": encoding})
+                result[f"{encoding}_bytes"] = wire_bytes(response)
+                result[f"{encoding}_content_encoding"] = response.headers.get("content-encoding", "identity")
+                if encoding == "identity":
+                    payload = response.json()
+            result["stdlib_json_cpu_ms"] = encoder_cpu(lambda p: JSONResponse(p).body, payload, args.iterations)
+            if orjson is not None:
+                result["orjson_cpu_ms"] = encoder_cpu(orjson.dumps, payload, args.iterations)
+            report["endpoints"][name] = result
+
+    print(json.dumps(report, indent=2))
+
+if __name__ == "__main__":
+    main()
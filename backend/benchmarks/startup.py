@@ -0,0 +1,76 @@
+"""
+Cold start benchmark
+
+Starts the app in fresh interpreters - import main, run the startup handlers -
+and reports median time to ready and peak RSS for the full profile (every
+router imported eagerly) against lazy and minimal field-kit profiles.
+
+    cd backend
+    python -m benchmarks.startup --runs 5
+    STARTUP_PROFILE=1 python -m benchmarks.startup --runs 1 --profiles minimal
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+MINIMAL_FEATURES = ["server_status", "poi_tracker", "notepad"]
+
+PROFILES = {
+    "full": {"LAZY_ROUTERS": "false"},
+    "full_lazy": {"LAZY_ROUTERS": "true"},
+    "minimal": {"LAZY_ROUTERS": "true", "API_FEATURES": json.dumps(MINIMAL_FEATURES)},
+}
+
+CHILD = """
+import asyncio, json, resource, sys, time
+started = time.perf_counter()
+sys.path.insert(0, {backend!r})
+from main import app
+asyncio.run(app.router.startup())
+ready_ms = (time.perf_counter() - started) * 1000
+print(json.dumps({{"ready_ms": ready_ms, "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+                  "modules": len(sys.modules)}}))
+"""
+
+def run_once(profile: str) -> dict:
+    workdir = tempfile.mkdtemp(prefix="otg-startup-")
+    os.makedirs(os.path.join(workdir, "data"))
+    env = {**os.environ, **PROFILES[profile], "DATABASE_URL": f"sqlite:///{workdir}/data/startup.db"}
+    result = subprocess.run(
+        [sys.executable, "-c", CHILD.format(backend=BACKEND_DIR)],
+        cwd=workdir, env=env, capture_output=True, text=True, timeout=120
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"{profile} failed to start:\n{result.stderr}")
+    if env.get("STARTUP_PROFILE"):
+        print(result.stdout.rsplit("\n", 2)[0], file=sys.stderr)
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--runs", type=int, default=5, help="Cold starts per profile")
+    parser.add_argument("--profiles", nargs="*", choices=list(PROFILES), default=list(PROFILES))
+    args = parser.parse_args()
+
+    report = {}
+    for profile in args.profiles:
+        runs = [run_once(profile) for _ in range(args.runs)]
+        report[profile] = {
+            "ready_ms": round(statistics.median(run["ready_ms"] for run in runs), 1),
+            "peak_rss_mb": round(statistics.median(run["peak_rss_mb"] for run in runs), 1),
+            "modules": runs[-1]["modules"],
+        }
+    if "full" in report:
+        for profile, result in report.items():
+            result["ready_vs_full"] = round(result["ready_ms"] / report["full"]["ready_ms"], 2)
+            result["rss_vs_full"] = round(result["peak_rss_mb"] / report["full"]["peak_rss_mb"], 2)
+    print(json.dumps(report, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -2,31 +2,43 @@
 OTG-TAK Backend API
 On-The-Go TAK Deployment System
 """
+import os
+import sys
+
+from app.core import startup_profiler
+
+if startup_profiler.requested():
+    startup_profiler.enable()
+
 from fastapi import FastAPI, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
-import os
+from fastapi.responses import Response
 
-from app.api import (
-    deployment,
-    qr_generator,
-    data_packages,
-    routes,
-    sdr,
-    file_converter,
-    server_status,
-    poi_tracker,
-    notepad
-)
+from app.api import include_routers
+from app.core.compression import CompressionMiddleware
 from app.core.config import settings
 from app.core.database import init_db
+from app.core.metrics import CONTENT_TYPE, MetricsMiddleware, registry
+from app.core.profiling import ProfilingMiddleware
+from app.core.responses import DefaultJSONResponse
+from app.core.websocket import manager
 
 app = FastAPI(
     title="OTG-TAK API",
     description="On-The-Go TAK Deployment System API",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=DefaultJSONResponse
 )
 
+# Compress large responses for low-bandwidth Tailscale/Zerotier links
+if settings.COMPRESSION_ENABLED:
+    app.add_middleware(
+        CompressionMiddleware,
+        minimum_size=settings.COMPRESSION_MINIMUM_SIZE,
+        gzip_level=settings.COMPRESSION_GZIP_LEVEL,
+        zstd_level=settings.COMPRESSION_ZSTD_LEVEL
+    )
+
 # CORS middleware
 app.add_middleware(
     CORSMiddleware,
@@ -36,6 +48,14 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Request, database and WebSocket metrics (outside compression, so timings include it)
+if settings.METRICS_ENABLED:
+    app.add_middleware(MetricsMiddleware)
+
+# On-demand and slow-request profiling (added last, so outermost)
+if settings.PROFILING_ENABLED:
+    app.add_middleware(ProfilingMiddleware)
+
 # Initialize database on startup
 @app.on_event("startup")
 async def startup_event():
@@ -45,36 +65,42 @@ async def startup_event():
     os.makedirs("data/packages", exist_ok=True)
     os.makedirs("data/notes", exist_ok=True)
     os.makedirs("data/uploads", exist_ok=True)
+    if "notepad" in settings.API_FEATURES:
+        from app.services.collab_service import collab_manager
+        collab_manager.start()
+    # Fences come from saved SDRs and POIs
+    if {"geofence", "sdr", "poi_tracker"} & set(settings.API_FEATURES):
+        from app.services.geofence_service import geofence_engine
+        print(f"Geofence: indexed {geofence_engine.load_directory()} fences")
+    if settings.STREAM_MONITOR_ENABLED and "server_status" in settings.API_FEATURES:
+        from app.services.stream_monitor_service import stream_monitor
+        stream_monitor.start()
+    if settings.CERT_POOL_SIZE > 0 and {"certificates", "qr_generator"} & set(settings.API_FEATURES):
+        from app.services.cert_service import key_pool
+        key_pool.refill()
+    startup_profiler.report()
 
-# Include routers
-app.include_router(deployment.router, prefix="/api/deployment", tags=["Deployment"])
-app.include_router(qr_generator.router, prefix="/api/qr", tags=["QR Generator"])
-app.include_router(data_packages.router, prefix="/api/packages", tags=["Data Packages"])
-app.include_router(routes.router, prefix="/api/routes", tags=["Routes"])
-app.include_router(sdr.router, prefix="/api/sdr", tags=["SDR"])
-app.include_router(file_converter.router, prefix="/api/convert", tags=["File Converter"])
-app.include_router(server_status.router, prefix="/api/status", tags=["Server Status"])
-app.include_router(poi_tracker.router, prefix="/api/poi", tags=["POI Tracker"])
-app.include_router(notepad.router, prefix="/api/notes", tags=["Notepad"])
-
-# WebSocket for real-time updates
-class ConnectionManager:
-    def __init__(self):
-        self.active_connections: list[WebSocket] = []
-
-    async def connect(self, websocket: WebSocket):
-        await websocket.accept()
-        self.active_connections.append(websocket)
+@app.on_event("shutdown")
+async def shutdown_event():
+    if "notepad" in settings.API_FEATURES:
+        # Persist in-flight collaborative edits
+        from app.services.collab_service import collab_manager
+        await collab_manager.stop()
+    if settings.STREAM_MONITOR_ENABLED and "server_status" in settings.API_FEATURES:
+        from app.services.stream_monitor_service import stream_monitor
+        await stream_monitor.stop()
+    cert_service = sys.modules.get("app.services.cert_service")
+    if cert_service is not None:
+        cert_service.key_pool.shutdown()
+    # Only opened if a tile or package router was loaded
+    tile_cache_service = sys.modules.get("app.services.tile_cache_service")
+    if tile_cache_service is not None:
+        tile_cache_service.tile_cache.close()
 
-    def disconnect(self, websocket: WebSocket):
-        self.active_connections.remove(websocket)
-
-    async def broadcast(self, message: dict):
-        for connection in self.active_connections:
-            await connection.send_json(message)
-
-manager = ConnectionManager()
+# Include routers (only the enabled features; imported on first use with LAZY_ROUTERS)
+include_routers(app, settings.API_FEATURES, lazy=settings.LAZY_ROUTERS)
 
+# WebSocket for real-time updates
 @app.websocket("/ws")
 async def websocket_endpoint(websocket: WebSocket):
     await manager.connect(websocket)
@@ -93,6 +119,10 @@ async def root():
         "docs": "/docs"
     }
 
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    return Response(registry.render(), media_type=CONTENT_TYPE)
+
 @app.get("/health")
 async def health_check():
     return {"status": "healthy"}
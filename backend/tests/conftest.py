@@ -0,0 +1,30 @@
+"""
+Shared test setup: a throwaway SQLite database unless DATABASE_URL is set
+(CI runs the suite against SQLite and PostgreSQL)
+"""
+import asyncio
+import os
+import sys
+import tempfile
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+if "DATABASE_URL" not in os.environ:
+    os.environ["DATABASE_URL"] = f"sqlite:///{tempfile.mkdtemp()}/otg-tak-test.db"
+
+from app.core.database import engine, init_db  # noqa: E402
+
+def run(coroutine):
+    """Run a coroutine on a fresh event loop, closing pooled connections after"""
+    async def main():
+        try:
+            return await coroutine
+        finally:
+            await engine.dispose()
+    return asyncio.run(main())
+
+@pytest.fixture(scope="session", autouse=True)
+def database():
+    run(init_db())
@@ -0,0 +1,118 @@
+import asyncio
+import json
+
+import pytest
+
+from app.core.config import settings
+from app.services.health_service import HealthProber, probe_tak_server, probe_traefik
+
+from .conftest import run
+
+async def start_http_stub(status: int, body, delay: float = 0):
+    """Local HTTP server answering every request with one JSON response"""
+    payload = json.dumps(body).encode()
+
+    async def handle(reader, writer):
+        await reader.readuntil(b"\r\n\r\n")
+        await asyncio.sleep(delay)
+        writer.write(
+            f"HTTP/1.1 {status} Stub\r\nContent-Type: application/json\r\n"
+            f"Content-Length: {len(payload)}\r\nConnection: close\r\n\r\n".encode() + payload
+        )
+        await writer.drain()
+        writer.close()
+
+    return await asyncio.start_server(handle, "127.0.0.1", 0)
+
+def port_of(server) -> int:
+    return server.sockets[0].getsockname()[1]
+
+@pytest.fixture
+def stub_settings(monkeypatch):
+    def point(**values):
+        for key, value in values.items():
+            monkeypatch.setattr(settings, key, value)
+    return point
+
+def test_tak_server_up_then_down(stub_settings):
+    async def scenario():
+        server = await asyncio.start_server(lambda reader, writer: writer.close(), "127.0.0.1", 0)
+        stub_settings(TAK_SERVER_HOST="127.0.0.1", TAK_SERVER_DEFAULT_PORT=port_of(server))
+        prober = HealthProber(probes={"tak_server": probe_tak_server}, ttl=0)
+
+        results = await prober.check()
+        assert results["tak_server"]["status"] == "running"
+        assert prober.history() == []
+
+        server.close()
+        await server.wait_closed()
+        results = await prober.check()
+        assert results["tak_server"]["status"] == "stopped"
+        assert results["tak_server"]["since"] == results["tak_server"]["checked_at"]
+        [change] = prober.history("tak_server")
+        assert (change["from"], change["to"]) == ("running", "stopped")
+    run(scenario())
+
+def test_http_probe_reports_api_errors_as_down(stub_settings):
+    async def scenario():
+        entrypoints = [{"name": "web", "address": ":80"}, {"name": "websecure", "address": ":443"}]
+        server = await start_http_stub(200, entrypoints)
+        stub_settings(TRAEFIK_API_URL=f"http://127.0.0.1:{port_of(server)}/")
+        prober = HealthProber(probes={"traefik": probe_traefik}, ttl=0)
+
+        results = await prober.check()
+        assert results["traefik"]["status"] == "running"
+        assert results["traefik"]["https_enabled"] is True
+        assert results["traefik"]["entrypoints"] == ["web", "websecure"]
+        server.close()
+        await server.wait_closed()
+
+        server = await start_http_stub(500, {"error": "boom"})
+        stub_settings(TRAEFIK_API_URL=f"http://127.0.0.1:{port_of(server)}")
+        results = await prober.check()
+        assert results["traefik"]["status"] == "stopped"
+        assert "500" in results["traefik"]["error"]
+        assert [t["to"] for t in prober.history()] == ["stopped"]
+        server.close()
+        await server.wait_closed()
+    run(scenario())
+
+def test_slow_service_times_out(stub_settings):
+    async def scenario():
+        server = await start_http_stub(200, [], delay=5)
+        stub_settings(TRAEFIK_API_URL=f"http://127.0.0.1:{port_of(server)}")
+        prober = HealthProber(probes={"traefik": probe_traefik}, timeout=0.2)
+
+        results = await prober.check()
+        assert results["traefik"]["status"] == "timeout"
+        assert results["traefik"]["latency_ms"] < 2000
+        server.close()
+    run(scenario())
+
+def test_round_is_cached_and_shared():
+    async def scenario():
+        calls = 0
+
+        async def probe():
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(0.05)
+            return {"status": "running"}
+
+        prober = HealthProber(probes={"stub": probe}, ttl=60)
+        # Concurrent callers wait on one round
+        rounds = await asyncio.gather(*(prober.check() for _ in range(10)))
+        assert calls == 1 and prober.rounds == 1
+        assert all(result["stub"]["status"] == "running" for result in rounds)
+
+        # Within the TTL the cached round is served
+        await prober.check()
+        assert calls == 1
+
+        await prober.check(force=True)
+        assert calls == 2 and prober.rounds == 2
+
+        prober.ttl = 0
+        await prober.check()
+        assert calls == 3
+    run(scenario())
@@ -0,0 +1,18 @@
+from sqlalchemy import inspect, text
+
+from app.core.database import engine
+from app.core.migrations import MIGRATIONS, run_migrations
+
+from .conftest import run
+
+def test_migrations_apply_once():
+    async def scenario():
+        # init_db already migrated; running again must be a no-op
+        async with engine.begin() as conn:
+            await run_migrations(conn)
+        async with engine.connect() as conn:
+            result = await conn.execute(text("SELECT version FROM schema_migrations ORDER BY version"))
+            assert [row[0] for row in result] == [version for version, _, _ in MIGRATIONS]
+            indexes = await conn.run_sync(lambda sync_conn: inspect(sync_conn).get_indexes("pois"))
+        assert "ix_pois_category" in {index["name"] for index in indexes}
+    run(scenario())
@@ -0,0 +1,163 @@
+import asyncio
+import random
+import string
+import time
+
+from app.api.notepad import NoteRequest, delete_note, update_note
+from app.core.database import AsyncSessionLocal
+from app.models.models import Note
+from app.services.collab_service import CollabManager
+from app.services import revision_service
+from app.services.revision_service import diff_operation, list_revisions, reconstruct, record_revision
+from app.utils.ot import TextOperation
+
+from .conftest import run
+
+class FakeWebSocket:
+    def __init__(self):
+        self.messages = []
+
+    async def send_json(self, message):
+        self.messages.append(message)
+
+async def create_note(content: str) -> int:
+    async with AsyncSessionLocal() as db:
+        note = Note(title="test", content=content, author="tester", shared=True)
+        db.add(note)
+        await db.flush()
+        await record_revision(db, note.id, None, content, "tester")
+        await db.commit()
+        return note.id
+
+async def put(note_id: int, content: str):
+    async with AsyncSessionLocal() as db:
+        await update_note(note_id, NoteRequest(title="test", content=content, author="tester"), db)
+
+async def revisions(note_id: int):
+    async with AsyncSessionLocal() as db:
+        return await list_revisions(db, note_id)
+
+async def content_at(note_id: int, revision: int):
+    async with AsyncSessionLocal() as db:
+        return await reconstruct(db, note_id, revision)
+
+def test_reconstruct_every_revision():
+    async def scenario():
+        versions = ["alpha"]
+        note_id = await create_note(versions[0])
+        for i in range(45):
+            versions.append(versions[-1] + f" line {i}\n" if i % 3 else f"rewrite {i}: " + versions[-1][5:])
+            await put(note_id, versions[-1])
+        recorded = await revisions(note_id)
+        assert [r["revision"] for r in recorded] == list(range(1, len(versions) + 1))
+        assert recorded[0]["is_keyframe"] and recorded[20]["is_keyframe"]
+        assert not all(r["is_keyframe"] for r in recorded)
+        for revision, expected in enumerate(versions, start=1):
+            assert await content_at(note_id, revision) == expected
+        assert await content_at(note_id, len(versions) + 1) is None
+    run(scenario())
+
+def test_unchanged_content_records_no_revision():
+    async def scenario():
+        note_id = await create_note("same")
+        await put(note_id, "same")
+        await put(note_id, "same")
+        assert len(await revisions(note_id)) == 1
+    run(scenario())
+
+def test_concurrent_writers_get_distinct_revisions():
+    async def scenario():
+        note_id = await create_note("")
+        manager = CollabManager()
+        websocket = FakeWebSocket()
+        session = await manager.join(note_id, websocket)
+
+        async def edit(i):
+            await manager.submit(note_id, websocket, session.revision,
+                                 TextOperation().retain(len(session.content)).insert(f"e{i};").to_json())
+            await manager.compact(session)
+
+        await asyncio.gather(*(put(note_id, f"put {i};") for i in range(10)),
+                             *(edit(i) for i in range(10)))
+        await manager.leave(note_id, websocket)
+
+        recorded = await revisions(note_id)
+        assert [r["revision"] for r in recorded] == list(range(1, len(recorded) + 1))
+        async with AsyncSessionLocal() as db:
+            note = await db.get(Note, note_id)
+        assert await content_at(note_id, recorded[-1]["revision"]) == note.content
+    run(scenario())
+
+def test_leave_keeps_unpersisted_edits():
+    async def scenario():
+        note_id = await create_note("base")
+        manager = CollabManager()
+        first, second = FakeWebSocket(), FakeWebSocket()
+        session = await manager.join(note_id, first)
+        await manager.submit(note_id, first, 0, TextOperation().retain(4).insert(" one").to_json())
+
+        # A compaction holding the note lock makes leave() queue behind it
+        # while another edit arrives
+        leaving = asyncio.ensure_future(manager.leave(note_id, first))
+        await asyncio.sleep(0)
+        rejoined = await manager.join(note_id, second)
+        await manager.submit(note_id, second, rejoined.revision,
+                             TextOperation().retain(len(rejoined.content)).insert(" two").to_json())
+        await leaving
+        await manager.leave(note_id, second)
+
+        assert note_id not in manager.sessions
+        async with AsyncSessionLocal() as db:
+            note = await db.get(Note, note_id)
+        assert note.content == "base one two"
+        assert session is rejoined or not session.dirty
+    run(scenario())
+
+def test_delete_is_serialized_with_compaction():
+    async def scenario():
+        note_id = await create_note("base")
+        manager = CollabManager()
+        websocket = FakeWebSocket()
+        session = await manager.join(note_id, websocket)
+        await manager.submit(note_id, websocket, 0, TextOperation().retain(4).insert(" edit").to_json())
+
+        async def delete():
+            async with AsyncSessionLocal() as db:
+                await delete_note(note_id, db)
+
+        await asyncio.gather(delete(), manager.compact(session), delete(), return_exceptions=True)
+
+        async with AsyncSessionLocal() as db:
+            assert await db.get(Note, note_id) is None
+        assert await revisions(note_id) == []
+        assert note_id not in revision_service._note_locks
+    run(scenario())
+
+def test_diff_operation_round_trips():
+    rng = random.Random(7)
+    lines = [f"line {i} " + "".join(rng.choice(string.ascii_letters) for _ in range(rng.randint(0, 60))) + "\n"
+             for i in range(400)]
+    old = "".join(lines)
+    edited = list(lines)
+    for _ in range(20):
+        i = rng.randrange(len(edited))
+        edited[i] = edited[i][:5] + "changed" + edited[i][5:] if rng.random() < 0.7 else ""
+    edited.insert(50, "a brand new line\n")
+    cases = [
+        (old, "".join(edited)),
+        ("", old),
+        (old, ""),
+        ("abc", "abXc"),
+        ("".join(rng.choice(string.ascii_letters) for _ in range(10000)),
+         "".join(rng.choice(string.ascii_letters) for _ in range(10000))),
+    ]
+    for before, after in cases:
+        assert diff_operation(before, after).apply(before) == after
+
+def test_large_unrelated_edit_is_not_char_diffed():
+    rng = random.Random(3)
+    old = "".join(rng.choice(string.ascii_letters) for _ in range(10000))
+    new = "".join(rng.choice(string.ascii_letters) for _ in range(10000))
+    started = time.perf_counter()
+    assert diff_operation(old, new).apply(old) == new
+    assert time.perf_counter() - started < 0.5
@@ -0,0 +1,55 @@
+import asyncio
+import random
+
+from app.core.database import AsyncSessionLocal
+from app.services.sync_service import changes_since, latest_change, record_change
+
+from .conftest import run
+
+async def write(entity: str, entity_id: int, operation: str = "upsert", hold: float = 0):
+    async with AsyncSessionLocal() as db:
+        await record_change(db, entity, entity_id, operation)
+        await db.flush()
+        await asyncio.sleep(hold)
+        await db.commit()
+
+async def poll(entity: str, cursor: int):
+    async with AsyncSessionLocal() as db:
+        return await changes_since(db, entity, cursor)
+
+def test_changes_since_keeps_latest_change_per_record():
+    async def scenario():
+        await write("sync-basic", 1)
+        await write("sync-basic", 2)
+        upserted, deleted, cursor = await poll("sync-basic", 0)
+        assert sorted(upserted) == [1, 2] and deleted == []
+
+        await write("sync-basic", 1, "delete")
+        await write("sync-basic", 3)
+        upserted, deleted, new_cursor = await poll("sync-basic", cursor)
+        assert upserted == [3] and deleted == [1]
+        assert new_cursor > cursor
+        assert await poll("sync-basic", new_cursor) == ([], [], new_cursor)
+
+        async with AsyncSessionLocal() as db:
+            latest, changed_at = await latest_change(db, "sync-basic")
+        assert latest == new_cursor and changed_at is not None
+    run(scenario())
+
+def test_cursor_never_skips_a_later_commit():
+    async def scenario():
+        # Writers hold their transactions open for a while after drawing an
+        # id; a client following the cursor must still see every record
+        seen, cursor = set(), 0
+        writers = asyncio.gather(*(
+            write("sync-order", i, hold=random.uniform(0, 0.05)) for i in range(20)
+        ))
+        while not writers.done():
+            upserted, _, cursor = await poll("sync-order", cursor)
+            seen.update(upserted)
+            await asyncio.sleep(0.005)
+        await writers
+        upserted, _, cursor = await poll("sync-order", cursor)
+        seen.update(upserted)
+        assert seen == set(range(20))
+    run(scenario())